@@ -1,50 +1,154 @@
-"""module to genrate all query problems for clausal entailment"""
+"""module to genrate all query problems for clausal entailment, implicant and term checks
+
+Each formula is parsed once and all its queries are generated in a single process,
+while formulas are spread across a pool of processes.
+Every formula gets a fresh process: the order of the atoms of a formula follows the ids of its nodes,
+which depend on the formulas parsed before it in the same process,
+so a fresh process picks the same literals the single query generator picks for the same seed.
+Clauses are saved in the ce_data tree, cubes in the cube_data tree and terms in the term_data tree,
+with the same folder structure of the data tree.
+"""
+import argparse
 import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
 
+from src.problem_generators.problem_generator_ce_query import generate_queries, VALID_QUERY_KINDS
 
-BASE_PATH = "benchmarks/ldd_randgen/data"
-PYTHON_COMMAND = "python3"
 
-PROBLEM_GEN_PATH = "src/problem_generators/problem_generator_ce_query.py"
+BASE_PATH = "benchmarks/ldd_randgen/data"
 
 NUMBER_OF_VARS = [1, 3, 5]
 PROBLEMS_FOR_EACH = 10
 SEEDS = [12345, 35724, 8546, 37645, 537254, 64738, 5372, 257654, 54, 542]
 
+# the tree where each kind of query is saved, replacing "data" in the path of the formula
+QUERY_TREES = {
+    "clause": "ce_data",
+    "cube": "cube_data",
+    "term": "term_data"
+}
+
+
+def indexed_seeds() -> List[tuple]:
+    """the (index, seed) pairs used for the queries of every formula
+
+    Returns:
+        List[tuple]: the pairs, with indexes starting from 1
+    """
+    return [(i + 1, SEEDS[i] * (i + 1)) for i in range(PROBLEMS_FOR_EACH)]
+
+
+def query_folders(filename: str, kinds: List[str]) -> Dict[str, str]:
+    """the folders where the queries on a formula are saved
+
+    Args:
+        filename (str): the path to the formula
+        kinds (List[str]): the kinds of query to generate
+
+    Returns:
+        Dict[str,str]: the folder for each kind of query
+    """
+    query_folder = filename.replace(".smt2", "")
+    return {kind: query_folder.replace("data", QUERY_TREES[kind]) for kind in kinds}
+
+
+def generate_formula_queries(filename: str, kinds: List[str]) -> int:
+    """generates all the queries on a formula, used as a worker by the process pool
+
+    Args:
+        filename (str): the path to the formula
+        kinds (List[str]): the kinds of query to generate
+
+    Returns:
+        int: the number of generated queries
+    """
+    folders = query_folders(filename, kinds)
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    return generate_queries(filename, folders, NUMBER_OF_VARS, indexed_seeds())
+
+
+def check_formula_queries(filename: str, kinds: List[str]) -> List[str]:
+    """regenerates the queries on a formula in a temporary folder and compares them byte by byte with the saved ones
+
+    Args:
+        filename (str): the path to the formula
+        kinds (List[str]): the kinds of query to check
+
+    Returns:
+        List[str]: the saved query files that are missing or differ from the regenerated ones
+    """
+    saved_folders = query_folders(filename, kinds)
+    mismatches = []
+    with tempfile.TemporaryDirectory() as folder:
+        folders = {kind: os.path.join(folder, kind) for kind in kinds}
+        for kind_folder in folders.values():
+            os.makedirs(kind_folder)
+        # a fresh process, like the workers of the pool
+        with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+            executor.submit(generate_queries, filename, folders, NUMBER_OF_VARS, indexed_seeds()).result()
+        for kind in kinds:
+            for name in sorted(os.listdir(folders[kind])):
+                saved_file = os.path.join(saved_folders[kind], name)
+                with open(os.path.join(folders[kind], name), "rb") as file:
+                    regenerated = file.read()
+                if not os.path.isfile(saved_file):
+                    mismatches.append(saved_file)
+                    continue
+                with open(saved_file, "rb") as file:
+                    if file.read() != regenerated:
+                        mismatches.append(saved_file)
+    return mismatches
+
+
+def parse_input():
+    """Parse the input arguments for the script."""
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--kinds",
+        help="Kinds of query to generate",
+        nargs="+",
+        choices=VALID_QUERY_KINDS,
+        default=VALID_QUERY_KINDS)
+    arg_parser.add_argument(
+        "-j", "--jobs",
+        help="Number of processes used to generate queries (default: number of CPUs)",
+        type=int,
+        default=os.cpu_count())
+    arg_parser.add_argument(
+        "--check",
+        help="Regenerate the queries on the specified formula and compare them byte by byte with the saved ones, instead of generating all queries",
+        type=str)
+    return arg_parser.parse_args()
+
 
 def main():
+    args = parse_input()
+    if args.check is not None:
+        mismatches = check_formula_queries(args.check, args.kinds)
+        for mismatch in mismatches:
+            print("Mismatch:", mismatch)
+        print(len(mismatches), "mismatching queries")
+        sys.exit(1 if len(mismatches) > 0 else 0)
+
     items = []
-    base_path_query = BASE_PATH.replace("data", "ce_data")
-    if not os.path.exists(base_path_query):
-        os.mkdir(base_path_query)
     for pathx, _subdirs, files in os.walk(BASE_PATH):
-        for subdir in _subdirs:
-            item = os.path.join(pathx, subdir)
-            item = item.replace("data", "ce_data")
-            if not os.path.exists(item):
-                os.mkdir(item)
         for name in files:
             items.append(os.path.join(pathx, name))
 
     count = 1
     total = len(items)
-    for filename in items:
-        print(count, "/", total)
-        count += 1
-        query_folder = filename.replace(".smt2", "")
-        query_folder = query_folder.replace("data", "ce_data")
-        if not os.path.exists(query_folder):
-            os.mkdir(query_folder)
-        for variables in NUMBER_OF_VARS:
-            for i in range(PROBLEMS_FOR_EACH):
-                current_index = i+1
-                current_seed = SEEDS[i] * current_index
-                output_path = query_folder + "/ce_query_vars_" + \
-                    str(variables) + "_index_" + str(current_index) + \
-                    "_seed_"+str(current_seed)+".smt2"
-                command = f"{PYTHON_COMMAND} {PROBLEM_GEN_PATH} --source {filename} --size {variables} --seed {current_seed} --output {output_path}"
-                print("Executing command:", command)
-                os.system(command)
+    with ProcessPoolExecutor(max_workers=args.jobs, max_tasks_per_child=1) as executor:
+        futures = {
+            executor.submit(generate_formula_queries, filename, args.kinds): filename
+            for filename in items}
+        for future in as_completed(futures):
+            generated = future.result()
+            print(count, "/", total, futures[future], generated, "queries")
+            count += 1
 
 
 if __name__ == "__main__":
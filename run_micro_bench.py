@@ -0,0 +1,348 @@
+"""
+module for running the micro-benchmark and regression suite on the formulas bundled in the input folder
+
+Every formula in input/*.smt is compiled to T-BDD, T-SDD and (when the dDNNF binaries are configured in .env)
+T-dDNNF through the src.kc builders, then every QueryInterface operation is timed on the compiled structures.
+Each measurement runs some warmup iterations and then a fixed number of repetitions,
+and the median is compared against the baselines stored in benchmarks/micro/baselines.json.
+
+The script exits with a non-zero code if any tracked operation regressed beyond the threshold.
+Run it with --update_baselines on a reference build to record new baselines, then commit the baselines file.
+Operations without a baseline (or all of them, when the baselines file is missing) only raise a warning,
+and their measurements are recorded as their new baselines.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from theorydd.formula import get_atoms
+from theorydd.solvers.lemma_extractor import extract
+
+import src.kc.abstraction_decision_diagrams as add
+import src.kc.theory_decision_diagrams as tdd
+from src.kc.commands import Options, get_args as get_kc_args
+from src.kc.main import get_phi, get_solver
+from src.query.constants import DDNNF_CONDITION_PATH, DECDNNF_PATH
+from src.query.main import load_query_manager
+from src.query.query_interface import QueryInterface
+from src.query.util import create_random_clause, create_random_cube, create_random_term
+
+# the formulas used by the suite
+INPUT_PATTERN = "input/*.smt"
+
+# where the baselines are stored
+BASELINES_FILE = "benchmarks/micro/baselines.json"
+
+# the structures the query operations are measured on
+VALID_STRUCTURES = ["smt", "tbdd", "tsdd", "tddnnf"]
+
+# seed used to generate the query files and the random queries
+QUERY_SEED = 12345
+
+
+def _ddnnf_binaries_configured() -> bool:
+    """checks if the binaries needed to query T-dDNNFs are configured in the .env file"""
+    for binary in [DDNNF_CONDITION_PATH, DECDNNF_PATH]:
+        if binary is None or not os.path.isfile(binary) or not os.access(binary, os.X_OK):
+            return False
+    return True
+
+
+def measure(operation: Callable[[], object], warmup: int, repetitions: int) -> List[float]:
+    """times an operation
+
+    Args:
+        operation (Callable[[], object]): the operation to time
+        warmup (int): the number of untimed runs before measuring
+        repetitions (int): the number of timed runs
+
+    Returns:
+        List[float]: the time in seconds taken by each timed run
+    """
+    with open(os.devnull, "w", encoding='utf8') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(warmup):
+            operation()
+        samples = []
+        for _ in range(repetitions):
+            start_time = time.perf_counter()
+            operation()
+            samples.append(time.perf_counter() - start_time)
+    return samples
+
+
+class MicroBenchmark:
+    """runs the builders and queries on a single input formula and collects the timings"""
+
+    def __init__(self, input_file: str, work_folder: str, warmup: int, repetitions: int):
+        self.input_file = input_file
+        self.name = os.path.basename(input_file).replace(".smt", "")
+        self.work_folder = os.path.join(work_folder, self.name)
+        os.makedirs(self.work_folder)
+        self.warmup = warmup
+        self.repetitions = repetitions
+        self.results: Dict[str, Dict[str, object]] = {}
+        self._run_counter = 0
+
+    def _record(self, operation: str, run: Callable[[], object]) -> None:
+        """measures the operation and stores its results, operations that raise are recorded as skipped"""
+        key = f"{self.name}/{operation}"
+        try:
+            samples = measure(run, self.warmup, self.repetitions)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"SKIPPING {key}: {type(e).__name__}: {e}")
+            self.results[key] = {"skipped": f"{type(e).__name__}: {e}"}
+            return
+        self.results[key] = {
+            "median": statistics.median(samples),
+            "min": min(samples),
+            "samples": samples}
+        print(f"{key}: {statistics.median(samples):.6f}s")
+
+    def _fresh_folder(self, kind: str) -> str:
+        """returns the path to a folder that does not exist yet inside the work folder"""
+        self._run_counter += 1
+        return os.path.join(self.work_folder, f"{kind}_{self._run_counter}")
+
+    def _options(self, *extra: str) -> Options:
+        """builds the knowledge compiler options for the input formula"""
+        return get_kc_args(["-i", self.input_file, *extra])
+
+    def run_builders(self, ddnnf: bool) -> Dict[str, str]:
+        """times all the src.kc builders on the formula
+
+        Args:
+            ddnnf (bool): if True, also time the dDNNF builders
+
+        Returns:
+            Dict[str,str]: the folders where the last compiled structure of each kind was saved
+        """
+        artifacts = {}
+        args = self._options()
+        phi = get_phi(args, {})
+
+        # ALL-SMT IS MEASURED ON ITS OWN, THE THEORY BUILDERS REUSE ITS LEMMAS
+        lemmas_holder = {}
+
+        def all_smt():
+            _sat_result, tlemmas, _mapping = extract(
+                phi, get_solver(args), computation_logger={})
+            lemmas_holder["lemmas"] = tlemmas
+        self._record("kc/all_smt", all_smt)
+        tlemmas = lemmas_holder.get("lemmas")
+
+        def abstraction_builder(builder, *extra):
+            return lambda: builder(phi, self._options(*extra), {})
+        self._record("kc/abstr_bdd", abstraction_builder(add.abstr_bdd, "--abstraction_bdd"))
+        self._record("kc/abstr_sdd", abstraction_builder(add.abstr_sdd, "--abstraction_sdd"))
+        self._record("kc/ldd", abstraction_builder(add.ldd, "--ldd"))
+        self._record("kc/xsdd", abstraction_builder(add.xsdd, "--xsdd"))
+        if ddnnf:
+            self._record("kc/abstr_ddnnf", lambda: add.abstr_ddnnf(
+                phi, self._options("--no_dDNNF_to_pysmt", "--save_dDNNF", self._fresh_folder("abstr_ddnnf")), {}))
+
+        if tlemmas is None:
+            return artifacts
+
+        def theory_builder(builder, kind: str, *extra: str):
+            def run():
+                folder = self._fresh_folder(kind)
+                builder(phi, self._options(*extra, folder), {}, get_solver(args), tlemmas)
+                artifacts[kind] = folder
+            return run
+        self._record("kc/theory_bdd", theory_builder(tdd.theory_bdd, "tbdd", "--save_tbdd"))
+        self._record("kc/theory_sdd", theory_builder(tdd.theory_sdd, "tsdd", "--save_tsdd"))
+        if ddnnf:
+            self._record("kc/theory_ddnnf", theory_builder(
+                tdd.theory_ddnnf, "tddnnf", "--no_dDNNF_to_pysmt", "--save_dDNNF"))
+        return artifacts
+
+    def _write_query_files(self) -> Dict[str, str]:
+        """writes the clause, cube and term files used by the file based queries"""
+        atoms = get_atoms(get_phi(self._options(), {}))
+        files = {
+            "clause": os.path.join(self.work_folder, "clause.smt2"),
+            "cube": os.path.join(self.work_folder, "cube.smt2"),
+            "term": os.path.join(self.work_folder, "term.smt2")}
+        create_random_clause(atoms, files["clause"], seed=QUERY_SEED)
+        create_random_cube(atoms, files["cube"], seed=QUERY_SEED)
+        create_random_term(atoms, files["term"], seed=QUERY_SEED)
+        return files
+
+    def run_queries(self, structure: str, location: str) -> None:
+        """times every QueryInterface operation on the structure stored at location
+
+        Args:
+            structure (str): the kind of structure, used to name the measured operations
+            location (str): the path to the compiled structure (or to the formula for the smt structure)
+        """
+        query_files = self._write_query_files()
+        self._record(f"{structure}/load", lambda: load_query_manager(location))
+        try:
+            manager: QueryInterface = load_query_manager(location)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"SKIPPING {self.name}/{structure}: {type(e).__name__}: {e}")
+            return
+        operations = {
+            "consistency": manager.check_consistency,
+            "validity": manager.check_validity,
+            "entail_clause": lambda: manager.check_entail_clause([query_files["clause"]]),
+            "entail_clause_random": lambda: manager.check_entail_clause_random(QUERY_SEED),
+            "implicant": lambda: manager.check_implicant(query_files["term"]),
+            "implicant_random": lambda: manager.check_implicant_random(QUERY_SEED),
+            "count": manager.count_models,
+            "enumerate": manager.enumerate_models,
+            "condition": lambda: manager.condition(query_files["cube"]),
+            "condition_random": lambda: manager.condition_random(QUERY_SEED)}
+        for operation, run in operations.items():
+            self._record(f"{structure}/{operation}", run)
+
+
+def save_baselines(
+        results: Dict[str, Dict[str, object]],
+        baselines: Dict[str, Dict[str, object]],
+        baselines_file: str) -> Dict[str, Dict[str, object]]:
+    """records the measured results as baselines, on top of the existing ones, and saves them
+
+    Args:
+        results (Dict[str, Dict[str, object]]): the measured results, operations that were skipped are not recorded
+        baselines (Dict[str, Dict[str, object]]): the existing baselines
+        baselines_file (str): the file where the baselines are saved
+
+    Returns:
+        Dict[str, Dict[str, object]]: the saved baselines
+    """
+    baselines = dict(baselines)
+    baselines.update({key: {"median": result["median"], "min": result["min"]}
+                      for key, result in results.items() if "median" in result})
+    if os.path.dirname(baselines_file) != "":
+        os.makedirs(os.path.dirname(baselines_file), exist_ok=True)
+    with open(baselines_file, "w", encoding='utf8') as out:
+        json.dump(baselines, out, indent=2, sort_keys=True)
+    return baselines
+
+
+def compare_with_baselines(
+        results: Dict[str, Dict[str, object]],
+        baselines: Dict[str, Dict[str, object]],
+        threshold: float,
+        min_delta: float) -> List[str]:
+    """compares the measured medians against the baselines
+
+    Args:
+        results (Dict[str, Dict[str, object]]): the measured results
+        baselines (Dict[str, Dict[str, object]]): the stored baselines
+        threshold (float): the relative slowdown above which an operation is considered regressed
+        min_delta (float): the absolute slowdown in seconds below which differences are treated as noise
+
+    Returns:
+        List[str]: a description of every regressed operation, including operations with a baseline that were skipped
+    """
+    regressions = []
+    for key, result in results.items():
+        if "median" not in result:
+            # an operation that used to run and now raises is a regression too
+            if key in baselines and "skipped" in result:
+                regressions.append(f"{key}: failed ({result['skipped']}) but has a baseline")
+            continue
+        if key not in baselines or "median" not in baselines[key]:
+            print(f"NO BASELINE: {key}")
+            continue
+        baseline_median = baselines[key]["median"]
+        median = result["median"]
+        if median > baseline_median * (1 + threshold) and median - baseline_median > min_delta:
+            regressions.append(
+                f"{key}: {median:.6f}s against baseline {baseline_median:.6f}s (+{(median / baseline_median - 1) * 100:.1f}%)")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    """parse arguments with arg parser library"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--inputs", default=INPUT_PATTERN,
+                        help=f"Glob pattern of the formulas to benchmark (default: {INPUT_PATTERN})")
+    parser.add_argument("--structures", nargs="+", default=VALID_STRUCTURES, choices=VALID_STRUCTURES,
+                        help="The structures on which the queries are measured (default: all)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Untimed runs before each measurement (default: 1)")
+    parser.add_argument("--repetitions", type=int, default=5,
+                        help="Timed runs for each measurement (default: 5)")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Relative slowdown of the median that counts as a regression (default: 0.25)")
+    parser.add_argument("--min_delta", type=float, default=0.005,
+                        help="Absolute slowdown in seconds under which differences are ignored (default: 0.005)")
+    parser.add_argument("--baselines", default=BASELINES_FILE,
+                        help=f"The baselines file (default: {BASELINES_FILE})")
+    parser.add_argument("--update_baselines", action="store_true",
+                        help="Store the measured results as the new baselines instead of checking for regressions")
+    parser.add_argument("-o", "--output",
+                        help="Save the measured results in the specified .json file")
+    args = parser.parse_args()
+    if args.repetitions <= 0 or args.warmup < 0:
+        raise ValueError("Repetitions must be positive and warmup must be non-negative!")
+    return args
+
+
+def main() -> None:
+    """main function for running the micro-benchmark suite"""
+    args = parse_args()
+    input_files = sorted(glob.glob(args.inputs))
+    if len(input_files) == 0:
+        raise ValueError(f"No input formula matches {args.inputs}")
+    ddnnf = "tddnnf" in args.structures and _ddnnf_binaries_configured()
+    if "tddnnf" in args.structures and not ddnnf:
+        print("dDNNF binaries are not configured in the .env file: skipping T-dDNNF measurements")
+
+    results: Dict[str, Dict[str, object]] = {}
+    work_folder = tempfile.mkdtemp(prefix="micro_bench_")
+    try:
+        for file_index, input_file in enumerate(input_files):
+            print("Progress: ", file_index + 1, "/", len(input_files))
+            bench = MicroBenchmark(input_file, work_folder, args.warmup, args.repetitions)
+            artifacts = bench.run_builders(ddnnf)
+            if "smt" in args.structures:
+                bench.run_queries("smt", input_file)
+            for structure in ["tbdd", "tsdd", "tddnnf"]:
+                if structure in args.structures and structure in artifacts:
+                    bench.run_queries(structure, artifacts[structure])
+            results.update(bench.results)
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding='utf8') as out:
+            json.dump(results, out, indent=2)
+
+    if args.update_baselines:
+        baselines = save_baselines(results, {}, args.baselines)
+        print(f"Baselines for {len(baselines)} operations saved in {args.baselines}")
+        return
+
+    baselines = {}
+    if os.path.isfile(args.baselines):
+        with open(args.baselines, "r", encoding='utf8') as baselines_file:
+            baselines = json.load(baselines_file)
+    else:
+        print(f"WARNING: no baselines found in {args.baselines}, the measured results are recorded as the baselines")
+    new_keys = [key for key, result in results.items() if "median" in result and key not in baselines]
+    if len(new_keys) > 0:
+        print(f"WARNING: {len(new_keys)} operations have no baseline, recording them in {args.baselines}:")
+        print("\n".join(new_keys))
+        save_baselines({key: results[key] for key in new_keys}, baselines, args.baselines)
+    regressions = compare_with_baselines(results, baselines, args.threshold, args.min_delta)
+    if len(regressions) > 0:
+        print("\n\nREGRESSIONS")
+        print("\n".join(regressions))
+        sys.exit(1)
+    print("No regressions found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""module for the binary encoding of the d-DNNFs saved by the c2d and d4 compilers
+
+The knowledge compiler saves the encoding next to the .nnf file,
+so that query tools can memory-map it instead of parsing the text file.
+The file is made of a header and of little-endian arrays, each aligned to 8 bytes:
+- header: magic, then the number of nodes, edges, variables, quantified variables and levels and the root node
+- kinds (uint8, one per node): TRUE, FALSE, LITERAL, AND or OR
+- payloads (int64, one per node): the literal of LITERAL nodes, the decision variable of OR nodes (0 if unknown)
+- child offsets (int64, one more than the nodes): the children of node i are children[offsets[i]:offsets[i+1]]
+- children (int64, one per edge)
+- level offsets (int64, one more than the levels): the nodes of level l are the nodes in [levels[l], levels[l+1])
+- quantified variables (int64)
+
+Nodes are sorted by level: leaves are on level 0 and gates are one level above their highest child,
+so a whole level can be evaluated at once from the values of the levels below.
+"""
+import json
+import os
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from src.kc.ddnnf_shrink import (
+    C2D_NNF_FILE,
+    D4_NNF_FILE,
+    Circuit,
+    read_c2d_circuit,
+    read_d4_circuit,
+    TRUE_NODE,
+    FALSE_NODE,
+    LITERAL_NODE,
+    AND_NODE,
+    OR_NODE)
+
+BINARY_DDNNF_FILE = "ddnnf.bin"
+
+_MAGIC = b"TDDNNF01"
+_HEADER_FIELDS = 6
+_HEADER_SIZE = len(_MAGIC) + 8 * _HEADER_FIELDS
+
+KIND_TRUE = 0
+KIND_FALSE = 1
+KIND_LITERAL = 2
+KIND_AND = 3
+KIND_OR = 4
+_KIND_CODES = {TRUE_NODE: KIND_TRUE, FALSE_NODE: KIND_FALSE, LITERAL_NODE: KIND_LITERAL, AND_NODE: KIND_AND, OR_NODE: KIND_OR}
+
+
+def _padded(array: np.ndarray) -> bytes:
+    data = array.tobytes()
+    return data + b"\0" * (-len(data) % 8)
+
+
+def write_binary_ddnnf(
+        circuit: Circuit,
+        root: int,
+        n_vars: int,
+        quantified_vars: Iterable[int],
+        output_file: str) -> None:
+    """writes the binary encoding of a circuit
+
+    Args:
+        circuit (Circuit): the circuit
+        root (int): the root of the circuit
+        n_vars (int): the number of variables of the d-DNNF, including the quantified ones
+        quantified_vars (Iterable[int]): the existentially quantified variables
+        output_file (str): the path to the binary file
+    """
+    order = circuit.reachable(root)
+    levels: Dict[int, int] = {}
+    for node_id in order:
+        kind, payload, _decision = circuit.nodes[node_id]
+        if kind in (AND_NODE, OR_NODE):
+            levels[node_id] = 1 + max(levels[child] for child in payload)
+        else:
+            levels[node_id] = 0
+    # stable sort, so that children still come before parents
+    order.sort(key=levels.get)
+    positions = {node_id: position for position, node_id in enumerate(order)}
+
+    kinds = np.empty(len(order), dtype="<u1")
+    payloads = np.zeros(len(order), dtype="<i8")
+    offsets = np.zeros(len(order) + 1, dtype="<i8")
+    children: List[int] = []
+    for position, node_id in enumerate(order):
+        kind, payload, decision = circuit.nodes[node_id]
+        kinds[position] = _KIND_CODES[kind]
+        if kind == LITERAL_NODE:
+            payloads[position] = payload
+        elif kind in (AND_NODE, OR_NODE):
+            payloads[position] = decision
+            children.extend(positions[child] for child in payload)
+        offsets[position + 1] = len(children)
+    n_levels = (max(levels.values()) + 1) if len(levels) > 0 else 0
+    level_offsets = np.searchsorted(
+        np.array([levels[node_id] for node_id in order], dtype="<i8"),
+        np.arange(n_levels + 1), side="left").astype("<i8")
+    quantified = np.array(sorted(quantified_vars), dtype="<i8")
+
+    header = np.array(
+        [len(order), len(children), n_vars, len(quantified), n_levels, positions[root]], dtype="<i8")
+    temporary_file = f"{output_file}.tmp"
+    with open(temporary_file, "wb") as out:
+        out.write(_MAGIC)
+        out.write(header.tobytes())
+        for array in (kinds, payloads, offsets, np.array(children, dtype="<i8"), level_offsets, quantified):
+            out.write(_padded(array))
+    os.replace(temporary_file, output_file)
+
+
+def save_artifact_binary_ddnnf(folder: str, compiler: str) -> str:
+    """reads the .nnf file of the compiled artifact saved in folder and saves its binary encoding in the same folder
+
+    The variables and the quantified variables are the ones the query tool uses:
+    all the variables in mapping/mapping.json, quantified if listed in quantification.exist (c2d)
+    or if missing from mapping/important_labels.json (d4)
+
+    Args:
+        folder (str): the folder where the artifact is saved
+        compiler (str): the compiler that produced the artifact, "c2d" or "d4"
+
+    Returns:
+        str: the path to the binary file
+    """
+    with open(os.path.join(folder, "mapping", "mapping.json"), "r", encoding='utf8') as file:
+        n_vars = len(json.load(file))
+    if compiler == "c2d":
+        nnf_file = os.path.join(folder, C2D_NNF_FILE)
+        with open(os.path.join(folder, "quantification.exist"), "r", encoding='utf8') as file:
+            # the first item is the amount of quantified variables
+            quantified_vars = {int(x) for x in file.readline().split()[1:]}
+    elif compiler == "d4":
+        nnf_file = os.path.join(folder, D4_NNF_FILE)
+        with open(os.path.join(folder, "mapping", "important_labels.json"), "r", encoding='utf8') as file:
+            important_labels = set(json.load(file))
+        quantified_vars = {var for var in range(1, n_vars + 1) if var not in important_labels}
+    else:
+        raise ValueError("Invalid dDNNF compiler")
+
+    with open(nnf_file, "r", encoding='utf8') as file:
+        lines = file.read().splitlines()
+    if compiler == "c2d":
+        circuit, root, _file_vars = read_c2d_circuit(lines)
+    else:
+        circuit, root = read_d4_circuit(lines)
+    output_file = os.path.join(folder, BINARY_DDNNF_FILE)
+    write_binary_ddnnf(circuit, root, n_vars, quantified_vars, output_file)
+    return output_file
+
+
+class BinaryDDNNF:
+    """a d-DNNF memory-mapped from its binary encoding"""
+
+    n_vars: int
+    root: int
+    kinds: np.ndarray
+    payloads: np.ndarray
+    offsets: np.ndarray
+    children: np.ndarray
+    level_offsets: np.ndarray
+    quantified_vars: np.ndarray
+
+    def __init__(self, binary_file: str):
+        """
+        memory-maps the binary encoding
+
+        Args:
+            binary_file (str): the path to the binary file
+        """
+        with open(binary_file, "rb") as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{binary_file} is not a binary d-DNNF")
+            header = np.frombuffer(file.read(8 * _HEADER_FIELDS), dtype="<i8")
+        n_nodes, n_edges, self.n_vars, n_quantified, n_levels, self.root = (int(value) for value in header)
+        position = _HEADER_SIZE
+        arrays = []
+        for dtype, length in (("<u1", n_nodes), ("<i8", n_nodes), ("<i8", n_nodes + 1),
+                              ("<i8", n_edges), ("<i8", n_levels + 1), ("<i8", n_quantified)):
+            if length == 0:
+                arrays.append(np.zeros(0, dtype=dtype))
+                continue
+            arrays.append(np.memmap(binary_file, dtype=dtype, mode="r", offset=position, shape=(length,)))
+            position += length * np.dtype(dtype).itemsize
+            position += -position % 8
+        self.kinds, self.payloads, self.offsets, self.children, self.level_offsets, self.quantified_vars = arrays
+
+    def _leaf_values(self, assumptions: Dict[int, bool], true_value, false_value, free_value, dtype=None) -> np.ndarray:
+        """the values of the nodes on level 0, given the assumed truth values of some variables"""
+        end = int(self.level_offsets[1]) if len(self.level_offsets) > 1 else 0
+        kinds = self.kinds[:end]
+        literals = self.payloads[:end]
+        values = np.full(end, free_value, dtype=dtype if dtype is not None else type(free_value))
+        values[kinds == KIND_TRUE] = true_value
+        values[kinds == KIND_FALSE] = false_value
+        for variable, value in assumptions.items():
+            values[(kinds == KIND_LITERAL) & (literals == variable)] = true_value if value else false_value
+            values[(kinds == KIND_LITERAL) & (literals == -variable)] = false_value if value else true_value
+        return values
+
+    def _evaluate(self, leaves: np.ndarray, conjunction, disjunction) -> object:
+        """evaluates the circuit level by level from the values of the leaves
+
+        The gates of a level are split by kind, and each reduction only runs on the children of the gates of its kind
+
+        Args:
+            leaves (np.ndarray): the values of the nodes on level 0
+            conjunction: function from the values of the children (concatenated) and the segment starts to the values of AND nodes
+            disjunction: function from the values of the children (concatenated) and the segment starts to the values of OR nodes
+
+        Returns:
+            object: the value of the root
+        """
+        # leaves may hold a row of values for each node, to evaluate many valuations at once
+        values = np.empty((len(self.kinds),) + leaves.shape[1:], dtype=leaves.dtype)
+        values[:len(leaves)] = leaves
+        offsets = np.asarray(self.offsets)
+        children = np.asarray(self.children)
+        for level in range(1, len(self.level_offsets) - 1):
+            start, end = int(self.level_offsets[level]), int(self.level_offsets[level + 1])
+            kinds = np.asarray(self.kinds[start:end])
+            for kind, reduction in ((KIND_AND, conjunction), (KIND_OR, disjunction)):
+                rows = np.flatnonzero(kinds == kind)
+                if len(rows) == 0:
+                    continue
+                if len(rows) == end - start:
+                    # the whole level has the same kind, its children are contiguous
+                    first_edge, last_edge = int(offsets[start]), int(offsets[end])
+                    child_values = values[children[first_edge:last_edge]]
+                    values[start:end] = reduction(child_values, offsets[start:end] - first_edge)
+                    continue
+                rows += start
+                edge_starts = offsets[rows]
+                arities = offsets[rows + 1] - edge_starts
+                segments = np.cumsum(arities) - arities
+                edges = np.arange(int(arities.sum())) + np.repeat(edge_starts - segments, arities)
+                values[rows] = reduction(values[children[edges]], segments)
+        return values[self.root]
+
+    def is_consistent(self, assumptions: Dict[int, bool] | None = None) -> bool:
+        """checks if the d-DNNF conditioned on the assumptions is satisfiable
+
+        Args:
+            assumptions (Dict[int,bool]) [None]: the truth value of some variables
+
+        Returns:
+            bool: True if some model of the d-DNNF agrees with the assumptions
+        """
+        leaves = self._leaf_values(assumptions or {}, True, False, True)
+        return bool(self._evaluate(
+            leaves,
+            np.logical_and.reduceat,
+            np.logical_or.reduceat))
+
+    def count_models(self, assumptions: Dict[int, bool] | None = None) -> int:
+        """counts the models of the d-DNNF conditioned on the assumptions,
+        on all the variables and not counting the quantified ones, as counted by decdnnf on the conditioned d-DNNF
+
+        Args:
+            assumptions (Dict[int,bool]) [None]: the truth value of some variables
+
+        Returns:
+            int: the number of models
+        """
+        # each node is valued by the number of assignments to all the variables that satisfy it,
+        # the product of the children of an AND node counts every variable once for each child
+        full = 1 << self.n_vars
+        # the counts are at most 2^n_vars, they fit in 64 bits unless the variables are more than 62
+        dtype = np.int64 if self.n_vars <= 62 else object
+        leaves = self._leaf_values(assumptions or {}, full, 0, full >> 1, dtype=dtype)
+
+        def conjunction(child_values: np.ndarray, segments: np.ndarray) -> np.ndarray:
+            arities = np.diff(np.append(segments, len(child_values)))
+            shifts = self.n_vars * (arities - 1)
+            if child_values.dtype == object or self.n_vars * int(arities.max()) <= 62:
+                return np.multiply.reduceat(child_values, segments) >> shifts
+            # the products overflow 64 bits: exact Python integers for this reduction only,
+            # the shifted products are counts again and fit in 64 bits
+            products = np.multiply.reduceat(child_values.astype(object), segments)
+            return (products >> shifts.astype(object)).astype(np.int64)
+
+        models = self._evaluate(leaves, conjunction, np.add.reduceat)
+        return int(models) >> len(self.quantified_vars)
+
+    def weighted_model_counts(self, positive: np.ndarray, negative: np.ndarray) -> np.ndarray:
+        """computes the weighted model counts of the d-DNNF for a batch of weight vectors in one pass,
+        the quantified variables weigh 1 and are not counted, as in count_models
+
+        The weights of each variable are scaled to sum to 1, so that a node is valued by the probability of its function:
+        AND nodes multiply and OR nodes add the values of their children, without smoothing the d-DNNF.
+        The probability of the root is then scaled back by the product of the sums of the weights.
+
+        Args:
+            positive (np.ndarray): the weights of the positive literals, one row for each variable (row 0 is unused)
+                and one column for each weight vector
+            negative (np.ndarray): the weights of the negative literals, with the same shape
+
+        Returns:
+            np.ndarray: the weighted model count for each weight vector
+        """
+        sums = positive + negative
+        if np.any(sums[1:] == 0):
+            raise ValueError("The weights of the two literals of a variable must not sum to zero")
+        sums[0] = 1
+        positive, negative = positive / sums, negative / sums
+        # quantified variables weigh 1 like in the model count, that is then divided by 2 for each of them
+        sums[np.asarray(self.quantified_vars)] = 1
+
+        end = int(self.level_offsets[1]) if len(self.level_offsets) > 1 else 0
+        kinds = np.asarray(self.kinds[:end])
+        literals = np.asarray(self.payloads[:end])
+        leaves = np.zeros((end, positive.shape[1]))
+        leaves[kinds == KIND_TRUE] = 1.0
+        is_literal = kinds == KIND_LITERAL
+        leaf_literals = literals[is_literal]
+        leaves[is_literal] = np.where(
+            (leaf_literals > 0)[:, None], positive[np.abs(leaf_literals)], negative[np.abs(leaf_literals)])
+        root = self._evaluate(leaves, np.multiply.reduceat, np.add.reduceat)
+        return root * np.prod(sums, axis=0)
+
+
+def load_binary_ddnnf(folder: str) -> BinaryDDNNF | None:
+    """memory-maps the binary d-DNNF saved in folder
+
+    Args:
+        folder (str): the folder of the compiled artifact
+
+    Returns:
+        BinaryDDNNF | None: the d-DNNF, or None if the folder has no binary encoding
+    """
+    binary_file = os.path.join(folder, BINARY_DDNNF_FILE)
+    if not os.path.isfile(binary_file):
+        return None
+    return BinaryDDNNF(binary_file)
+
@@ -0,0 +1,99 @@
+"""module to compute the SHA-256 digests of files
+
+The digests of files that are hashed again and again across sessions (compiled artifacts, d-DNNFs to translate)
+are memoized in a JSON file on the size, modification time and inode of each file,
+so that unchanged files are not read again just to be hashed.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict
+
+
+def file_digest(file_path: str) -> str:
+    """computes the SHA-256 digest of the content of a file
+
+    Args:
+        file_path (str): the path to the file
+
+    Returns:
+        str: the hex digest of the content of the file
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_key(file_path: str) -> str:
+    """the key of the state of a file on which its digest is memoized
+
+    Args:
+        file_path (str): the path to the file
+
+    Returns:
+        str: the size, modification time and inode of the file
+    """
+    stat = os.stat(file_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{stat.st_ino}"
+
+
+def write_json_atomically(data: Dict, file_path: str) -> None:
+    """writes data as JSON to a temporary file and renames it to file_path,
+    so that readers never see a partially written file
+
+    Args:
+        data (Dict): the data to write
+        file_path (str): the path to the JSON file
+    """
+    folder = os.path.dirname(file_path) or "."
+    descriptor, temporary_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding='utf8') as out:
+            json.dump(data, out)
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def memoized_digests(file_paths: Dict[str, str], memo_path: str) -> Dict[str, str]:
+    """computes the SHA-256 digests of files, reusing the digests memoized for files that did not change
+
+    The memo is rewritten with the entries of file_paths only,
+    if it cannot be written (e.g. read-only folder) the digests are computed again by the next call
+
+    Args:
+        file_paths (Dict[str,str]): the path to each file, by the key it is memoized under
+        memo_path (str): the path to the JSON file of the memo
+
+    Returns:
+        Dict[str,str]: the hex digest of each file, by its key
+    """
+    memo = {}
+    if os.path.isfile(memo_path):
+        try:
+            with open(memo_path, "r", encoding='utf8') as file:
+                memo = json.load(file)
+        except (OSError, ValueError):
+            memo = {}
+    if not isinstance(memo, dict):
+        memo = {}
+
+    updated_memo = {}
+    for key, file_path in file_paths.items():
+        current_stat = stat_key(file_path)
+        entry = memo.get(key)
+        if not isinstance(entry, dict) or entry.get("stat") != current_stat or "digest" not in entry:
+            entry = {"stat": current_stat, "digest": file_digest(file_path)}
+        updated_memo[key] = entry
+
+    if updated_memo != memo:
+        try:
+            write_json_atomically(updated_memo, memo_path)
+        except OSError:
+            pass
+    return {key: entry["digest"] for key, entry in updated_memo.items()}
@@ -13,6 +13,11 @@ from theorydd.ddnnf.c2d_compiler import C2DCompiler
 from theorydd.ddnnf.d4_compiler import D4Compiler
 
 from src.kc.commands import Options
+from src.kc.ddnnf_shrink import shrink_saved_ddnnf
+from src.kc.ddnnf_portfolio import compile_portfolio
+from src.kc.dimacs_cache import compile_from_cached_dimacs
+from src.ddnnf_binary import save_artifact_binary_ddnnf
+from src.normalized_mapping import save_artifact_normalized_mapping
 
 kc_logger = logging.getLogger("knowledge_compiler")
 
@@ -28,21 +33,50 @@ def abstr_ddnnf(phi, args: Options, data_logger: Dict):
         compiler = C2DCompiler()
     elif ddnnf_compiler == "d4":
         compiler = D4Compiler()
-    else:
+    elif ddnnf_compiler != "portfolio":
         raise ValueError("Invalid dDNNF compiler")
     try:
-        abs_ddnnf, nodes, edges = compiler.compile_dDNNF(
-            phi,
-            tlemmas=None,
-            save_path=args.save_dDNNF,
-            back_to_fnode=(not args.no_dDNNF_to_pysmt),
-            computation_logger=data_logger["Abstraction dDNNF"],
-            timeout=args.dDNNF_timeout
-        )
+        if args.dDNNF_cache is not None:
+            # the dDNNF is compiled by the binaries, without translating it back to pysmt
+            abs_ddnnf = None
+            nodes, edges = compile_from_cached_dimacs(
+                phi,
+                None,
+                ddnnf_compiler,
+                args.dDNNF_cache,
+                args.save_dDNNF,
+                args.dDNNF_timeout,
+                data_logger["Abstraction dDNNF"])
+        elif ddnnf_compiler == "portfolio":
+            # the portfolio does not translate the dDNNF back to pysmt
+            abs_ddnnf = None
+            ddnnf_compiler, nodes, edges = compile_portfolio(
+                phi,
+                None,
+                args.save_dDNNF,
+                args.dDNNF_timeout,
+                data_logger["Abstraction dDNNF"])
+        else:
+            abs_ddnnf, nodes, edges = compiler.compile_dDNNF(
+                phi,
+                tlemmas=None,
+                save_path=args.save_dDNNF,
+                back_to_fnode=(not args.no_dDNNF_to_pysmt),
+                computation_logger=data_logger["Abstraction dDNNF"],
+                timeout=args.dDNNF_timeout
+            )
     except TimeoutError:
         kc_logger.info("Timeout error in dDNNF computation")
         data_logger["timeout"] = "dDNNF"
         return
+    if args.save_dDNNF is not None:
+        if args.shrink_dDNNF:
+            shrink_saved_ddnnf(args.save_dDNNF, ddnnf_compiler, data_logger["Abstraction dDNNF"])
+        save_artifact_normalized_mapping(args.save_dDNNF)
+        if args.save_dDNNF_binary:
+            binary_start_time = time.time()
+            save_artifact_binary_ddnnf(args.save_dDNNF, ddnnf_compiler)
+            data_logger["Abstraction dDNNF"]["binary encoding time"] = time.time() - binary_start_time
     if args.count_nodes:
         kc_logger.info("T-dDNNF Nodes: %s", str(nodes))
         data_logger["T-dDNNF"]["nodes"] = nodes
@@ -0,0 +1,168 @@
+"""module with the Python API to compile formulas and query them in the same process
+
+T-BDDs and T-SDDs are handed to the query managers in memory, together with their mappings,
+so that compile-then-query pipelines skip serialization and deserialization.
+The query managers of d-DNNFs run external binaries on the compiled files,
+so d-DNNFs are saved in a folder, together with their binary encoding, and queried from there.
+"""
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from pysmt.fnode import FNode
+from theorydd.solvers.lemma_extractor import extract
+from theorydd.solvers.mathsat_total import MathSATTotalEnumerator
+from theorydd.solvers.solver import SMTEnumerator
+from theorydd.tdd.theory_bdd import TheoryBDD
+from theorydd.tdd.theory_sdd import TheorySDD
+from theorydd.ddnnf.c2d_compiler import C2DCompiler
+from theorydd.ddnnf.d4_compiler import D4Compiler
+
+from src.ddnnf_binary import save_artifact_binary_ddnnf
+from src.query.main import load_query_manager
+from src.query.query_interface import QueryInterface
+from src.query.tbdd.manager import TBDDQueryManager
+from src.query.tsdd.manager import TSDDQueryManager
+from src.query.util import normalize_refinement
+
+
+@dataclass
+class CompilationResult:
+    """a compiled formula, with the mapping from the keys of its abstraction to the atoms"""
+
+    # "T-BDD", "T-SDD" or "T-dDNNF"
+    language: str
+    # the TheoryBDD or TheorySDD, None for d-DNNFs
+    structure: TheoryBDD | TheorySDD | None
+    # the normalized atoms of the formula, without the existentially quantified variables, None for d-DNNFs
+    refinement_mapping: Dict[object, FNode] | None
+    # the folder where the d-DNNF is saved, None for T-BDDs and T-SDDs
+    folder: str | None = None
+    details: Dict = field(default_factory=dict)
+
+    def query_manager(self) -> QueryInterface:
+        """builds the query manager for the compiled formula,
+        on the structure in memory for T-BDDs and T-SDDs
+
+        Returns:
+            QueryInterface: the query manager
+        """
+        if self.language == "T-BDD":
+            return TBDDQueryManager.from_tbdd(self.structure, self.refinement_mapping)
+        if self.language == "T-SDD":
+            return TSDDQueryManager.from_tsdd(self.structure, self.refinement_mapping)
+        return load_query_manager(self.folder)
+
+
+def _formula_refinement(structure: TheoryBDD | TheorySDD) -> Dict[object, FNode]:
+    """the normalized refinement mapping of a T-BDD or T-SDD without its existentially quantified variables,
+    built as the query tool builds it from a saved artifact"""
+    qvars = set(structure.qvars)
+    refinement = {key: atom for atom, key in structure.abstraction.items() if key not in qvars}
+    return normalize_refinement(refinement, MathSATTotalEnumerator())
+
+
+def compute_lemmas(phi: FNode, solver: SMTEnumerator | None = None, computation_logger: Dict | None = None) -> List[FNode]:
+    """enumerates the theory lemmas of phi with All-SMT
+
+    Args:
+        phi (FNode): the formula
+        solver (SMTEnumerator) [None]: the solver for the enumeration, by default the total MathSAT enumerator
+        computation_logger (Dict) [None]: where the details of the enumeration are saved
+
+    Returns:
+        List[FNode]: the theory lemmas
+    """
+    if solver is None:
+        solver = MathSATTotalEnumerator()
+    _sat_result, tlemmas, _boolean_mapping = extract(
+        phi, solver, computation_logger=computation_logger if computation_logger is not None else {})
+    return tlemmas
+
+
+def compile_tbdd(
+        phi: FNode,
+        solver: SMTEnumerator | None = None,
+        tlemmas: List[FNode] | None = None) -> CompilationResult:
+    """compiles phi into a T-BDD
+
+    Args:
+        phi (FNode): the formula
+        solver (SMTEnumerator) [None]: the solver for All-SMT, by default the total MathSAT enumerator
+        tlemmas (List[FNode]) [None]: the theory lemmas of phi, enumerated if not provided
+
+    Returns:
+        CompilationResult: the T-BDD
+    """
+    if solver is None:
+        solver = MathSATTotalEnumerator()
+    details = {}
+    tbdd = TheoryBDD(phi, solver=solver, computation_logger=details, tlemmas=tlemmas)
+    return CompilationResult("T-BDD", tbdd, _formula_refinement(tbdd), details=details)
+
+
+def compile_tsdd(
+        phi: FNode,
+        solver: SMTEnumerator | None = None,
+        tlemmas: List[FNode] | None = None,
+        vtree_type: str = "right") -> CompilationResult:
+    """compiles phi into a T-SDD
+
+    Args:
+        phi (FNode): the formula
+        solver (SMTEnumerator) [None]: the solver for All-SMT, by default the total MathSAT enumerator
+        tlemmas (List[FNode]) [None]: the theory lemmas of phi, enumerated if not provided
+        vtree_type (str) ["right"]: the kind of vtree
+
+    Returns:
+        CompilationResult: the T-SDD
+    """
+    if solver is None:
+        solver = MathSATTotalEnumerator()
+    details = {}
+    tsdd = TheorySDD(phi, solver=solver, computation_logger=details, vtree_type=vtree_type, tlemmas=tlemmas)
+    return CompilationResult("T-SDD", tsdd, _formula_refinement(tsdd), details=details)
+
+
+def compile_ddnnf(
+        phi: FNode,
+        compiler: str = "c2d",
+        folder: str | None = None,
+        solver: SMTEnumerator | None = None,
+        tlemmas: List[FNode] | None = None,
+        timeout: int = 3600) -> CompilationResult:
+    """compiles phi into a T-dDNNF saved in folder, with its binary encoding
+
+    Args:
+        phi (FNode): the formula
+        compiler (str) ["c2d"]: the dDNNF compiler, "c2d" or "d4"
+        folder (str) [None]: the folder where the T-dDNNF is saved, a new temporary folder if not provided
+        solver (SMTEnumerator) [None]: the solver for All-SMT, by default the total MathSAT enumerator
+        tlemmas (List[FNode]) [None]: the theory lemmas of phi, enumerated if not provided
+        timeout (int) [3600]: the timeout of the compiler in seconds, 0 for no timeout
+
+    Returns:
+        CompilationResult: the T-dDNNF
+    """
+    if compiler == "c2d":
+        ddnnf_compiler = C2DCompiler()
+    elif compiler == "d4":
+        ddnnf_compiler = D4Compiler()
+    else:
+        raise ValueError("Invalid dDNNF compiler")
+    details = {}
+    if tlemmas is None:
+        tlemmas = compute_lemmas(phi, solver, details)
+    if folder is None:
+        folder = tempfile.mkdtemp()
+    _ddnnf, nodes, edges = ddnnf_compiler.compile_dDNNF(
+        phi,
+        tlemmas,
+        save_path=folder,
+        back_to_fnode=False,
+        computation_logger=details,
+        timeout=timeout)
+    details["nodes"] = nodes
+    details["edges"] = edges
+    save_artifact_binary_ddnnf(folder, compiler)
+    return CompilationResult("T-dDNNF", None, None, folder=folder, details=details)
@@ -1,6 +1,7 @@
 """module to handle the options for the main process"""
 import argparse
 from dataclasses import dataclass
+from typing import List
 
 from src.kc.constants import VALID_VTREE, VALID_LDD_THEORY, VALID_SOLVER, VALID_DDNNF_COMPILER
 
@@ -56,6 +57,12 @@ class Options:
     preload_lemmas: str | None
     dDNNF_quantify_tseitsin: bool
     dDNNF_do_not_quantify: bool
+    shrink_dDNNF: bool
+    save_dDNNF_binary: bool
+    dDNNF_cache: str | None
+    incremental_from: str | None
+    delta: str | None
+    profile: bool
 
     def __init__(self, args: argparse.Namespace):
         self.tsdd = args.tsdd
@@ -107,10 +114,20 @@ class Options:
         self.preload_lemmas = args.preload_lemmas
         self.dDNNF_quantify_tseitsin = args.dDNNF_quantify_tseitsin
         self.dDNNF_do_not_quantify = args.dDNNF_do_not_quantify
+        self.shrink_dDNNF = args.shrink_dDNNF
+        self.save_dDNNF_binary = args.save_dDNNF_binary
+        self.dDNNF_cache = args.dDNNF_cache
+        self.incremental_from = args.incremental_from
+        self.delta = args.delta
+        self.profile = args.profile
 
 
-def get_args() -> Options:
-    """Reads the args from the command line"""
+def get_args(argv: List[str] | None = None) -> Options:
+    """Reads the args from the command line
+
+    Args:
+        argv (List[str] | None) [None]: the arguments to parse. Defaults to None, which reads sys.argv
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--tsdd",
@@ -295,6 +312,18 @@ def get_args() -> Options:
         "--save_abstraction_sdd",
         help="Save the Abstraction-SDD data inside the specified folder",
         type=str)
+    parser.add_argument(
+        "--shrink_dDNNF",
+        help="After compilation, merge identical nodes, propagate constants and collapse single-child gates in the saved dDNNF (requires --save_dDNNF)",
+        action="store_true")
+    parser.add_argument(
+        "--save_dDNNF_binary",
+        help="Also save a binary encoding of the dDNNF that the query tool memory-maps instead of parsing the .nnf file (requires --save_dDNNF)",
+        action="store_true")
+    parser.add_argument(
+        "--dDNNF_cache",
+        help="Cache the Tseitin DIMACS encoding of the input formula in the specified folder and compile dDNNFs from it, appending only the lemma clauses (c2d and d4 only)",
+        type=str)
     parser.add_argument(
         "--dDNNF_timeout",
         help="Specify the timeout (in seconds) for the dDNNF compiler, set to 0 for no timeout",
@@ -324,12 +353,30 @@ def get_args() -> Options:
         "--dDNNF_do_not_quantify",
         help="Avoid quantifying any fresh variables when compiling a dDNNF",
         action="store_true")
+    parser.add_argument(
+        "--incremental_from",
+        help="Update the T-BDD or T-SDD saved in the specified folder with the assertions in --delta instead of compiling the input formula, the lemmas are enumerated only on the delta and the old atoms that share variables with it (use --load_lemmas and --save_lemmas together to keep the lemma set up to date)",
+        type=str)
+    parser.add_argument(
+        "--delta",
+        help="Specify the .smt2 file with the assertions added to the formula of the artifact in --incremental_from",
+        type=str)
+    parser.add_argument(
+        "--profile",
+        help="Profile each phase of the computation and save the profiles and collapsed stacks next to the details file",
+        action="store_true")
     # parser.add_argument(
     #     "--check_eq",
     #     help="Check the T-equivalence of the T-agnostic DD with the T-formula phi",
     #     action="store_true")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     # I have to check this value outside of argparse
     if args.dDNNF_timeout < 0:
         raise ValueError("Timeout must be a non-negative integer!")
+    if (args.incremental_from is None) != (args.delta is None):
+        raise ValueError("Incremental updates need both --incremental_from and --delta")
+    if args.incremental_from is not None and args.save_lemmas is not None and args.load_lemmas is None:
+        raise ValueError("Incremental updates can save the lemma set only if the previous one is given with --load_lemmas")
+    if args.dDNNF_cache is not None and args.dDNNF_compiler == "portfolio":
+        raise ValueError("The DIMACS cache can only be used with the c2d and d4 compilers")
     return Options(args)
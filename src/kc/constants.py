@@ -1,12 +1,18 @@
 """module that defines all constants for the Knowledge Compiler
 
 If you want to extend this tool, please add your constants here"""
+import os
+
 from theorydd.constants import VALID_VTREE, VALID_LDD_THEORY, VALID_SOLVER as _LIBRARY_SOLVERS # pylint: disable=unused-import
 
 # load environment variables
 from dotenv import load_dotenv as _load_env
 _load_env()
 
+# compiler binaries, used when dDNNFs are compiled from the cached DIMACS encoding (--dDNNF_cache)
+C2D_PATH = os.getenv("C2D_PATH", "c2d")
+D4_PATH = os.getenv("D4_PATH", "d4")
+
 # ------------------- OPTIONS -------------------
 
 # VALID SOLVERS
@@ -15,4 +21,4 @@ VALID_SOLVER = _LIBRARY_SOLVERS + []
 
 # VALID DDNNF COMPILERS
 # if you want to add new dDNNF compilers, please add them here
-VALID_DDNNF_COMPILER = ["c2d", "d4"]
+VALID_DDNNF_COMPILER = ["c2d", "d4", "portfolio"]
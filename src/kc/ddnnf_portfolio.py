@@ -0,0 +1,150 @@
+"""module to compile dDNNFs with a portfolio of compilers
+
+Every compiler runs in its own forked process, leader of a new process group,
+so that the compiler binaries it launches can be killed together with it.
+The first compiler that succeeds wins: the processes of the others are killed
+and the dDNNF of the winner is moved to the requested folder.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import time
+from typing import Dict, List, Tuple
+
+from pysmt.fnode import FNode
+from theorydd.ddnnf.c2d_compiler import C2DCompiler
+from theorydd.ddnnf.d4_compiler import D4Compiler
+
+kc_logger = logging.getLogger("knowledge_compiler")
+
+PORTFOLIO_COMPILERS = ["c2d", "d4"]
+
+
+def _compile_worker(
+        compiler_name: str,
+        phi: FNode,
+        tlemmas: List[FNode] | None,
+        save_path: str | None,
+        timeout: int,
+        compile_kwargs: Dict,
+        results: multiprocessing.Queue) -> None:
+    """compiles phi with one compiler and puts the outcome in results"""
+    os.setpgrp()
+    computation_logger = {}
+    start_time = time.time()
+    try:
+        compiler = C2DCompiler() if compiler_name == "c2d" else D4Compiler()
+        _ddnnf, nodes, edges = compiler.compile_dDNNF(
+            phi,
+            tlemmas,
+            save_path=save_path,
+            back_to_fnode=False,
+            computation_logger=computation_logger,
+            timeout=timeout,
+            **compile_kwargs)
+        results.put((compiler_name, "success", time.time() - start_time, computation_logger, nodes, edges))
+    except TimeoutError:
+        results.put((compiler_name, "timeout", time.time() - start_time, computation_logger, None, None))
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        results.put((compiler_name, f"error: {e}", time.time() - start_time, computation_logger, None, None))
+
+
+def _kill_process_group(process: multiprocessing.Process) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # the process may not have become a group leader yet
+        process.kill()
+    process.join()
+
+
+def compile_portfolio(
+        phi: FNode,
+        tlemmas: List[FNode] | None,
+        save_path: str | None,
+        timeout: int,
+        data_logger: Dict,
+        **compile_kwargs) -> Tuple[str, int, int]:
+    """compiles phi with c2d and d4 concurrently and keeps the first dDNNF computed
+
+    Args:
+        phi (FNode): the formula to compile
+        tlemmas (List[FNode] | None): the theory lemmas, None for the abstraction dDNNF
+        save_path (str | None): the folder where the dDNNF of the winner is saved
+        timeout (int): the timeout of each compiler in seconds, 0 for no timeout
+        data_logger (Dict): where the timings of each compiler and the winner are saved
+        **compile_kwargs: other arguments for compile_dDNNF
+
+    Returns:
+        Tuple[str,int,int]: the winning compiler and the nodes and edges of its dDNNF
+
+    Raises:
+        TimeoutError: if every compiler timed out
+        RuntimeError: if no compiler computed the dDNNF
+    """
+    # fork, so that the formula does not need to be serialized
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = {}
+    for compiler_name in PORTFOLIO_COMPILERS:
+        compiler_path = None
+        if save_path is not None:
+            compiler_path = os.path.join(save_path, f".portfolio_{compiler_name}")
+            os.makedirs(compiler_path, exist_ok=True)
+        process = context.Process(
+            target=_compile_worker,
+            args=(compiler_name, phi, tlemmas, compiler_path, timeout, compile_kwargs, results))
+        process.start()
+        processes[compiler_name] = (process, compiler_path)
+    start_time = time.time()
+
+    data_logger["portfolio"] = {}
+    winner = None
+    nodes, edges = 0, 0
+    pending = set(PORTFOLIO_COMPILERS)
+    while len(pending) > 0 and winner is None:
+        try:
+            # a compiler that dies without reporting must not block the portfolio
+            compiler_name, outcome, elapsed, computation_logger, nodes, edges = results.get(timeout=1)
+        except queue.Empty:
+            for name in list(pending):
+                # workers that exit normally have already put their outcome in the queue
+                process = processes[name][0]
+                if not process.is_alive() and process.exitcode != 0:
+                    pending.discard(name)
+                    data_logger["portfolio"][name] = {"result": "crashed", "time": time.time() - start_time}
+            continue
+        pending.discard(compiler_name)
+        data_logger["portfolio"][compiler_name] = {
+            "result": outcome, "time": elapsed, "details": computation_logger}
+        kc_logger.info("Portfolio: %s finished (%s) in %s seconds", compiler_name, outcome, str(elapsed))
+        if outcome == "success":
+            winner = compiler_name
+
+    for name in pending:
+        _kill_process_group(processes[name][0])
+        data_logger["portfolio"][name] = {"result": "killed", "time": time.time() - start_time}
+    for process, _path in processes.values():
+        process.join()
+
+    if winner is not None and save_path is not None:
+        winner_path = processes[winner][1]
+        for entry in os.listdir(winner_path):
+            destination = os.path.join(save_path, entry)
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            shutil.move(os.path.join(winner_path, entry), destination)
+    for _process, compiler_path in processes.values():
+        if compiler_path is not None:
+            shutil.rmtree(compiler_path, ignore_errors=True)
+
+    if winner is None:
+        if all(data_logger["portfolio"][name]["result"] == "timeout" for name in PORTFOLIO_COMPILERS):
+            raise TimeoutError("No compiler in the portfolio computed the dDNNF before the timeout")
+        raise RuntimeError("No compiler in the portfolio computed the dDNNF")
+    data_logger["portfolio"]["winner"] = winner
+    kc_logger.info("Portfolio: %s wins", winner)
+    return winner, nodes, edges
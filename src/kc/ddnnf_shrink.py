@@ -0,0 +1,400 @@
+"""module for the shrinking pass on the d-DNNFs saved by the c2d and d4 compilers
+
+The pass rewrites the .nnf file of a compiled artifact into an equivalent and smaller one:
+- identical nodes are merged (hash-consing, children of AND and OR nodes are compared as sets)
+- TRUE and FALSE children are propagated (AND with a FALSE child is FALSE, OR with a TRUE child is TRUE,
+  TRUE children of AND nodes and FALSE children of OR nodes are removed)
+- AND and OR nodes with a single child are replaced by their child
+- nodes that are not reachable from the root are removed
+
+On a saved artifact, the pass also drops the quantified variables that no node mentions anymore
+(Tseitin variables of simplified gates) and renumbers the remaining variables from 1, in their original order.
+mapping/mapping.json, quantification.exist (c2d) and mapping/important_labels.json (d4) are rewritten to match,
+so that the number of variables used to correct model counts stays consistent with the d-DNNF.
+Dropping a quantified variable that no node mentions does not change the model counts of the query tool,
+which count the models on all the variables and divide them by 2 for each quantified variable.
+The DIMACS input of the compiler is left as it is.
+"""
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Set, Tuple
+
+kc_logger = logging.getLogger("knowledge_compiler")
+
+# the same files the query tool loads
+C2D_NNF_FILE = "dimacs.cnf.nnf"
+D4_NNF_FILE = "compilation_output.nnf"
+
+# node kinds
+TRUE_NODE = "T"
+FALSE_NODE = "F"
+LITERAL_NODE = "L"
+AND_NODE = "A"
+OR_NODE = "O"
+
+# (kind, literal or children, decision variable of OR nodes in c2d format)
+Node = Tuple[str, object, int]
+
+
+class Circuit:
+    """a hash-consed circuit built bottom-up"""
+
+    nodes: List[Node]
+
+    def __init__(self):
+        self.nodes = []
+        self._unique: Dict[Tuple, int] = {}
+        self.true = self._intern((TRUE_NODE, (), 0))
+        self.false = self._intern((FALSE_NODE, (), 0))
+
+    def _intern(self, node: Node) -> int:
+        node_id = self._unique.get(node)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self.nodes.append(node)
+            self._unique[node] = node_id
+        return node_id
+
+    def literal(self, literal: int) -> int:
+        """the node of a literal"""
+        return self._intern((LITERAL_NODE, literal, 0))
+
+    def conjunction(self, children: List[int]) -> int:
+        """the simplified node of the conjunction of children"""
+        if self.false in children:
+            return self.false
+        kept = tuple(sorted({child for child in children if child != self.true}))
+        if len(kept) == 0:
+            return self.true
+        if len(kept) == 1:
+            return kept[0]
+        return self._intern((AND_NODE, kept, 0))
+
+    def disjunction(self, children: List[int], decision: int = 0) -> int:
+        """the simplified node of the disjunction of children"""
+        if self.true in children:
+            return self.true
+        kept = tuple(sorted({child for child in children if child != self.false}))
+        if len(kept) == 0:
+            return self.false
+        if len(kept) == 1:
+            return kept[0]
+        # the decision variable still separates the children only if both are kept
+        if len(kept) != len(children):
+            decision = 0
+        return self._intern((OR_NODE, kept, decision))
+
+    def reachable(self, root: int) -> List[int]:
+        """the nodes reachable from root, children before parents"""
+        order = []
+        visited = set()
+        stack = [(root, False)]
+        while stack:
+            node_id, expanded = stack.pop()
+            if expanded:
+                order.append(node_id)
+                continue
+            if node_id in visited:
+                continue
+            visited.add(node_id)
+            stack.append((node_id, True))
+            kind, payload, _decision = self.nodes[node_id]
+            if kind in (AND_NODE, OR_NODE):
+                stack.extend((child, False) for child in payload if child not in visited)
+        return order
+
+
+def read_c2d_circuit(lines: List[str]) -> Tuple[Circuit, int, int]:
+    """reads a c2d d-DNNF, returns the circuit, its root and the number of variables"""
+    circuit = Circuit()
+    n_vars = 0
+    new_ids: List[int] = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 0:
+            continue
+        kind = fields[0]
+        if kind == "nnf":
+            n_vars = int(fields[3])
+        elif kind == "L":
+            new_ids.append(circuit.literal(int(fields[1])))
+        elif kind == "A":
+            new_ids.append(circuit.conjunction([new_ids[int(child)] for child in fields[2:]]))
+        elif kind == "O":
+            new_ids.append(circuit.disjunction(
+                [new_ids[int(child)] for child in fields[3:]], int(fields[1])))
+    if len(new_ids) == 0:
+        raise ValueError("Empty c2d d-DNNF")
+    # the root is the last node
+    return circuit, new_ids[-1], n_vars
+
+
+def _write_c2d(circuit: Circuit, root: int, n_vars: int) -> List[str]:
+    order = circuit.reachable(root)
+    positions: Dict[int, int] = {}
+    body = []
+    edges = 0
+    for node_id in order:
+        kind, payload, decision = circuit.nodes[node_id]
+        positions[node_id] = len(body)
+        if kind == TRUE_NODE:
+            body.append("A 0")
+        elif kind == FALSE_NODE:
+            body.append("O 0 0")
+        elif kind == LITERAL_NODE:
+            body.append(f"L {payload}")
+        elif kind == AND_NODE:
+            edges += len(payload)
+            body.append(f"A {len(payload)} " + " ".join(str(positions[child]) for child in payload))
+        else:
+            edges += len(payload)
+            body.append(f"O {decision} {len(payload)} " + " ".join(str(positions[child]) for child in payload))
+    return [f"nnf {len(body)} {edges} {n_vars}"] + body
+
+
+def read_d4_circuit(lines: List[str]) -> Tuple[Circuit, int]:
+    """reads a d4 d-DNNF, returns the circuit and its root"""
+    kinds: Dict[int, str] = {}
+    edges: Dict[int, List[Tuple[int, List[int]]]] = {}
+    root = None
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 0 or fields[0] == "c":
+            continue
+        if fields[0] in ("o", "a", "t", "f"):
+            node = int(fields[1])
+            kinds[node] = fields[0]
+            edges.setdefault(node, [])
+            if root is None:
+                root = node
+        else:
+            # parent child literals 0
+            edges.setdefault(int(fields[0]), []).append(
+                (int(fields[1]), [int(literal) for literal in fields[2:-1]]))
+    if root is None:
+        raise ValueError("Empty d4 d-DNNF")
+
+    circuit = Circuit()
+    new_ids: Dict[int, int] = {}
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node in new_ids:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((child, False) for child, _literals in edges[node] if child not in new_ids)
+            continue
+        kind = kinds[node]
+        if kind == "t":
+            new_ids[node] = circuit.true
+            continue
+        if kind == "f":
+            new_ids[node] = circuit.false
+            continue
+        # each edge stands for the conjunction of its literals and its child
+        children = [
+            circuit.conjunction([circuit.literal(literal) for literal in literals] + [new_ids[child]])
+            for child, literals in edges[node]]
+        if kind == "a":
+            new_ids[node] = circuit.conjunction(children)
+        else:
+            new_ids[node] = circuit.disjunction(children)
+    return circuit, new_ids[root]
+
+
+def _write_d4(circuit: Circuit, root: int) -> List[str]:
+    order = circuit.reachable(root)
+    # the root must be the first node, the TRUE node is the target of the edges carrying literals.
+    # Parents put literals on their edges, so only a literal root is declared as a node
+    ids: Dict[int, int] = {root: 1}
+    for node_id in reversed(order):
+        if node_id not in ids and circuit.nodes[node_id][0] != LITERAL_NODE:
+            ids[node_id] = len(ids) + 1
+    true_id = ids.get(circuit.true, len(ids) + 1)
+    uses_true = circuit.true in ids
+    declarations = []
+    edge_lines = []
+    for node_id in sorted(ids, key=ids.get):
+        kind, payload, _decision = circuit.nodes[node_id]
+        d4_id = ids[node_id]
+        if kind == TRUE_NODE:
+            declarations.append(f"t {d4_id} 0")
+        elif kind == FALSE_NODE:
+            declarations.append(f"f {d4_id} 0")
+        elif kind == LITERAL_NODE:
+            declarations.append(f"a {d4_id} 0")
+            edge_lines.append(f"{d4_id} {true_id} {payload} 0")
+            uses_true = True
+        elif kind == AND_NODE:
+            declarations.append(f"a {d4_id} 0")
+            literals = [circuit.nodes[child][1] for child in payload if circuit.nodes[child][0] == LITERAL_NODE]
+            others = [child for child in payload if circuit.nodes[child][0] != LITERAL_NODE]
+            if len(others) == 0:
+                edge_lines.append(f"{d4_id} {true_id} " + " ".join(map(str, literals)) + " 0")
+                uses_true = True
+            else:
+                # the literals are carried by the edge to the first non literal child
+                edge_lines.append(f"{d4_id} {ids[others[0]]} " + " ".join(map(str, literals + [0])))
+                edge_lines.extend(f"{d4_id} {ids[child]} 0" for child in others[1:])
+        else:
+            declarations.append(f"o {d4_id} 0")
+            for child in payload:
+                child_kind, child_payload, _ = circuit.nodes[child]
+                if child_kind == LITERAL_NODE:
+                    edge_lines.append(f"{d4_id} {true_id} {child_payload} 0")
+                    uses_true = True
+                else:
+                    edge_lines.append(f"{d4_id} {ids[child]} 0")
+    if uses_true and circuit.true not in ids:
+        declarations.append(f"t {true_id} 0")
+    return declarations + edge_lines
+
+
+def _used_variables(circuit: Circuit, root: int) -> Set[int]:
+    """the variables of the literals and of the decisions of the nodes reachable from root"""
+    used = set()
+    for node_id in circuit.reachable(root):
+        kind, payload, decision = circuit.nodes[node_id]
+        if kind == LITERAL_NODE:
+            used.add(abs(payload))
+        elif kind == OR_NODE and decision != 0:
+            used.add(decision)
+    return used
+
+
+def _renumbered(circuit: Circuit, root: int, renumbering: Dict[int, int]) -> Tuple[Circuit, int]:
+    """rebuilds the circuit reachable from root with the variables renumbered"""
+    renumbered = Circuit()
+    new_ids: Dict[int, int] = {}
+    for node_id in circuit.reachable(root):
+        kind, payload, decision = circuit.nodes[node_id]
+        if kind == TRUE_NODE:
+            new_ids[node_id] = renumbered.true
+        elif kind == FALSE_NODE:
+            new_ids[node_id] = renumbered.false
+        elif kind == LITERAL_NODE:
+            variable = renumbering[abs(payload)]
+            new_ids[node_id] = renumbered.literal(variable if payload > 0 else -variable)
+        elif kind == AND_NODE:
+            new_ids[node_id] = renumbered.conjunction([new_ids[child] for child in payload])
+        else:
+            new_ids[node_id] = renumbered.disjunction(
+                [new_ids[child] for child in payload], renumbering[decision] if decision != 0 else 0)
+    return renumbered, new_ids[root]
+
+
+def shrink_ddnnf_file(
+        nnf_file: str,
+        compiler: str,
+        n_vars: int | None = None,
+        quantified_vars: Set[int] | None = None) -> Tuple[Dict[str, int], Dict[int, int] | None]:
+    """shrinks the d-DNNF saved in nnf_file, replacing the file with the smaller equivalent d-DNNF
+
+    Args:
+        nnf_file (str): the path to the .nnf file
+        compiler (str): the compiler that produced the file, "c2d" or "d4"
+        n_vars (int | None) [None]: the number of variables, needed to renumber the variables of d4 files
+        quantified_vars (Set[int] | None) [None]: the quantified variables,
+            the ones that no node mentions are dropped and the others renumbered. None to keep the variables as they are
+
+    Returns:
+        Dict[str,int]: the number of lines and bytes of the file before and after the pass
+        Dict[int,int] | None: the new index of each kept variable, None if the variables were not renumbered
+    """
+    with open(nnf_file, "r", encoding='utf8') as file:
+        lines = file.read().splitlines()
+    if compiler == "c2d":
+        circuit, root, file_vars = read_c2d_circuit(lines)
+        if n_vars is None:
+            n_vars = file_vars
+    elif compiler == "d4":
+        circuit, root = read_d4_circuit(lines)
+    else:
+        raise ValueError("Invalid dDNNF compiler")
+
+    renumbering = None
+    if quantified_vars is not None:
+        if n_vars is None:
+            raise ValueError("The number of variables is needed to renumber them")
+        used = _used_variables(circuit, root)
+        kept = sorted(used.union(var for var in range(1, n_vars + 1) if var not in quantified_vars))
+        renumbering = {var: index + 1 for index, var in enumerate(kept)}
+        circuit, root = _renumbered(circuit, root, renumbering)
+        n_vars = len(kept)
+    if compiler == "c2d":
+        new_lines = _write_c2d(circuit, root, n_vars)
+    else:
+        new_lines = _write_d4(circuit, root)
+
+    stats = {"lines before": len(lines), "bytes before": os.path.getsize(nnf_file)}
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(nnf_file)), suffix=".nnf")
+    with os.fdopen(descriptor, "w", encoding='utf8') as out:
+        out.write("\n".join(new_lines) + "\n")
+    os.replace(temporary_path, nnf_file)
+    stats["lines after"] = len(new_lines)
+    stats["bytes after"] = os.path.getsize(nnf_file)
+    return stats, renumbering
+
+
+def _renumber_mapping(mapping, renumbering: Dict[int, int]):
+    """renumbers the variables of a mapping loaded from JSON, keyed by variable or with variables as values"""
+    if isinstance(mapping, dict) and all(str(key).lstrip("-").isdigit() for key in mapping.keys()):
+        return {str(renumbering[int(key)]): value for key, value in mapping.items() if int(key) in renumbering}
+    if isinstance(mapping, dict) and all(isinstance(value, int) for value in mapping.values()):
+        return {key: renumbering[value] for key, value in mapping.items() if value in renumbering}
+    raise ValueError("Unknown format of the mapping of the d-DNNF")
+
+
+def _write_json_atomically(data, output_file: str) -> None:
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)), suffix=".json")
+    with os.fdopen(descriptor, "w", encoding='utf8') as out:
+        json.dump(data, out)
+    os.replace(temporary_path, output_file)
+
+
+def shrink_saved_ddnnf(save_path: str, compiler: str, data_logger: Dict) -> None:
+    """shrinks the d-DNNF of the artifact saved in save_path and logs the size reduction
+
+    Args:
+        save_path (str): the folder where the d-DNNF was saved
+        compiler (str): the compiler that produced the d-DNNF, "c2d" or "d4"
+        data_logger (Dict): where the statistics of the pass are saved
+    """
+    mapping_file = os.path.join(save_path, "mapping", "mapping.json")
+    with open(mapping_file, "r", encoding='utf8') as file:
+        mapping = json.load(file)
+    n_vars = len(mapping)
+    if compiler == "c2d":
+        nnf_file = os.path.join(save_path, C2D_NNF_FILE)
+        quantification_file = os.path.join(save_path, "quantification.exist")
+        with open(quantification_file, "r", encoding='utf8') as file:
+            # the first item is the amount of quantified variables
+            quantified_vars = {int(x) for x in file.readline().split()[1:]}
+    elif compiler == "d4":
+        nnf_file = os.path.join(save_path, D4_NNF_FILE)
+        labels_file = os.path.join(save_path, "mapping", "important_labels.json")
+        with open(labels_file, "r", encoding='utf8') as file:
+            important_labels = json.load(file)
+        quantified_vars = set(range(1, n_vars + 1)).difference(important_labels)
+    else:
+        raise ValueError("Invalid dDNNF compiler")
+
+    stats, renumbering = shrink_ddnnf_file(nnf_file, compiler, n_vars, quantified_vars)
+    stats["variables before"] = n_vars
+    stats["variables after"] = len(renumbering)
+    _write_json_atomically(_renumber_mapping(mapping, renumbering), mapping_file)
+    if compiler == "c2d":
+        quantified = sorted(renumbering[var] for var in quantified_vars if var in renumbering)
+        with open(quantification_file, "w", encoding='utf8') as out:
+            out.write(" ".join(map(str, [len(quantified)] + quantified)))
+    else:
+        _write_json_atomically(sorted(renumbering[var] for var in important_labels if var in renumbering), labels_file)
+    data_logger["dDNNF shrinking"] = stats
+    kc_logger.info(
+        "d-DNNF shrunk from %s to %s lines (%s to %s bytes), %s of %s variables kept",
+        str(stats["lines before"]), str(stats["lines after"]),
+        str(stats["bytes before"]), str(stats["bytes after"]),
+        str(stats["variables after"]), str(stats["variables before"]))
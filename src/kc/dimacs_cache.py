@@ -0,0 +1,309 @@
+"""module to compile dDNNFs from a cached Tseitin DIMACS encoding
+
+The Tseitin encoding of phi and its refinement mapping are saved in the cache folder,
+in a subfolder named after the SHA-256 digest of the serialization of phi.
+Abstraction and theory dDNNFs, and c2d and d4, all start from the same cached encoding:
+the theory dDNNF only appends the clauses of the lemmas, encoding only the new atoms and gates they introduce.
+
+Phi and the lemmas are normalized with the MathSAT converter before they are encoded,
+so that an atom of phi and the same atom in a lemma get the same variable,
+and the cache is keyed on the digest of the normalized phi.
+
+The atoms of phi are the first variables of the encoding, followed by the Tseitin variables and the atoms that only appear in the lemmas.
+Variables are existentially quantified with the same rules of the theorydd compilers:
+the atoms that only appear in the lemmas, and also the Tseitin variables with quantify_tseitsin, nothing with do_not_quantify.
+The compiled dDNNF is saved with the same layout used by the query tool.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from pysmt.fnode import FNode
+from pysmt.shortcuts import Symbol
+from pysmt.typing import BOOL
+from theorydd.formula import get_normalized, load_refinement, save_refinement
+from theorydd.solvers.mathsat_total import MathSATTotalEnumerator
+
+from src.kc.constants import C2D_PATH, D4_PATH
+from src.kc.ddnnf_shrink import C2D_NNF_FILE, D4_NNF_FILE
+
+kc_logger = logging.getLogger("knowledge_compiler")
+
+_CLAUSES_FILE = "clauses.cnf"
+_MAPPING_FILE = "mapping.json"
+_METADATA_FILE = "encoding.json"
+
+
+class TseitinEncoder:
+    """Tseitin encoder of pysmt formulas into clauses over integer variables"""
+
+    variables: Dict[FNode, int]
+    atom_vars: List[int]
+    tseitin_vars: List[int]
+    clauses: List[List[int]]
+
+    def __init__(self):
+        self.variables = {}
+        self.atom_vars = []
+        self.tseitin_vars = []
+        self.clauses = []
+
+    @property
+    def n_vars(self) -> int:
+        """the number of variables of the encoding"""
+        return len(self.atom_vars) + len(self.tseitin_vars)
+
+    def _new_tseitin_var(self) -> int:
+        var = self.n_vars + 1
+        self.tseitin_vars.append(var)
+        return var
+
+    def _atom_var(self, atom: FNode) -> int:
+        var = self.variables.get(atom)
+        if var is None:
+            var = self.n_vars + 1
+            self.variables[atom] = var
+            self.atom_vars.append(var)
+        return var
+
+    def _literal(self, node: FNode, gates: Dict[FNode, int]) -> int:
+        """the literal equivalent to node, adding the definitions of its gates"""
+        if node.is_not():
+            return -self._literal(node.arg(0), gates)
+        if node in gates:
+            return gates[node]
+        if node.is_bool_constant():
+            var = self._new_tseitin_var()
+            self.clauses.append([var] if node.is_true() else [-var])
+        elif node.is_and() or node.is_or():
+            args = [self._literal(arg, gates) for arg in node.args()]
+            var = self._new_tseitin_var()
+            if node.is_and():
+                self.clauses.extend([-var, arg] for arg in args)
+                self.clauses.append([var] + [-arg for arg in args])
+            else:
+                self.clauses.extend([var, -arg] for arg in args)
+                self.clauses.append([-var] + args)
+        elif node.is_implies():
+            left, right = self._literal(node.arg(0), gates), self._literal(node.arg(1), gates)
+            var = self._new_tseitin_var()
+            self.clauses.extend([[-var, -left, right], [var, left], [var, -right]])
+        elif node.is_iff():
+            left, right = self._literal(node.arg(0), gates), self._literal(node.arg(1), gates)
+            var = self._new_tseitin_var()
+            self.clauses.extend([[-var, -left, right], [-var, left, -right], [var, left, right], [var, -left, -right]])
+        elif node.is_ite() and node.get_type().is_bool_type():
+            condition = self._literal(node.arg(0), gates)
+            then_branch, else_branch = self._literal(node.arg(1), gates), self._literal(node.arg(2), gates)
+            var = self._new_tseitin_var()
+            self.clauses.extend([
+                [-var, -condition, then_branch], [-var, condition, else_branch],
+                [var, -condition, -then_branch], [var, condition, -else_branch]])
+        else:
+            var = self._atom_var(node)
+        gates[node] = var
+        return var
+
+    def assert_formula(self, formula: FNode) -> None:
+        """adds the clauses of the encoding of formula,
+        clauses of literals are added as they are"""
+        disjuncts = formula.args() if formula.is_or() else [formula]
+        if all(self._is_literal(disjunct) for disjunct in disjuncts):
+            self.clauses.append([self._literal(disjunct, {}) for disjunct in disjuncts])
+            return
+        if formula.is_and():
+            for arg in formula.args():
+                self.assert_formula(arg)
+            return
+        self.clauses.append([self._literal(formula, {})])
+
+    @staticmethod
+    def _is_literal(node: FNode) -> bool:
+        if node.is_not():
+            node = node.arg(0)
+        return not (node.is_and() or node.is_or() or node.is_implies() or node.is_iff()
+                    or node.is_bool_constant() or (node.is_ite() and node.get_type().is_bool_type()))
+
+    def refinement(self) -> Dict[int, FNode]:
+        """the mapping from every variable to its atom, Tseitin variables are mapped to fresh Boolean symbols"""
+        refinement = {var: atom for atom, var in self.variables.items()}
+        for var in self.tseitin_vars:
+            refinement[var] = Symbol(f"__tseitin_{var}", BOOL)
+        return refinement
+
+    def save(self, folder: str) -> None:
+        """saves the encoding in folder"""
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, _CLAUSES_FILE), "w", encoding='utf8') as out:
+            for clause in self.clauses:
+                out.write(" ".join(map(str, clause)) + " 0\n")
+        save_refinement({var: atom for atom, var in self.variables.items()}, os.path.join(folder, _MAPPING_FILE))
+        with open(os.path.join(folder, _METADATA_FILE), "w", encoding='utf8') as out:
+            json.dump({"atom vars": self.atom_vars, "tseitin vars": self.tseitin_vars}, out)
+
+    @staticmethod
+    def load(folder: str) -> 'TseitinEncoder':
+        """loads an encoding saved in folder"""
+        encoder = TseitinEncoder()
+        with open(os.path.join(folder, _METADATA_FILE), "r", encoding='utf8') as file:
+            metadata = json.load(file)
+        encoder.atom_vars = metadata["atom vars"]
+        encoder.tseitin_vars = metadata["tseitin vars"]
+        encoder.variables = {atom: var for var, atom in load_refinement(os.path.join(folder, _MAPPING_FILE)).items()}
+        with open(os.path.join(folder, _CLAUSES_FILE), "r", encoding='utf8') as file:
+            encoder.clauses = [[int(literal) for literal in line.split()[:-1]] for line in file if line.strip()]
+        return encoder
+
+    def write_dimacs(self, dimacs_file: str) -> None:
+        """writes the encoding in DIMACS format"""
+        with open(dimacs_file, "w", encoding='utf8') as out:
+            out.write(f"p cnf {self.n_vars} {len(self.clauses)}\n")
+            for clause in self.clauses:
+                out.write(" ".join(map(str, clause)) + " 0\n")
+
+
+def formula_digest(phi: FNode) -> str:
+    """the SHA-256 digest of the serialization of phi"""
+    return hashlib.sha256(phi.serialize().encode()).hexdigest()
+
+
+def cached_encoding(phi: FNode, cache_folder: str, data_logger: Dict) -> TseitinEncoder:
+    """returns the Tseitin encoding of phi, from the cache if it was already computed
+
+    Args:
+        phi (FNode): the normalized formula
+        cache_folder (str): the folder of the cache
+        data_logger (Dict): where the translation time and the cache outcome are saved
+
+    Returns:
+        TseitinEncoder: the encoding of phi
+    """
+    start_time = time.time()
+    folder = os.path.join(cache_folder, formula_digest(phi))
+    if os.path.isfile(os.path.join(folder, _METADATA_FILE)):
+        encoder = TseitinEncoder.load(folder)
+        data_logger["DIMACS cache"] = "hit"
+    else:
+        encoder = TseitinEncoder()
+        encoder.assert_formula(phi)
+        # save to a temporary folder and rename, so that a cached encoding is always complete
+        os.makedirs(cache_folder, exist_ok=True)
+        temporary_folder = tempfile.mkdtemp(dir=cache_folder)
+        encoder.save(temporary_folder)
+        try:
+            os.rename(temporary_folder, folder)
+        except OSError:
+            # another compilation cached the same encoding in the meantime
+            shutil.rmtree(temporary_folder, ignore_errors=True)
+        data_logger["DIMACS cache"] = "miss"
+    data_logger["DIMACS translation time"] = time.time() - start_time
+    return encoder
+
+
+def _run_compiler(command: List[str], timeout: int) -> None:
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, timeout=timeout if timeout > 0 else None)
+    except subprocess.TimeoutExpired as e:
+        raise TimeoutError("dDNNF compilation timed out") from e
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"An error occurred while running {command[0]}") from e
+
+
+def compile_from_cached_dimacs(
+        phi: FNode,
+        tlemmas: List[FNode] | None,
+        compiler: str,
+        cache_folder: str,
+        save_path: str | None,
+        timeout: int,
+        data_logger: Dict,
+        quantify_tseitsin: bool = False,
+        do_not_quantify: bool = False) -> Tuple[int, int]:
+    """compiles phi (and the lemmas) into a dDNNF starting from the cached Tseitin encoding of phi
+
+    Args:
+        phi (FNode): the formula
+        tlemmas (List[FNode] | None): the theory lemmas, None for the abstraction dDNNF
+        compiler (str): the compiler, "c2d" or "d4"
+        cache_folder (str): the folder of the DIMACS cache
+        save_path (str | None): the folder where the dDNNF is saved, None to discard it
+        timeout (int): the timeout of the compiler in seconds, 0 for no timeout
+        data_logger (Dict): where the timings are saved
+        quantify_tseitsin (bool) [False]: if True, the Tseitin variables are also existentially quantified
+        do_not_quantify (bool) [False]: if True, no variable is existentially quantified
+
+    Returns:
+        Tuple[int,int]: the nodes and edges of the dDNNF
+    """
+    start_time = time.time()
+    converter = MathSATTotalEnumerator().get_converter()
+    phi = get_normalized(phi, converter)
+    data_logger["DIMACS normalization time"] = time.time() - start_time
+    encoder = cached_encoding(phi, cache_folder, data_logger)
+    phi_atom_count = len(encoder.atom_vars)
+    if tlemmas is not None and len(tlemmas) > 0:
+        start_time = time.time()
+        for lemma in tlemmas:
+            encoder.assert_formula(get_normalized(lemma, converter))
+        data_logger["lemmas DIMACS translation time"] = time.time() - start_time
+
+    output_folder = save_path if save_path is not None else tempfile.mkdtemp()
+    os.makedirs(os.path.join(output_folder, "mapping"), exist_ok=True)
+    dimacs_file = os.path.join(output_folder, "dimacs.cnf")
+    encoder.write_dimacs(dimacs_file)
+    save_refinement(encoder.refinement(), os.path.join(output_folder, "mapping", "mapping.json"))
+    if do_not_quantify:
+        quantified = []
+    else:
+        # the atoms that only appear in the lemmas are projected away
+        quantified = encoder.atom_vars[phi_atom_count:]
+        if quantify_tseitsin:
+            quantified = sorted(quantified + encoder.tseitin_vars)
+
+    start_time = time.time()
+    if compiler == "c2d":
+        quantification_file = os.path.join(output_folder, "quantification.exist")
+        with open(quantification_file, "w", encoding='utf8') as out:
+            out.write(" ".join(map(str, [len(quantified)] + quantified)))
+        # c2d saves the dDNNF as dimacs.cnf.nnf
+        _run_compiler([C2D_PATH, "-in", dimacs_file, "-exist", quantification_file], timeout)
+        nnf_file = os.path.join(output_folder, C2D_NNF_FILE)
+    elif compiler == "d4":
+        quantified_vars = set(quantified)
+        important_labels = [var for var in range(1, encoder.n_vars + 1) if var not in quantified_vars]
+        with open(os.path.join(output_folder, "mapping", "important_labels.json"), "w", encoding='utf8') as out:
+            json.dump(important_labels, out)
+        projection_file = os.path.join(output_folder, "projection.vars")
+        with open(projection_file, "w", encoding='utf8') as out:
+            out.write(" ".join(map(str, important_labels)) + " 0\n")
+        nnf_file = os.path.join(output_folder, D4_NNF_FILE)
+        _run_compiler([D4_PATH, dimacs_file, "-dDNNF", f"-fpv={projection_file}", f"-out={nnf_file}"], timeout)
+    else:
+        raise ValueError("Invalid dDNNF compiler")
+    data_logger["dDNNF compilation time"] = time.time() - start_time
+
+    nodes, edges = _count_nodes_and_edges(nnf_file, compiler)
+    if save_path is None:
+        shutil.rmtree(output_folder, ignore_errors=True)
+    return nodes, edges
+
+
+def _count_nodes_and_edges(nnf_file: str, compiler: str) -> Tuple[int, int]:
+    with open(nnf_file, "r", encoding='utf8') as file:
+        if compiler == "c2d":
+            # the header is nnf NODES EDGES VARIABLES
+            fields = file.readline().split()
+            return int(fields[1]), int(fields[2])
+        nodes, edges = 0, 0
+        for line in file:
+            if line[:1] in ("o", "a", "t", "f"):
+                nodes += 1
+            elif line[:1].isdigit():
+                edges += 1
+        return nodes, edges
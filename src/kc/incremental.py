@@ -0,0 +1,106 @@
+"""module to update a saved T-BDD or T-SDD when the input formula gains new assertions
+
+The update does not recompute the lemmas of the whole formula:
+- the atoms of the delta formula that are not in the saved artifact are the new atoms
+- the context atoms are the old atoms that share a theory variable with a new atom
+- All-SMT enumerates the lemmas of the delta formula together with the context atoms
+- the delta formula and its new lemmas are compiled on their own and conjoined onto the saved diagram
+
+Sets of literals made of old atoms only are already ruled out by the lemmas of the saved artifact.
+The enumeration stays local to the delta: lemmas that reach old atoms only through other old atoms
+are not enumerated, recompile the whole formula when the delta links distant parts of it.
+"""
+import logging
+import os
+import tempfile
+import time
+from typing import Dict
+
+import theorydd.formula as formula
+from theorydd.formula import load_abstraction_function, get_atoms
+from theorydd.solvers.solver import SMTEnumerator
+from theorydd.tdd.theory_bdd import TheoryBDD
+from theorydd.tdd.theory_sdd import TheorySDD
+
+from src.kc.commands import Options
+from src.normalized_mapping import save_artifact_normalized_mapping
+from src.query.main import load_query_manager
+from src.query.util import is_tbdd_loading_folder_correct, is_tsdd_loading_folder_correct
+from src.theory_lemmas import affected_atoms, lemmas_in_context, save_artifact_lemmas
+
+kc_logger = logging.getLogger("knowledge_compiler")
+
+
+def incremental_update(args: Options, data_logger: Dict, solver: SMTEnumerator) -> None:
+    """conjoins the delta formula and its new lemmas onto the T-BDD or T-SDD saved in args.incremental_from,
+    the updated artifact is saved in --save_tbdd or --save_tsdd, or replaces the previous one
+
+    Args:
+        args (Options): the options of the knowledge compiler
+        data_logger (Dict): where the details of the update are saved
+        solver (SMTEnumerator): the solver for the All-SMT on the delta
+    """
+    start_time = time.time()
+    source_folder = args.incremental_from
+    if is_tbdd_loading_folder_correct(source_folder):
+        language = "T-BDD"
+        output_folder = args.save_tbdd
+    elif is_tsdd_loading_folder_correct(source_folder):
+        language = "T-SDD"
+        output_folder = args.save_tsdd
+    else:
+        raise ValueError("The previous artifact must be a saved T-BDD or T-SDD")
+    if output_folder is None:
+        output_folder = source_folder
+    data_logger["incremental update"] = {"language": language}
+    logger = data_logger["incremental update"]
+
+    delta = formula.read_phi(args.delta)
+    old_atoms = list(load_abstraction_function(os.path.join(source_folder, "abstraction.json")).keys())
+    new_atoms, context_atoms = affected_atoms(old_atoms, list(get_atoms(delta)))
+    logger["new atoms"] = len(new_atoms)
+    logger["context atoms"] = len(context_atoms)
+    logger["atom analysis time"] = time.time() - start_time
+    kc_logger.info("Delta has %s new atoms, sharing variables with %s old atoms", str(len(new_atoms)), str(len(context_atoms)))
+
+    # ALL-SMT ON THE DELTA WITH THE CONTEXT ATOMS
+    lemmas_start_time = time.time()
+    logger["All-SMT"] = {}
+    if any(not atom.is_symbol() for atom in new_atoms):
+        tlemmas = lemmas_in_context(delta, context_atoms, solver, logger["All-SMT"])
+    else:
+        # the models of the saved diagram are already T-consistent on all the atoms of the delta
+        tlemmas = []
+    logger["new lemmas"] = len(tlemmas)
+    logger["All-SMT time"] = time.time() - lemmas_start_time
+    kc_logger.info("All-SMT found %s new theory lemmas", str(len(tlemmas)))
+
+    if args.save_lemmas is not None:
+        # the lemma set of the updated artifact also keeps the lemmas of the previous one
+        formula.save_phi(formula.big_and([formula.read_phi(args.load_lemmas)] + tlemmas), args.save_lemmas)
+
+    # COMPILE THE DELTA AND CONJOIN IT ONTO THE SAVED DIAGRAM
+    compilation_start_time = time.time()
+    logger["delta compilation"] = {}
+    # an empty list would make the diagram enumerate the lemmas of the delta again
+    delta_lemmas = tlemmas if len(tlemmas) > 0 else [formula.top()]
+    with tempfile.TemporaryDirectory() as delta_folder:
+        if language == "T-BDD":
+            delta_diagram = TheoryBDD(delta, solver=solver, computation_logger=logger["delta compilation"], tlemmas=delta_lemmas)
+        else:
+            delta_diagram = TheorySDD(delta, solver=solver, computation_logger=logger["delta compilation"],
+                                      vtree_type=args.tvtree, tlemmas=delta_lemmas)
+        delta_diagram.save_to_folder(delta_folder)
+        save_artifact_lemmas(delta_folder, tlemmas)
+        del delta_diagram
+        logger["delta compilation time"] = time.time() - compilation_start_time
+
+        query_manager = load_query_manager(source_folder)
+        # the lemmas around the new atoms are the ones the conjunction needs, no need to enumerate them again
+        query_manager.conjunction(delta_folder, output_folder, tlemmas=tlemmas)
+    logger["conjunction"] = query_manager.get_details()
+    save_artifact_normalized_mapping(output_folder)
+
+    elapsed_time = time.time() - start_time
+    logger["total update time"] = elapsed_time
+    kc_logger.info("%s updated in %s seconds and saved inside %s", language, str(elapsed_time), output_folder)
@@ -22,7 +22,9 @@ from theorydd.constants import SAT, UNSAT
 
 import src.kc.abstraction_decision_diagrams as add
 import src.kc.theory_decision_diagrams as tdd
+from src.kc.incremental import incremental_update
 from src.kc.commands import Options, get_args
+from src.profiling import NO_PROFILER, PhaseProfiler, profile_folder_from_details
 
 kc_logger = logging.getLogger("knowledge_compiler")
 
@@ -65,23 +67,28 @@ def get_phi(args: Options, data_logger: Dict) -> FNode:
     return phi
 
 
-def do_pure_abstraction(phi: FNode, args: Options, data_logger: Dict) -> None:
+def do_pure_abstraction(phi: FNode, args: Options, data_logger: Dict, profiler: PhaseProfiler = NO_PROFILER) -> None:
     """DO ALL FUNCTIONS THAT DO NOT REQUIRE All-SMT to be computed"""
     # ABSTRACTION dDNNF
     if args.abstraction_dDNNF:
-        add.abstr_ddnnf(phi, args, data_logger)
+        with profiler.phase("abstr_ddnnf"):
+            add.abstr_ddnnf(phi, args, data_logger)
     # ABSTRACTION BDD
     if args.abstraction_bdd:
-        add.abstr_bdd(phi, args, data_logger)
+        with profiler.phase("abstr_bdd"):
+            add.abstr_bdd(phi, args, data_logger)
     # ABSTRACTION SDD
     if args.abstraction_sdd:
-        add.abstr_sdd(phi, args, data_logger)
+        with profiler.phase("abstr_sdd"):
+            add.abstr_sdd(phi, args, data_logger)
     # LDD
     if args.ldd:
-        add.ldd(phi, args, data_logger)
+        with profiler.phase("ldd"):
+            add.ldd(phi, args, data_logger)
     # XSDD
     if args.xsdd:
-        add.xsdd(phi, args, data_logger)
+        with profiler.phase("xsdd"):
+            add.xsdd(phi, args, data_logger)
 
 
 def dump_details(data_logger: Dict, args: Options) -> None:
@@ -122,7 +129,7 @@ def is_smt_phase_necessary(args: Options):
     return args.save_lemmas or args.tsdd or args.tbdd or args.print_lemmas or args.print_models or args.tdDNNF
 
 
-def smt_phase(phi: FNode, args: Options, data_logger: Dict):
+def smt_phase(phi: FNode, args: Options, data_logger: Dict, profiler: PhaseProfiler = NO_PROFILER):
     """SMT phase"""
     smt_solver = get_solver(args)
 
@@ -130,12 +137,13 @@ def smt_phase(phi: FNode, args: Options, data_logger: Dict):
     sat_result = None
     if args.load_lemmas is None:
         # COMPUTE LEMMAS IF NECESSARY
-        sat_result, tlemmas, boolean_mapping = extract(
-            phi,
-            smt_solver,
-            enumerate_true=args.enumerate_true,
-            use_boolean_mapping=(not args.no_boolean_mapping),
-            computation_logger=data_logger)
+        with profiler.phase("all_smt"):
+            sat_result, tlemmas, boolean_mapping = extract(
+                phi,
+                smt_solver,
+                enumerate_true=args.enumerate_true,
+                use_boolean_mapping=(not args.no_boolean_mapping),
+                computation_logger=data_logger)
 
         if args.count_models:
             models_total = len(smt_solver.get_models())
@@ -179,15 +187,18 @@ def smt_phase(phi: FNode, args: Options, data_logger: Dict):
 
     # T-dDNNF
     if args.tdDNNF:
-        tdd.theory_ddnnf(phi, args, data_logger, smt_solver, tlemmas, sat_result)
+        with profiler.phase("theory_ddnnf"):
+            tdd.theory_ddnnf(phi, args, data_logger, smt_solver, tlemmas, sat_result)
 
     # T-BDD
     if args.tbdd:
-        tdd.theory_bdd(phi, args, data_logger, smt_solver, tlemmas, sat_result)
+        with profiler.phase("theory_bdd"):
+            tdd.theory_bdd(phi, args, data_logger, smt_solver, tlemmas, sat_result)
 
     # T-SDD
     if args.tsdd:
-        tdd.theory_sdd(phi, args, data_logger, smt_solver, tlemmas, sat_result)
+        with profiler.phase("theory_sdd"):
+            tdd.theory_sdd(phi, args, data_logger, smt_solver, tlemmas, sat_result)
 
 def _set_logging_handlers(args: Options) -> None:
     """set logging handlers"""
@@ -218,19 +229,34 @@ def main() -> None:
     else:
         data_logger = {}
 
-    # LOAD FORMULA
-    phi = get_phi(args, data_logger)
+    profiler = NO_PROFILER
+    if args.profile:
+        profiler = PhaseProfiler(profile_folder_from_details(args.details_file, "kc_profile"))
+        kc_logger.info("Saving profiles inside %s", profiler.output_folder)
 
-    # ONLY NEEDS ABSTRACTION
-    do_pure_abstraction(phi, args, data_logger)
+    if args.incremental_from is not None:
+        # UPDATE A SAVED DIAGRAM WITH THE DELTA
+        with profiler.phase("incremental_update"):
+            incremental_update(args, data_logger, get_solver(args))
+    else:
+        # LOAD FORMULA
+        with profiler.phase("get_phi"):
+            phi = get_phi(args, data_logger)
+
+        # ONLY NEEDS ABSTRACTION
+        with profiler.phase("do_pure_abstraction"):
+            do_pure_abstraction(phi, args, data_logger, profiler)
 
-    # SMT PHASE (ONLY DONE IF NECESSARY)
-    if is_smt_phase_necessary(args):
-        smt_phase(phi, args, data_logger)
+        # SMT PHASE (ONLY DONE IF NECESSARY)
+        if is_smt_phase_necessary(args):
+            with profiler.phase("smt_phase"):
+                smt_phase(phi, args, data_logger, profiler)
 
     global_elapsed_time = time.time() - global_start_time
     kc_logger.info("All done in %s seconds", str(global_elapsed_time))
     data_logger['total computation time'] = global_elapsed_time
+    if profiler.enabled:
+        data_logger["profiling"] = profiler.details
     if args.details_file is not None:
         dump_details(data_logger, args)
 
@@ -12,6 +12,12 @@ from theorydd.ddnnf.c2d_compiler import C2DCompiler
 from theorydd.ddnnf.d4_compiler import D4Compiler
 
 from src.kc.commands import Options
+from src.kc.ddnnf_shrink import shrink_saved_ddnnf
+from src.kc.ddnnf_portfolio import compile_portfolio
+from src.kc.dimacs_cache import compile_from_cached_dimacs
+from src.ddnnf_binary import save_artifact_binary_ddnnf
+from src.normalized_mapping import save_artifact_normalized_mapping
+from src.theory_lemmas import save_artifact_lemmas
 
 kc_logger = logging.getLogger("knowledge_compiler")
 
@@ -32,24 +38,58 @@ def theory_ddnnf(phi,
         compiler = C2DCompiler()
     elif ddnnf_compiler == "d4":
         compiler = D4Compiler()
-    else:
+    elif ddnnf_compiler != "portfolio":
         raise ValueError("Invalid dDNNF compiler")
     try:
-        tddnnf, nodes, edges = compiler.compile_dDNNF(
-            phi,
-            tlemmas,
-            save_path=args.save_dDNNF,
-            back_to_fnode=(not args.no_dDNNF_to_pysmt),
-            sat_result=sat_result,
-            quantify_tseitsin=args.dDNNF_quantify_tseitsin,
-            do_not_quantify=args.dDNNF_do_not_quantify,
-            computation_logger=data_logger["T-dDNNF"],
-            timeout=args.dDNNF_timeout
-        )
+        if args.dDNNF_cache is not None:
+            # the dDNNF is compiled by the binaries, without translating it back to pysmt
+            tddnnf = None
+            nodes, edges = compile_from_cached_dimacs(
+                phi,
+                tlemmas,
+                ddnnf_compiler,
+                args.dDNNF_cache,
+                args.save_dDNNF,
+                args.dDNNF_timeout,
+                data_logger["T-dDNNF"],
+                quantify_tseitsin=args.dDNNF_quantify_tseitsin,
+                do_not_quantify=args.dDNNF_do_not_quantify)
+        elif ddnnf_compiler == "portfolio":
+            # the portfolio does not translate the dDNNF back to pysmt
+            tddnnf = None
+            ddnnf_compiler, nodes, edges = compile_portfolio(
+                phi,
+                tlemmas,
+                args.save_dDNNF,
+                args.dDNNF_timeout,
+                data_logger["T-dDNNF"],
+                sat_result=sat_result,
+                quantify_tseitsin=args.dDNNF_quantify_tseitsin,
+                do_not_quantify=args.dDNNF_do_not_quantify)
+        else:
+            tddnnf, nodes, edges = compiler.compile_dDNNF(
+                phi,
+                tlemmas,
+                save_path=args.save_dDNNF,
+                back_to_fnode=(not args.no_dDNNF_to_pysmt),
+                sat_result=sat_result,
+                quantify_tseitsin=args.dDNNF_quantify_tseitsin,
+                do_not_quantify=args.dDNNF_do_not_quantify,
+                computation_logger=data_logger["T-dDNNF"],
+                timeout=args.dDNNF_timeout
+            )
     except TimeoutError:
         kc_logger.info("Timeout error in dDNNF computation")
         data_logger["timeout"] = "dDNNF"
         return
+    if args.save_dDNNF is not None:
+        if args.shrink_dDNNF:
+            shrink_saved_ddnnf(args.save_dDNNF, ddnnf_compiler, data_logger["T-dDNNF"])
+        save_artifact_normalized_mapping(args.save_dDNNF)
+        if args.save_dDNNF_binary:
+            binary_start_time = time.time()
+            save_artifact_binary_ddnnf(args.save_dDNNF, ddnnf_compiler)
+            data_logger["T-dDNNF"]["binary encoding time"] = time.time() - binary_start_time
     if args.count_nodes:
         kc_logger.info("T-dDNNF Nodes: %s", str(nodes))
         data_logger["T-dDNNF"]["nodes"] = nodes
@@ -90,6 +130,9 @@ def theory_bdd(phi,
         start_time = time.time()
         kc_logger.info("Serializing T-BDD inside %s", args.save_tbdd)
         tbdd.save_to_folder(args.save_tbdd)
+        save_artifact_normalized_mapping(args.save_tbdd)
+        if tlemmas is not None:
+            save_artifact_lemmas(args.save_tbdd, tlemmas)
         elapsed_time = time.time() - start_time
         data_logger["T-BDD"]["serialization time"] = elapsed_time
         kc_logger.info(
@@ -141,6 +184,9 @@ def theory_sdd(phi,
         start_time = time.time()
         kc_logger.info("Serializing T-SDD inside %s", args.save_tsdd)
         tsdd.save_to_folder(args.save_tsdd)
+        save_artifact_normalized_mapping(args.save_tsdd)
+        if tlemmas is not None:
+            save_artifact_lemmas(args.save_tsdd, tlemmas)
         elapsed_time = time.time() - start_time
         data_logger["T-SDD"]["serialization time"] = elapsed_time
         kc_logger.info(
@@ -0,0 +1,108 @@
+"""module to persist the normalized refinement mapping of a compiled artifact
+
+Query managers normalize every atom of the refinement mapping through the MathSAT converter,
+which dominates startup on artifacts with many atoms.
+The knowledge compiler saves the normalized mapping next to the artifact, in normalized_mapping.json:
+the format version, the fingerprint of the normalizer and, for each key, the SMT-LIB script of its normalized atom
+(the declarations of its variables and an assertion of the atom), so that every atom is read back on its own.
+
+Managers load it directly and normalize again only if it is missing or was produced by a different normalizer.
+"""
+import json
+import os
+from importlib.metadata import version, PackageNotFoundError
+from io import StringIO
+from typing import Dict
+
+import mathsat
+from pysmt.fnode import FNode
+from pysmt.smtlib.parser import SmtLibParser
+from pysmt.smtlib.script import smtlibscript_from_formula
+from theorydd.formula import get_normalized, load_refinement, load_abstraction_function
+from theorydd.solvers.mathsat_total import MathSATTotalEnumerator
+
+NORMALIZED_MAPPING_FILE = "normalized_mapping.json"
+NORMALIZED_MAPPING_VERSION = 2
+
+
+def normalizer_fingerprint() -> str:
+    """the fingerprint of the normalizer, atoms normalized with a different fingerprint may differ
+
+    Returns:
+        str: the MathSAT and theorydd versions
+    """
+    try:
+        theorydd_version = version("theorydd")
+    except PackageNotFoundError:
+        theorydd_version = "unknown"
+    return f"mathsat {mathsat.msat_get_version()}; theorydd {theorydd_version}"
+
+
+def _atom_to_smtlib(atom: FNode) -> str:
+    """the SMT-LIB script that declares the variables of the atom and asserts it"""
+    buffer = StringIO()
+    smtlibscript_from_formula(atom).serialize(buffer, daggify=False)
+    return buffer.getvalue()
+
+
+def _atom_from_smtlib(script: str) -> FNode:
+    """the atom asserted by an SMT-LIB script written by _atom_to_smtlib"""
+    return SmtLibParser().get_script(StringIO(script)).get_last_formula()
+
+
+def save_normalized_mapping(folder: str, refinement: Dict[object, FNode]) -> None:
+    """normalizes the refinement mapping of an artifact and saves it in the artifact folder
+
+    Args:
+        folder (str): the folder where the artifact is saved
+        refinement (Dict[object,FNode]): the mapping from the keys of the artifact (indexes or aliases) to the atoms
+    """
+    converter = MathSATTotalEnumerator().get_converter()
+    atoms = [[key, _atom_to_smtlib(get_normalized(atom, converter))] for key, atom in refinement.items()]
+    with open(os.path.join(folder, NORMALIZED_MAPPING_FILE), "w", encoding='utf8') as out:
+        json.dump({
+            "version": NORMALIZED_MAPPING_VERSION,
+            "fingerprint": normalizer_fingerprint(),
+            "atoms": atoms}, out)
+
+
+def save_artifact_normalized_mapping(folder: str) -> None:
+    """saves the normalized refinement mapping of the artifact saved in folder,
+    reading the mapping from mapping/mapping.json (T-dDNNF) or from abstraction.json (T-BDD and T-SDD)
+
+    Args:
+        folder (str): the folder where the artifact is saved
+    """
+    if os.path.isfile(os.path.join(folder, "mapping", "mapping.json")):
+        refinement = load_refinement(os.path.join(folder, "mapping", "mapping.json"))
+    elif os.path.isfile(os.path.join(folder, "abstraction.json")):
+        abstraction = load_abstraction_function(os.path.join(folder, "abstraction.json"))
+        refinement = {v: k for k, v in abstraction.items()}
+    else:
+        raise ValueError(f"No refinement mapping found in {folder}")
+    save_normalized_mapping(folder, refinement)
+
+
+def load_normalized_mapping(folder: str, refinement: Dict[object, FNode]) -> Dict[object, FNode] | None:
+    """loads the normalized refinement mapping saved in the artifact folder
+
+    Args:
+        folder (str): the folder where the artifact is saved
+        refinement (Dict[object,FNode]): the refinement mapping to normalize, only its keys are used
+
+    Returns:
+        Dict[object,FNode] | None: the normalized mapping restricted to the keys of refinement,
+            or None if it was not saved, was saved by a different normalizer or does not cover all the keys
+    """
+    mapping_file = os.path.join(folder, NORMALIZED_MAPPING_FILE)
+    if not os.path.isfile(mapping_file):
+        return None
+    with open(mapping_file, "r", encoding='utf8') as file:
+        saved = json.load(file)
+    if saved.get("version") != NORMALIZED_MAPPING_VERSION or saved.get("fingerprint") != normalizer_fingerprint():
+        return None
+    # only the atoms of the requested keys are parsed
+    scripts = dict(saved["atoms"])
+    if not all(key in scripts for key in refinement.keys()):
+        return None
+    return {key: _atom_from_smtlib(scripts[key]) for key in refinement.keys()}
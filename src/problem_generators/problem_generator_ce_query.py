@@ -2,11 +2,111 @@
 import random
 import argparse
 import os
-from pysmt.shortcuts import Not, Or
+from typing import Iterable, List, Tuple
+from pysmt.fnode import FNode
+from pysmt.shortcuts import Not, Or, And
 from theorydd.formula import get_atoms as _get_atoms
 from theorydd.formula import read_phi as _read_phi
 from theorydd.formula import save_phi as _save_phi
 
+# the kinds of query that can be generated
+VALID_QUERY_KINDS = ["clause", "cube", "term"]
+
+
+def query_file_name(kind: str, size: int, index: int, seed: int) -> str:
+    """the name of the file where a query is saved
+
+    Args:
+        kind (str): the kind of query, one of VALID_QUERY_KINDS
+        size (int): the number of literals in the query
+        index (int): the index of the query among the ones with the same size
+        seed (int): the seed used to generate the query
+
+    Returns:
+        str: the name of the file
+    """
+    if kind == "clause":
+        return f"ce_query_vars_{size}_index_{index}_seed_{seed}.smt2"
+    if kind == "cube":
+        return f"cube_query_vars_{size}_index_{index}_seed_{seed}.smt2"
+    if kind == "term":
+        return f"term_query_index_{index}_seed_{seed}.smt2"
+    raise ValueError(f"Invalid query kind {kind}. Valid kinds are {VALID_QUERY_KINDS}")
+
+
+def select_literals(input_atoms: List[FNode], size: int, seed: int) -> List[FNode]:
+    """randomly selects size atoms, negating half of them on average
+
+    The random choices are the same that the single query generator has always done,
+    so that queries generated with the same seed are over the same literals
+
+    Args:
+        input_atoms (List[FNode]): the atoms of the source formula, which are not modified
+        size (int): the number of literals to select
+        seed (int): the random seed
+
+    Returns:
+        List[FNode]: the selected literals
+    """
+    rng = random.Random(seed)
+    atoms = list(input_atoms)
+
+    if len(atoms) < size:
+        size = len(atoms)
+
+    if size < 1:
+        raise ValueError("Cannot generate a query for an empty set of atoms!")
+
+    chosen_set = set()
+    while len(chosen_set) < size:
+        choice = rng.choice(atoms)
+        atoms.remove(choice)
+        if rng.randint(0, 1) == 0:  # negate 50 % of atoms
+            choice = Not(choice)
+        chosen_set.add(choice)
+    return list(chosen_set)
+
+
+def generate_queries(
+        source_file: str,
+        output_folders: dict,
+        sizes: Iterable[int],
+        indexed_seeds: Iterable[Tuple[int, int]]) -> int:
+    """parses the source formula once and generates all its queries
+
+    Args:
+        source_file (str): the path to the formula from which atoms are taken
+        output_folders (dict): for each kind of query to generate, the folder where its files are saved
+        sizes (Iterable[int]): the sizes of the clauses and cubes to generate
+        indexed_seeds (Iterable[Tuple[int,int]]): the (index, seed) pairs, one query is generated for each pair and size
+
+    Returns:
+        int: the number of generated queries
+    """
+    if not os.path.exists(source_file):
+        raise FileNotFoundError(f"Input file {source_file} does not exist.")
+
+    input_atoms = _get_atoms(_read_phi(source_file))
+    indexed_seeds = list(indexed_seeds)
+
+    generated = 0
+    for kind, output_folder in output_folders.items():
+        kind_sizes = [1] if kind == "term" else sizes
+        for size in kind_sizes:
+            for index, seed in indexed_seeds:
+                output_file = os.path.join(
+                    output_folder, query_file_name(kind, size, index, seed))
+                literals = select_literals(input_atoms, size, seed)
+                if kind == "cube":
+                    query = And(*literals)
+                elif kind == "term":
+                    query = literals[0]
+                else:
+                    query = Or(*literals)
+                _save_phi(query, output_file)
+                generated += 1
+    return generated
+
 
 def parse_input():
     """Parse the input arguments for the script."""
@@ -38,8 +138,6 @@ def parse_input():
 def main():
     """Main function to generate a random clause."""
     args = parse_input()
-    if args.seed is not None:
-        random.seed(args.seed)
     size: int = args.size
     input_file: str = args.source
     output_file: str = args.output
@@ -50,22 +148,7 @@ def main():
     input_formula = _read_phi(input_file)
     input_atoms = _get_atoms(input_formula)
 
-    if len(input_atoms) < size:
-        size = len(input_atoms)
-
-    if size < 1:
-        raise ValueError("Cannot generate a query for an empty set of atoms!")
-
-    chosen_set = set()
-    while len(chosen_set) < size:
-        choice = random.choice(input_atoms)
-        input_atoms.remove(choice)
-        if random.randint(0, 1) == 0:  # negate 50 % of atoms
-            choice = Not(choice)
-        chosen_set.add(choice)
-
-    chosen_set = list(chosen_set)
-    clause = Or(*chosen_set)
+    clause = Or(*select_literals(input_atoms, size, args.seed))
     _save_phi(clause, output_file)
 
 
@@ -4,12 +4,15 @@ import os
 import random
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from math import log10
 from os import path
 
 from pysmt.shortcuts import Symbol, Or, Not, And, Iff, write_smtlib, LT, Real, Bool, Times, Plus, is_sat, Int
 from pysmt.typing import BOOL, REAL, INT
 
+from src.seeds import derive_seed
+
 DESCRIPTION = '''Generates random SMT(LRA) formulas.
         
 The boolean variables are named A0, A1, ...
@@ -78,8 +81,9 @@ class FormulaGenerator:
             self.bools.append(Symbol(self.TEMPL_BOOLS.format(i), BOOL))
 
         self.domain_bounds = dict()
-        # set the seed number, if specified
-        random.seed(seed)
+        # every generator owns its random state, so that problems
+        # can be generated independently from each other
+        self.rng = random.Random(seed)
 
     def generate_random_formula(self, depth, operators, neg_prob=0.5, theta=0.5):
         """
@@ -102,36 +106,36 @@ class FormulaGenerator:
     def _random_formula(self, depth, operators, neg_prob, theta):
         if depth <= 0:
             leaf = self._random_atom(theta)
-            if random.random() < neg_prob:
+            if self.rng.random() < neg_prob:
                 leaf = Not(leaf)
             return leaf
         else:
-            operator = random.choices(
+            operator = self.rng.choices(
                 list(operators.keys()), weights=list(operators.values()))[0]
 
             left = self._random_formula(depth - 1, operators, neg_prob, theta)
             right = self._random_formula(depth - 1, operators, neg_prob, theta)
             node = operator(left, right)
-            negate = random.random() < neg_prob
+            negate = self.rng.random() < neg_prob
             if negate:
                 node = Not(node)
             return node
 
     def _random_atom(self, theta=0.5):
-        if len(self.bools) == 0 or (len(self.reals) > 0 and random.random() < theta):
+        if len(self.bools) == 0 or (len(self.reals) > 0 and self.rng.random() < theta):
             return self._random_inequality()
         else:
             return self._random_boolean()
 
     def _random_boolean(self):
-        return random.choice(self.bools)
+        return self.rng.choice(self.bools)
 
     def _random_inequality(self, minsize=None, maxsize=2):
         n_reals = len(self.reals)
         minsize = max(1, minsize) if minsize else 1
         maxsize = min(maxsize, n_reals) if maxsize else n_reals
-        size = random.randint(minsize, maxsize)
-        r_vars = random.sample(self.reals, size)
+        size = self.rng.randint(minsize, maxsize)
+        r_vars = self.rng.sample(self.reals, size)
         monomials = []
         for r_var in r_vars:
             coefficient = self._random_coefficient(-1, 1)
@@ -140,13 +144,25 @@ class FormulaGenerator:
         bound = self._random_coefficient(-len(r_vars), len(r_vars))
         return LT(Plus(monomials), bound)
 
-    @staticmethod
-    def _random_coefficient(min_value=-1, max_value=1):
+    def _random_coefficient(self, min_value=-1, max_value=1):
         # coefficient = 0
         # while coefficient == 0:
         #     coefficient = random.uniform(min_value, max_value)
         # return Real(coefficient)
-        return Int(random.choice([1,-1]))
+        return Int(self.rng.choice([1,-1]))
+
+
+def generate_problem(index: int, file_name: str, n_bools: int, n_reals: int, seed: int,
+                     depth: int, operators, neg_prob: float, theta: float) -> int:
+    """generates the index-th problem of the run and writes it to file_name
+
+    Returns:
+        int: the index of the generated problem
+    """
+    generator = FormulaGenerator(n_bools, n_reals, derive_seed(seed, index))
+    problem = generator.generate_random_formula(depth, operators, neg_prob, theta)
+    write_smtlib(problem, file_name)
+    return index
 
 
 def parse_args():
@@ -170,6 +186,8 @@ def parse_args():
                         help='Number of model files (default: 20)')
     parser.add_argument('-s', '--seed', type=arg_positive_0, required=True,
                         help='Random seed')
+    parser.add_argument('-j', '--jobs', default=os.cpu_count(), type=arg_positive,
+                        help='Number of worker processes, the output does not depend on it (default: number of cores)')
 
     return parser.parse_args()
 
@@ -184,9 +202,6 @@ def main():
     check_output(args.output, output_dir)
     os.mkdir(output_dir)
 
-    # init generator
-    generator = FormulaGenerator(args.booleans, args.reals, args.seed)
-
     # generate formulas
     print("Starting creating problems")
     time_start = time.time()
@@ -204,18 +219,24 @@ def main():
         operators[k] /= weights_sum
     neg_prob = 0.0 if args.xnnf else 0.5
 
-    for i in range(args.models):
-        problem = generator.generate_random_formula(
-            args.depth, operators, neg_prob, args.theta)
-        if(i+1<10):
-            actual_output_folder = output_dir+'/0'+str(i+1)
-        else:
-            actual_output_folder = output_dir+'/'+str(i+1)
-        os.mkdir(actual_output_folder)
-        file_name = path.join(actual_output_folder, template.format(n=i + 1, d=digits))
-        write_smtlib(problem, file_name)
-        print("\r" * 100, end='')
-        print(f"Problem {i+1}/{args.models}", end='')
+    # each problem is generated from its own derived seed
+    # and written by its worker as soon as it is ready
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = []
+        for i in range(args.models):
+            if(i+1<10):
+                actual_output_folder = output_dir+'/0'+str(i+1)
+            else:
+                actual_output_folder = output_dir+'/'+str(i+1)
+            os.mkdir(actual_output_folder)
+            file_name = path.join(actual_output_folder, template.format(n=i + 1, d=digits))
+            futures.append(executor.submit(
+                generate_problem, i + 1, file_name, args.booleans, args.reals, args.seed,
+                args.depth, operators, neg_prob, args.theta))
+        for done, future in enumerate(as_completed(futures)):
+            future.result()
+            print("\r" * 100, end='')
+            print(f"Problem {done+1}/{args.models}", end='')
 
     print()
     time_end = time.time()
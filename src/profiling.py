@@ -0,0 +1,147 @@
+"""module to profile the phases of the knowledge compiler and of the query tool
+
+Each phase is profiled with cProfile and, at the same time, sampled with a SIGPROF timer.
+When a phase ends, its cProfile statistics are saved in PHASE.prof (readable with pstats or snakeviz)
+and the sampled stacks are saved in PHASE.collapsed, the folded format used by flamegraph.pl and speedscope.
+
+Phases can be nested: the cProfile profile of the outer phase is paused while the inner phase runs,
+so .prof files only hold the time spent in the phase itself,
+while the collapsed stacks of the outer phase also include the inner phases.
+"""
+import cProfile
+import os
+import signal
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+# seconds of CPU time between two samples of the stack
+DEFAULT_SAMPLING_INTERVAL = 0.001
+
+
+def profile_folder_from_details(details_file: str | None, default: str) -> str:
+    """computes the folder where the profiles are saved, next to the details file if available
+
+    Args:
+        details_file (str | None): the path to the details file
+        default (str): the folder used when no details file is provided
+
+    Returns:
+        str: the path to the folder where profiles will be saved
+    """
+    if details_file is None:
+        return default
+    return os.path.splitext(details_file)[0] + "_profile"
+
+
+class PhaseProfiler:
+    """profiles named phases of a computation
+
+    A profiler initialized without an output folder is disabled and its phases do nothing
+    """
+
+    output_folder: str | None
+    details: Dict[str, Dict[str, object]]
+
+    def __init__(self, output_folder: str | None, sampling_interval: float = DEFAULT_SAMPLING_INTERVAL):
+        """
+        initialize the profiler
+
+        Args:
+            output_folder (str | None): the folder where profiles are saved, None disables profiling
+            sampling_interval (float) [0.001]: the seconds of CPU time between two samples of the stack
+        """
+        self.output_folder = output_folder
+        self.sampling_interval = sampling_interval
+        self.details = {}
+        self._stack: List[str] = []
+        self._profiles: List[cProfile.Profile] = []
+        self._samples: Counter = Counter()
+        self._phase_names: Counter = Counter()
+        self._previous_handler = None
+
+    @property
+    def enabled(self) -> bool:
+        """True if the profiler saves profiles"""
+        return self.output_folder is not None
+
+    def _unique_name(self, name: str) -> str:
+        """makes the phase name unique, since a phase can run more than once"""
+        self._phase_names[name] += 1
+        if self._phase_names[name] == 1:
+            return name
+        return f"{name}_{self._phase_names[name]}"
+
+    def _sample(self, _signum, frame) -> None:
+        """SIGPROF handler: records the current Python stack prefixed by the active phases"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        frames.reverse()
+        self._samples[";".join(self._stack + frames)] += 1
+
+    def _start_sampling(self) -> None:
+        """start the SIGPROF timer"""
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.sampling_interval, self.sampling_interval)
+
+    def _stop_sampling(self) -> None:
+        """stop the SIGPROF timer"""
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    @contextmanager
+    def phase(self, name: str):
+        """context manager that profiles the code inside it as the phase called name
+
+        Args:
+            name (str): the name of the phase, used for the names of the saved files
+        """
+        if not self.enabled:
+            yield
+            return
+        phase_name = self._unique_name(name)
+        if len(self._stack) == 0:
+            os.makedirs(self.output_folder, exist_ok=True)
+            self._start_sampling()
+        else:
+            self._profiles[-1].disable()
+        self._stack.append(phase_name)
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._profiles.pop()
+            phase_prefix = ";".join(self._stack)
+            self._stack.pop()
+            if len(self._stack) == 0:
+                self._stop_sampling()
+            else:
+                self._profiles[-1].enable()
+            self._save_phase(phase_name, phase_prefix, profile)
+
+    def _save_phase(self, phase_name: str, phase_prefix: str, profile: cProfile.Profile) -> None:
+        """save the cProfile statistics and the collapsed stacks of a phase"""
+        profile_file = os.path.join(self.output_folder, f"{phase_name}.prof")
+        profile.dump_stats(profile_file)
+        collapsed_file = os.path.join(self.output_folder, f"{phase_name}.collapsed")
+        samples = 0
+        with open(collapsed_file, "w", encoding='utf8') as out:
+            for stack, count in self._samples.items():
+                if stack == phase_prefix or stack.startswith(phase_prefix + ";"):
+                    out.write(f"{stack} {count}\n")
+                    samples += count
+        self.details[phase_name] = {
+            "profile": profile_file,
+            "collapsed stacks": collapsed_file,
+            "samples": samples}
+
+
+# profiler used when profiling is not requested
+NO_PROFILER = PhaseProfiler(None)
@@ -3,6 +3,8 @@ import argparse
 from dataclasses import dataclass
 from typing import List
 
+from src.query.constants import VALID_REPLAY_MODES, VALID_ADAPTIVE_LANGUAGES
+
 @dataclass
 class QueryOptions:
     """dataclass that holds options for the tool"""
@@ -11,8 +13,17 @@ class QueryOptions:
     validity: bool
     entail_clause: List[str]
     implicant: str | None
+    entail_clause_batch: str | None
+    implicant_batch: str | None
     count: bool
+    approximate_count: bool
+    epsilon: float
+    delta: float
     enumerate: bool
+    marginals: bool
+    wmc: str | None
+    literal_index: bool
+    entailment_cache: bool
     condition: str | None
     save_conditioned: str | None
     conjunction: str | None
@@ -27,6 +38,12 @@ class QueryOptions:
     details: str | None
     timeout:int
     incrementality:bool
+    profile:bool
+    workload: str | None
+    replay_mode: str
+    arrival_rate: float | None
+    adaptive: str | None
+    adaptive_folder: str | None
 
     def __init__(self, args: argparse.Namespace):
         self.load_data = args.load_data
@@ -37,8 +54,17 @@ class QueryOptions:
         self.validity = args.validity
         self.entail_clause = args.entail_clause if args.entail_clause is not None else []
         self.implicant = args.implicant
+        self.entail_clause_batch = args.entail_clause_batch
+        self.implicant_batch = args.implicant_batch
         self.count = args.count
+        self.approximate_count = args.approximate_count
+        self.epsilon = args.epsilon
+        self.delta = args.delta
         self.enumerate = args.enumerate
+        self.marginals = args.marginals
+        self.wmc = args.wmc
+        self.literal_index = args.literal_index
+        self.entailment_cache = args.entailment_cache
         self.condition = args.condition
         self.save_conditioned = args.save_conditioned
         self.conjunction = args.conjunction
@@ -53,6 +79,12 @@ class QueryOptions:
         self.timeout = args.timeout
         self.seed = args.seed
         self.incrementality = args.incrementality
+        self.profile = args.profile
+        self.workload = args.workload
+        self.replay_mode = args.replay_mode
+        self.arrival_rate = args.arrival_rate
+        self.adaptive = args.adaptive
+        self.adaptive_folder = args.adaptive_folder
 
 def get_args() -> QueryOptions:
     """Reads the args from the command line"""
@@ -79,14 +111,52 @@ def get_args() -> QueryOptions:
         "--implicant",
         help="Query the compiled formula to check if the term in the specified smt2 file is an implicant for the encoded formula",
         type=str)
+    parser.add_argument(
+        "--entail_clause_batch",
+        help="Query the compiled formula to check if the encoded formula entails each clause in the specified batch file (SMT-LIB with named assertions, or JSONL of signed atom lists)",
+        type=str)
+    parser.add_argument(
+        "--implicant_batch",
+        help="Query the compiled formula to check if each term in the specified batch file (SMT-LIB with named assertions, or JSONL of signed atom lists) is an implicant for the encoded formula",
+        type=str)
     parser.add_argument(
         "--count",
         help="Query the compiled formula to count the number of models for the encoded formula",
         action="store_true")
+    parser.add_argument(
+        "--approximate_count",
+        help="Approximate the model count with random XOR constraints over the atoms instead of counting exactly (SMT formulas only)",
+        action="store_true")
+    parser.add_argument(
+        "--epsilon",
+        help="Tolerance of the approximate model count: the estimate is within a factor (1 + epsilon) of the model count",
+        type=float,
+        default=0.8)
+    parser.add_argument(
+        "--delta",
+        help="Confidence of the approximate model count: the tolerance holds with probability at least 1 - delta",
+        type=float,
+        default=0.2)
     parser.add_argument(
         "--enumerate",
         help="Query the compiled formula to enumerate all models for the encoded formula",
         action="store_true")
+    parser.add_argument(
+        "--marginals",
+        help="Query the compiled formula to count, for every literal, the models where the literal is true (also gives the backbone)",
+        action="store_true")
+    parser.add_argument(
+        "--wmc",
+        help="Query the compiled formula for its weighted model count, for each weight vector in the specified JSON file (see README)",
+        type=str)
+    parser.add_argument(
+        "--literal_index",
+        help="Load (or compute and save next to the compiled formula) the backbone and implicant literals, and use them to answer unit clause entailment and implicant queries",
+        action="store_true")
+    parser.add_argument(
+        "--entailment_cache",
+        help="Cache clausal entailment results for the session and answer clauses subsumed by (or subsuming) already checked clauses from the cache",
+        action="store_true")
     parser.add_argument(
         "--condition",
         help="Transform the compiled formula in compiled formula | alpha, where alpha is a literal or a cube specified in the provided .smt2 file",
@@ -126,8 +196,11 @@ def get_args() -> QueryOptions:
     parser.add_argument(
         "-r",
         "--random",
-        help="select a random clause/implicant/term instead of loading from a file",
-        action="store_true")
+        help="select N (default 1) random clauses/implicants/terms instead of loading from a file, each one with a seed derived from --seed, and run them all on the same loaded structure",
+        nargs="?",
+        const=1,
+        type=int,
+        metavar="N")
     parser.add_argument(
         "-s",
         "--seed",
@@ -148,5 +221,37 @@ def get_args() -> QueryOptions:
         "--incrementality",
         help="if set to true, the smt solver will use incremental mode",
         action="store_true")
+    parser.add_argument(
+        "--profile",
+        help="Profile the loading of the structure and each query, saving profiles and collapsed stacks next to the details file",
+        action="store_true")
+    parser.add_argument(
+        "--workload",
+        help="Generate the workload described in the specified JSON file and replay it, reporting throughput and latency percentiles",
+        type=str)
+    parser.add_argument(
+        "--replay_mode",
+        help="Replay the workload closed-loop (next query when the previous one is answered) or open-loop (queries arrive at --arrival_rate)",
+        type=str,
+        choices=VALID_REPLAY_MODES,
+        default="closed")
+    parser.add_argument(
+        "--arrival_rate",
+        help="Mean number of queries arriving per second when replaying a workload open-loop",
+        type=float)
+    parser.add_argument(
+        "--adaptive",
+        help="When querying an SMT formula, compile it in the background to the specified language once compiling is projected to pay off, and answer the later queries from the compiled structure",
+        type=str,
+        choices=VALID_ADAPTIVE_LANGUAGES)
+    parser.add_argument(
+        "--adaptive_folder",
+        help="Specify the folder where the adaptive planner saves (or finds) the compiled structure. Defaults to the SMT formula path without extension followed by _ and the language",
+        type=str)
     args = parser.parse_args()
+    # with 0 random queries the tool would silently fall back to the query files
+    if args.random is not None and args.random < 1:
+        raise ValueError("The number of random queries must be a positive integer!")
+    if args.approximate_count and not args.count:
+        raise ValueError("Approximate model counting needs --count!")
     return QueryOptions(args)
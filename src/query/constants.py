@@ -20,6 +20,10 @@ if DECDNNF_PATH is not None and os.path.isfile(DECDNNF_PATH) and not DECDNNF_PAT
         DECDNNF_PATH = f"./{DECDNNF_PATH}"
 
 TRANSLATED_FILE = "translation_to_d4.nnf"
+# folder of the artifact where the d4 translations of c2d d-DNNFs are cached
+TRANSLATION_CACHE_FOLDER = "translation_cache"
+# maximum number of translations kept in the translation cache of an artifact
+TRANSLATION_CACHE_MAX_ENTRIES = 4
 C2D_DDNNF_FILE = "dimacs.cnf.nnf"
 D4_DDNNF_FILE = "compilation_output.nnf"
 
@@ -28,5 +32,20 @@ CONDITION_C2D_OUTPUT_OPTION = "-o_c2d"
 CONDITION_DDNNF_OUTPUT_OPTION = "-o"
 
 TEPORARY_CONDITION_FILE = "temp_condition.nnf"
+# memory-backed folder where conditioned d-DNNFs are streamed to the reasoners
+TMPFS_FOLDER = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# seconds between two checks on the process conditioning a streamed d-DNNF
+PRODUCER_POLL_INTERVAL = 0.01
 
 TEMPORARY_QUERY_INPUT_FILE = "temp_query.smt2"
+
+VALID_REPLAY_MODES = ["closed", "open"]
+
+# kinds of query that can be run on random literals with --random
+RANDOM_QUERY_KINDS = ["entail_clause", "implicant", "condition"]
+
+# languages the adaptive planner can compile SMT formulas to
+VALID_ADAPTIVE_LANGUAGES = ["tbdd", "tsdd"]
+
+# file where the adaptive planner saves the digest of the formula a structure was compiled from
+ADAPTIVE_SOURCE_DIGEST_FILE = "source_digest.txt"
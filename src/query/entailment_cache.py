@@ -0,0 +1,150 @@
+"""module for the cache of clausal entailment results
+
+Clauses are sets of signed literals, and entailment is monotone with respect to set inclusion:
+if a clause is entailed, every superset of it is entailed,
+and if a clause is not entailed, no subset of it is entailed.
+The cache keeps the clauses whose result is known and answers every clause dominated by one of them.
+"""
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+Literal = Tuple[object, bool]
+
+
+class _ClauseFamily:
+    """a family of clauses indexed by literal, to find subsets and supersets of a clause"""
+
+    clauses: Dict[int, FrozenSet[Literal]]
+    postings: Dict[Literal, Set[int]]
+    # the id of the empty clause, which has no postings, None if it is not in the family
+    empty_id: int | None
+
+    def __init__(self):
+        self.clauses = {}
+        self.postings = {}
+        self.empty_id = None
+        self._next_id = 0
+
+    def add(self, clause: FrozenSet[Literal]) -> None:
+        """add a clause to the family"""
+        clause_id = self._next_id
+        self._next_id += 1
+        self.clauses[clause_id] = clause
+        if len(clause) == 0:
+            self.empty_id = clause_id
+        for literal in clause:
+            self.postings.setdefault(literal, set()).add(clause_id)
+
+    def remove(self, clause_ids: Iterable[int]) -> None:
+        """remove the clauses with the given ids"""
+        for clause_id in clause_ids:
+            for literal in self.clauses[clause_id]:
+                self.postings[literal].discard(clause_id)
+            if clause_id == self.empty_id:
+                self.empty_id = None
+            del self.clauses[clause_id]
+
+    def subsets_of(self, clause: FrozenSet[Literal]) -> List[int]:
+        """the ids of the clauses in the family that are subsets of clause"""
+        subsets = [] if self.empty_id is None else [self.empty_id]
+        hits: Dict[int, int] = {}
+        for literal in clause:
+            for clause_id in self.postings.get(literal, ()):
+                hits[clause_id] = hits.get(clause_id, 0) + 1
+                if hits[clause_id] == len(self.clauses[clause_id]):
+                    subsets.append(clause_id)
+        return subsets
+
+    def supersets_of(self, clause: FrozenSet[Literal]) -> Set[int]:
+        """the ids of the clauses in the family that are supersets of clause"""
+        if len(clause) == 0:
+            return set(self.clauses.keys())
+        # intersect the postings starting from the shortest one
+        postings = sorted((self.postings.get(literal, set()) for literal in clause), key=len)
+        common = set(postings[0])
+        for posting in postings[1:]:
+            common &= posting
+            if len(common) == 0:
+                break
+        return common
+
+    def has_subset_of(self, clause: FrozenSet[Literal]) -> bool:
+        """True if some clause in the family is a subset of clause"""
+        if self.empty_id is not None:
+            return True
+        hits: Dict[int, int] = {}
+        for literal in clause:
+            for clause_id in self.postings.get(literal, ()):
+                hits[clause_id] = hits.get(clause_id, 0) + 1
+                if hits[clause_id] == len(self.clauses[clause_id]):
+                    return True
+        return False
+
+    def has_superset_of(self, clause: FrozenSet[Literal]) -> bool:
+        """True if some clause in the family is a superset of clause"""
+        return len(self.supersets_of(clause)) > 0
+
+
+class ClauseEntailmentCache:
+    """cache of clausal entailment results that also answers subsumed and subsuming clauses"""
+
+    def __init__(self):
+        # only minimal entailed clauses and maximal non entailed clauses are kept
+        self._entailed = _ClauseFamily()
+        self._not_entailed = _ClauseFamily()
+        self.lookups = 0
+        self.entailed_hits = 0
+        self.not_entailed_hits = 0
+
+    def lookup(self, clause_items: Iterable[Literal]) -> bool | None:
+        """answers the entailment of a clause from the cache when possible
+
+        Args:
+            clause_items (Iterable[Tuple[object,bool]]): the literals of the clause
+
+        Returns:
+            bool | None: the cached result, or None if the cache cannot answer
+        """
+        clause = frozenset(clause_items)
+        self.lookups += 1
+        if self._entailed.has_subset_of(clause):
+            self.entailed_hits += 1
+            return True
+        if self._not_entailed.has_superset_of(clause):
+            self.not_entailed_hits += 1
+            return False
+        return None
+
+    def store(self, clause_items: Iterable[Literal], result: bool) -> None:
+        """stores the entailment result of a clause
+
+        Args:
+            clause_items (Iterable[Tuple[object,bool]]): the literals of the clause
+            result (bool): True if the clause is entailed
+        """
+        clause = frozenset(clause_items)
+        if result:
+            if self._entailed.has_subset_of(clause):
+                return
+            self._entailed.remove(self._entailed.supersets_of(clause))
+            self._entailed.add(clause)
+        else:
+            if self._not_entailed.has_superset_of(clause):
+                return
+            self._not_entailed.remove(self._not_entailed.subsets_of(clause))
+            self._not_entailed.add(clause)
+
+    def get_stats(self) -> Dict[str, object]:
+        """the statistics of the cache, to be saved in the details
+
+        Returns:
+            Dict[str,object]: lookups, hits and hit rate of the cache
+        """
+        hits = self.entailed_hits + self.not_entailed_hits
+        return {
+            "lookups": self.lookups,
+            "hits": hits,
+            "entailed hits": self.entailed_hits,
+            "not entailed hits": self.not_entailed_hits,
+            "hit rate": hits / self.lookups if self.lookups > 0 else 0.0,
+            "entailed clauses": len(self._entailed.clauses),
+            "not entailed clauses": len(self._not_entailed.clauses)}
@@ -0,0 +1,162 @@
+"""module for the index of the literals entailed by the compiled formula (backbone) and of its implicant literals
+
+The index is computed once from the marginal counts of the compiled formula
+and saved next to the artifact, together with a fingerprint of the artifact files,
+so that later sessions can load it instead of computing it again.
+The digest of each file is memoized on its size, modification time and inode,
+so that unchanged artifacts are not read again just to be fingerprinted.
+"""
+import hashlib
+import json
+import numbers
+import os
+from typing import Dict, List, Set, Tuple
+
+from src.file_digests import memoized_digests
+
+LITERAL_INDEX_FILE = "literal_index.json"
+_DIGEST_MEMO_FILE = "literal_index_digests.json"
+
+
+def artifact_fingerprint(folder: str) -> str:
+    """computes a fingerprint of the files of a compiled artifact,
+    reusing the digests memoized for files that did not change
+
+    Args:
+        folder (str): the folder where the artifact is saved
+
+    Returns:
+        str: the SHA-256 hex digest of the names and digests of the files in the folder, except the literal index
+    """
+    file_paths = {
+        name: os.path.join(folder, name)
+        for name in sorted(os.listdir(folder))
+        if name not in (LITERAL_INDEX_FILE, _DIGEST_MEMO_FILE) and os.path.isfile(os.path.join(folder, name))}
+    # a read-only artifact is fingerprinted again by the next session
+    digests = memoized_digests(file_paths, os.path.join(folder, _DIGEST_MEMO_FILE))
+
+    digest = hashlib.sha256()
+    for name in sorted(digests):
+        digest.update(name.encode())
+        digest.update(digests[name].encode())
+    return digest.hexdigest()
+
+
+class LiteralIndex:
+    """the literals entailed by the compiled formula and its implicant literals,
+    literals are pairs (atom key in the refinement mapping, polarity)"""
+
+    consistent: bool
+    backbone: Set[Tuple[object, bool]]
+    implicants: Set[Tuple[object, bool]]
+
+    def __init__(self, consistent: bool, backbone: Set[Tuple[object, bool]], implicants: Set[Tuple[object, bool]]):
+        """
+        initialize the index
+
+        Args:
+            consistent (bool): True if the compiled formula is consistent
+            backbone (Set[Tuple[object,bool]]): the literals that are true in all models
+            implicants (Set[Tuple[object,bool]]): the literals that entail the compiled formula
+        """
+        self.consistent = consistent
+        self.backbone = backbone
+        self.implicants = implicants
+
+    @staticmethod
+    def from_marginals(marginals: Dict[object, Tuple[int, int]], n_vars: int, model_count: int) -> 'LiteralIndex':
+        """builds the index from the marginal counts of the compiled formula
+
+        Args:
+            marginals (Dict[object,Tuple[int,int]]): for each atom, the exact number of models where it is true and where it is false
+            n_vars (int): the number of variables the models are counted on
+            model_count (int): the number of models of the compiled formula
+
+        Returns:
+            LiteralIndex: the index
+        """
+        # counts above 2^53 are not exact as floats, and a rounded count can look like an implicant
+        if not isinstance(model_count, numbers.Integral) or not all(
+                isinstance(count, numbers.Integral) for counts in marginals.values() for count in counts):
+            raise ValueError("The marginal counts must be exact integers")
+        # a literal is an implicant when all the assignments where it is true are models
+        half = 2 ** (n_vars - 1) if n_vars > 0 else 0
+        # the marginals cannot tell a formula without atoms from an inconsistent one
+        consistent = model_count > 0
+        backbone = set()
+        implicants = set()
+        for key, (positive, negative) in marginals.items():
+            if positive > 0 and negative == 0:
+                backbone.add((key, True))
+            if negative > 0 and positive == 0:
+                backbone.add((key, False))
+            if positive == half:
+                implicants.add((key, True))
+            if negative == half:
+                implicants.add((key, False))
+        return LiteralIndex(consistent, backbone, implicants)
+
+    def entails_clause(self, clause_items: List[Tuple[object, bool]]) -> bool | None:
+        """answers clausal entailment from the index when possible
+
+        Args:
+            clause_items (List[Tuple[object,bool]]): the literals of the clause
+
+        Returns:
+            bool | None: the answer, or None if the index alone cannot answer
+        """
+        if not self.consistent:
+            return True
+        if any(item in self.backbone for item in clause_items):
+            return True
+        if len(clause_items) == 1:
+            return False
+        return None
+
+    def is_implicant(self, term_item: Tuple[object, bool]) -> bool:
+        """answers if a literal is an implicant of the compiled formula
+
+        Args:
+            term_item (Tuple[object,bool]): the literal
+
+        Returns:
+            bool: True if the literal is an implicant
+        """
+        return term_item in self.implicants
+
+    def save(self, file_path: str, fingerprint: str) -> None:
+        """saves the index to a JSON file
+
+        Args:
+            file_path (str): the path to the file
+            fingerprint (str): the fingerprint of the artifact the index was computed on
+        """
+        data = {
+            "fingerprint": fingerprint,
+            "consistent": self.consistent,
+            "backbone": [list(item) for item in self.backbone],
+            "implicants": [list(item) for item in self.implicants]}
+        with open(file_path, "w", encoding='utf8') as out:
+            json.dump(data, out)
+
+    @staticmethod
+    def load(file_path: str, fingerprint: str) -> 'LiteralIndex | None':
+        """loads the index from a JSON file
+
+        Args:
+            file_path (str): the path to the file
+            fingerprint (str): the fingerprint of the current artifact
+
+        Returns:
+            LiteralIndex | None: the index, or None if the file does not exist or was computed on a different artifact
+        """
+        if not os.path.isfile(file_path):
+            return None
+        with open(file_path, "r", encoding='utf8') as file:
+            data = json.load(file)
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return LiteralIndex(
+            data["consistent"],
+            {(item[0], item[1]) for item in data["backbone"]},
+            {(item[0], item[1]) for item in data["implicants"]})
@@ -31,7 +31,11 @@ from src.query.tddnnf.d4.manager import D4_DDNNFQueryManager
 from src.query.tbdd.manager import TBDDQueryManager
 from src.query.tsdd.manager import TSDDQueryManager
 from src.query.smt_solver.manager import SMTQueryManager
+from src.query.query_interface import QueryInterface
 from src.query.constants import TEMPORARY_QUERY_INPUT_FILE
+from src.query.workload import WorkloadSpec, generate_workload, replay
+from src.query.planner import AdaptiveQueryPlanner
+from src.profiling import NO_PROFILER, PhaseProfiler, profile_folder_from_details
 
 def clean_tmp_file():
     """remove the temporary query file"""
@@ -139,74 +143,171 @@ def _get_tsdd_manager(input_folder: str) -> TSDDQueryManager:
     return TSDDQueryManager(input_folder, refinement_mapping = refinement_mapping)
 
 
+def load_query_manager(input_folder: str) -> QueryInterface:
+    """load the correct query manager from the contents of the input folder
+
+    Args:
+        input_folder (str): the path to the folder where the compiled formula is stored, or to a .smt/.smt2 file
+
+    Returns:
+        QueryInterface: the query manager for the compiled formula
+    """
+    if is_c2d_tddnnf_loading_folder_correct(input_folder):
+        return _get_c2d_manager(input_folder)
+    if is_d4_tddnnf_loading_folder_correct(input_folder):
+        return _get_d4_manager(input_folder)
+    if is_tbdd_loading_folder_correct(input_folder):
+        return _get_tbdd_manager(input_folder)
+    if is_tsdd_loading_folder_correct(input_folder):
+        return _get_tsdd_manager(input_folder)
+    if input_folder.endswith(".smt") or input_folder.endswith(".smt2"):
+        return SMTQueryManager(input_folder)
+    raise ValueError(
+        "The folder where the compiled formula files are stored was not found, or some files are missing from it.")
+
+
+def _answers_with_smt(query_manager: QueryInterface | AdaptiveQueryPlanner) -> bool:
+    """True if the queries are currently answered by the SMT solver,
+    which is the case for the planner until it switches to the compiled structure"""
+    if isinstance(query_manager, AdaptiveQueryPlanner):
+        return isinstance(query_manager.manager, SMTQueryManager)
+    return isinstance(query_manager, SMTQueryManager)
+
+
 def main():
     """
     main function to quering compiled formulas
     """
     args = get_args()
 
-    input_folder = args.load_data
-    is_smt:bool = False
+    profiler = NO_PROFILER
+    if args.profile:
+        profiler = PhaseProfiler(profile_folder_from_details(args.details, "query_profile"))
 
     # LOAD THE CORRECT MANAGER
-    if is_c2d_tddnnf_loading_folder_correct(input_folder):
-        query_manager = _get_c2d_manager(input_folder)
-    elif is_d4_tddnnf_loading_folder_correct(input_folder):
-        query_manager = _get_d4_manager(input_folder)
-    elif is_tbdd_loading_folder_correct(input_folder):
-        query_manager = _get_tbdd_manager(input_folder)
-    elif is_tsdd_loading_folder_correct(input_folder):
-        query_manager = _get_tsdd_manager(input_folder)
-    elif input_folder.endswith(".smt") or input_folder.endswith(".smt2"):
-        query_manager = SMTQueryManager(input_folder)
-        is_smt = True
-    else:
-        raise ValueError(
-            "The folder where the compiled formula files are stored was not found, or some files are missing from it.")
+    with profiler.phase("load"):
+        query_manager = load_query_manager(args.load_data)
+    if args.adaptive is not None:
+        if not isinstance(query_manager, SMTQueryManager):
+            raise ValueError("The adaptive planner can only be used on SMT formulas")
+        query_manager = AdaptiveQueryPlanner(
+            query_manager, load_query_manager, args.adaptive, args.adaptive_folder)
+        if args.random is not None and args.random > 1:
+            query_manager.expected_queries = args.random
+
+    if args.entailment_cache:
+        query_manager.enable_entailment_cache()
+
+    if args.literal_index:
+        with profiler.phase("literal_index"):
+            query_manager.load_literal_index(args.timeout)
 
     if args.consistency:
-        query_manager.check_consistency(args.timeout)
+        with profiler.phase("consistency"):
+            query_manager.check_consistency(args.timeout)
 
     if args.validity:
-        query_manager.check_validity(args.timeout)
+        with profiler.phase("validity"):
+            query_manager.check_validity(args.timeout)
 
     if len(args.entail_clause)>0:
-        if is_smt:
-            query_manager.check_entail_clause(args.entail_clause, args.timeout, args.incrementality)
-        elif args.random:
-            query_manager.check_entail_clause_random(args.seed)
-        else:
-            query_manager.check_entail_clause(args.entail_clause, args.timeout)
+        with profiler.phase("entail_clause"):
+            # random streams on the planner go through it one query at a time, so that it can switch mid-stream
+            if _answers_with_smt(query_manager) and not (args.adaptive is not None and args.random):
+                query_manager.check_entail_clause(args.entail_clause, args.timeout, args.incrementality)
+            elif args.random is not None and args.random > 1:
+                query_manager.run_random_queries("entail_clause", args.random, args.seed, args.timeout)
+            elif args.random:
+                query_manager.check_entail_clause_random(args.seed)
+            else:
+                query_manager.check_entail_clause(args.entail_clause, args.timeout)
 
     if args.implicant is not None:
-        if args.random:
-            query_manager.check_implicant_random(args.seed)
-        else:
-            query_manager.check_implicant(args.implicant,args.timeout)
+        with profiler.phase("implicant"):
+            if args.random is not None and args.random > 1:
+                query_manager.run_random_queries("implicant", args.random, args.seed, args.timeout)
+            elif args.random:
+                query_manager.check_implicant_random(args.seed)
+            else:
+                query_manager.check_implicant(args.implicant,args.timeout)
+
+    if args.entail_clause_batch is not None:
+        with profiler.phase("entail_clause_batch"):
+            query_manager.check_entail_clause_batch(args.entail_clause_batch, args.timeout)
+
+    if args.implicant_batch is not None:
+        with profiler.phase("implicant_batch"):
+            query_manager.check_implicant_batch(args.implicant_batch, args.timeout)
 
     if args.count:
-        query_manager.count_models(args.timeout)
+        with profiler.phase("count"):
+            if args.approximate_count:
+                # the planner may have switched to the compiled structure since the start of the session
+                if not _answers_with_smt(query_manager):
+                    raise ValueError("Approximate model counting is only available for SMT formulas")
+                query_manager.enable_approximate_counting(args.epsilon, args.delta, args.seed)
+            query_manager.count_models(args.timeout)
 
     if args.enumerate:
-        query_manager.enumerate_models(args.timeout)
+        with profiler.phase("enumerate"):
+            query_manager.enumerate_models(args.timeout)
+
+    if args.marginals:
+        with profiler.phase("marginals"):
+            query_manager.marginal_counts(args.timeout)
+
+    if args.wmc is not None:
+        with profiler.phase("wmc"):
+            query_manager.weighted_model_count(args.wmc, args.timeout)
 
     if args.condition is not None:
-        if args.random:
-            query_manager.condition_random(args.seed)
-        else:
-            query_manager.condition(args.condition, args.timeout,args.save_conditioned)
+        with profiler.phase("condition"):
+            if args.random is not None and args.random > 1:
+                query_manager.run_random_queries("condition", args.random, args.seed, args.timeout)
+            elif args.random:
+                query_manager.condition_random(args.seed)
+            else:
+                query_manager.condition(args.condition, args.timeout,args.save_conditioned)
 
     if args.entail is not None:
-        query_manager.check_entail(args.entail)
+        with profiler.phase("entail"):
+            query_manager.check_entail(args.entail)
 
     if args.conjunction is not None:
-        query_manager.conjunction(args.conjunction, args.save_conjunction)
+        with profiler.phase("conjunction"):
+            query_manager.conjunction(args.conjunction, args.save_conjunction)
 
     if args.disjunction is not None:
-        query_manager.disjunction(args.disjunction, args.save_disjunction)
+        with profiler.phase("disjunction"):
+            query_manager.disjunction(args.disjunction, args.save_disjunction)
 
     if args.negation:
-        query_manager.negation(args.save_negation)
+        with profiler.phase("negation"):
+            query_manager.negation(args.save_negation)
+
+    if args.workload is not None:
+        with profiler.phase("workload"):
+            spec = WorkloadSpec.from_file(args.workload)
+            workload = generate_workload(spec, query_manager)
+            if args.adaptive is not None:
+                query_manager.expected_queries = len(workload)
+            report = replay(
+                query_manager,
+                workload,
+                mode=args.replay_mode,
+                arrival_rate=args.arrival_rate,
+                seed=spec.seed,
+                timeout=args.timeout)
+        query_manager.get_details()["workload"] = report
+        print(f"Replayed {report['queries']} queries ({report['mode']}-loop): "
+              f"{report['throughput']:.2f} queries/s, "
+              f"p50 {report['p50 latency']:.6f}s, p95 {report['p95 latency']:.6f}s, p99 {report['p99 latency']:.6f}s")
+
+    if args.adaptive is not None:
+        query_manager.close()
+
+    if profiler.enabled:
+        query_manager.get_details()["profiling"] = profiler.details
 
     if args.details is not None:
         save_details(query_manager.get_details(),args.details)
@@ -0,0 +1,364 @@
+"""module for the adaptive query planner
+
+The planner starts answering queries on an SMT formula through the SMT solver,
+keeps track of the time spent on them and compiles the formula in the background,
+with the knowledge compiler, once the time that the compiled structure is projected to save
+on the remaining queries exceeds the estimated compilation time.
+When the compilation is done, the later queries are answered by the compiled structure.
+
+When the number of queries of the session is not known,
+the queries still to come are assumed to be as many as the queries already answered,
+so that compilation starts once the SMT queries took about as long as the compilation is expected to take.
+
+The structure is compiled into a temporary folder next to the final one, and moved into place only when the compilation succeeds,
+together with the SHA-256 digest of the formula. A folder is only used if its digest matches the current formula.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from theorydd.formula import get_atoms, get_fnode_size
+
+from src.file_digests import file_digest
+from src.query.constants import ADAPTIVE_SOURCE_DIGEST_FILE, VALID_ADAPTIVE_LANGUAGES
+from src.query.query_interface import QueryInterface, run_random_stream
+from src.query.smt_solver.manager import SMTQueryManager
+from src.query.util import is_tbdd_loading_folder_correct, is_tsdd_loading_folder_correct
+
+# queries observed before the first decision, to have a meaningful mean query time
+MIN_OBSERVED_QUERIES = 5
+# expected time of a query on the compiled structure, in seconds
+COMPILED_QUERY_TIME = 1e-4
+
+# methods answering one query on the structure
+_QUERY_BODIES = {
+    "_check_consistency",
+    "_check_validity",
+    "_check_entail_clause_body",
+    "_check_entail_clause_random_body",
+    "_check_implicant_body",
+    "_check_implicant_random_body",
+    "_count_models",
+    "_enumerate_models",
+    "_marginal_counts",
+    "_weighted_model_counts",
+    "_condition_body",
+    "_condition_random_body"}
+
+# public methods answering one or more queries (one for each item of their result when it is a list)
+_QUERY_METHODS = {
+    "check_consistency",
+    "check_validity",
+    "check_entail_clause",
+    "check_entail_clause_random",
+    "check_entail_clause_batch",
+    "check_implicant",
+    "check_implicant_random",
+    "check_implicant_batch",
+    "count_models",
+    "enumerate_models",
+    "marginal_counts",
+    "weighted_model_count",
+    "condition",
+    "condition_random",
+    "run_random_query"}
+
+# methods taking the items of a query (keyed as in the refinement mapping) as first argument
+_ITEM_METHODS = {
+    "_check_entail_clause_random_body",
+    "_check_implicant_random_body",
+    "_condition_random_body",
+    "run_random_query",
+    "_entail_clause_shortcut",
+    "_store_entailment"}
+
+
+def source_digest(source_file: str) -> str:
+    """the SHA-256 digest of the content of the formula file
+
+    Args:
+        source_file (str): the path to the .smt or .smt2 file
+
+    Returns:
+        str: the hexadecimal digest
+    """
+    return file_digest(source_file)
+
+
+def compile_artifact(source_file: str, language: str, output_folder: str) -> None:
+    """compiles the formula in source_file with the knowledge compiler and saves it in output_folder,
+    meant to be run in a separate process
+
+    Args:
+        source_file (str): the path to the .smt or .smt2 file
+        language (str): the target language, one of "tbdd" or "tsdd"
+        output_folder (str): the folder where the compiled structure is saved
+    """
+    # imported here so that only the compilation process loads the compiler
+    from src.kc.commands import get_args  # pylint: disable=import-outside-toplevel
+    from src.kc.main import get_phi, smt_phase  # pylint: disable=import-outside-toplevel
+
+    args = get_args([
+        "--input", source_file,
+        f"--{language}",
+        f"--save_{language}", output_folder,
+        "--details_file", os.path.join(output_folder, "compilation_details.json")])
+    data_logger = {}
+    phi = get_phi(args, data_logger)
+    smt_phase(phi, args, data_logger)
+
+
+class AdaptiveQueryPlanner:
+    """answers queries through an SMT query manager
+    and switches to a compiled structure when compiling is projected to pay off
+
+    Any attribute that is not defined by the planner is taken from the manager currently answering the queries,
+    so the planner can be used wherever a query manager is expected"""
+
+    expected_queries: int | None
+
+    def __init__(
+            self,
+            smt_manager: SMTQueryManager,
+            loader: Callable[[str], QueryInterface],
+            language: str = "tbdd",
+            output_folder: str | None = None):
+        """
+        initialize the planner
+
+        Args:
+            smt_manager (SMTQueryManager): the manager for the SMT formula
+            loader (Callable[[str],QueryInterface]): the function that loads a query manager from a compiled structure folder
+            language (str) ["tbdd"]: the language to compile to, one of "tbdd" or "tsdd"
+            output_folder (str | None) [None]: the folder for the compiled structure.
+                Defaults to the path of the SMT formula without extension, followed by _ and the language
+        """
+        if language not in VALID_ADAPTIVE_LANGUAGES:
+            raise ValueError(f"Invalid language {language}. Valid languages are {VALID_ADAPTIVE_LANGUAGES}")
+        self._smt_manager = smt_manager
+        self._compiled_manager: QueryInterface | None = None
+        self._loader = loader
+        self._language = language
+        if output_folder is None:
+            output_folder = f"{os.path.splitext(smt_manager.source_folder)[0]}_{language}"
+        self._output_folder = output_folder
+        self._process: multiprocessing.Process | None = None
+        self._compile_folder: str | None = None
+        self._compile_start = 0.0
+        self._key_translation: Dict[object, object] = {}
+        self.expected_queries = None
+
+        self._smt_queries = 0
+        self._smt_time = 0.0
+        self._compiled_queries = 0
+        self._source_digest = source_digest(smt_manager.source_folder)
+        phi = smt_manager.phi
+        self._n_atoms = len(get_atoms(phi))
+        self._phi_size = get_fnode_size(phi)
+        self.stats = {
+            "language": language,
+            "folder": output_folder,
+            "atoms": self._n_atoms,
+            "phi size": self._phi_size}
+        smt_manager.details["adaptive planner"] = self.stats
+
+        # a structure compiled in a previous session is used right away, if it was compiled from the same formula
+        if self._is_compiled():
+            self._switch()
+        elif os.path.isdir(output_folder):
+            self.stats["previous structure"] = "ignored, compiled from a different formula or incomplete"
+
+    @property
+    def manager(self) -> QueryInterface:
+        """the manager currently answering the queries"""
+        if self._compiled_manager is not None:
+            return self._compiled_manager
+        return self._smt_manager
+
+    def __getattr__(self, name: str):
+        if name.startswith("__") or name in ("_smt_manager", "_compiled_manager", "_process"):
+            raise AttributeError(name)
+        self._poll()
+        attribute = getattr(self.manager, name)
+        if name in _QUERY_BODIES or name in _QUERY_METHODS or name in _ITEM_METHODS:
+            return self._wrap(name, attribute)
+        return attribute
+
+    def _wrap(self, name: str, method):
+        def wrapper(*args, **kwargs):
+            if name in _ITEM_METHODS and self._compiled_manager is not None and len(args) > 0:
+                args = (self._translate(args[0]),) + args[1:]
+            if name not in _QUERY_BODIES and name not in _QUERY_METHODS:
+                return method(*args, **kwargs)
+            start_time = time.time()
+            result = method(*args, **kwargs)
+            self._record(time.time() - start_time, len(result) if isinstance(result, list) else 1)
+            return result
+        return wrapper
+
+    def run_random_queries(
+            self,
+            kind: str,
+            queries: int,
+            random_seed: int | None = None,
+            timeout: int = 600) -> List[bool | None]:
+        """runs a stream of random queries one query at a time, so that the compilation can start
+        and the compiled structure can take over in the middle of the stream
+
+        The items of the queries are selected on the atoms of the SMT formula,
+        so the stream is the same whichever manager answers it
+
+        Args:
+            kind (str): the kind of query, one of "entail_clause", "implicant" or "condition"
+            queries (int): the number of queries to run
+            random_seed (int | None) [None]: the seed of the stream of queries. Defaults to None (current time).
+            timeout (int) [600]: the timeout for each query in seconds. Defaults to 600.
+
+        Returns:
+            List[bool|None]: the result of each query, None on timeout or for conditioning
+        """
+        return run_random_stream(self._smt_manager, self.run_random_query, kind, queries, random_seed, timeout)
+
+    def _translate(self, items):
+        """translates the items of a query from the keys of the SMT manager to the keys of the compiled structure"""
+        if isinstance(items, tuple):
+            return (self._key_translation[items[0]], items[1])
+        return [(self._key_translation[key], polarity) for key, polarity in items]
+
+    def _record(self, elapsed: float, queries: int) -> None:
+        """records the time taken by queries and starts the compilation when it is projected to pay off"""
+        if self._compiled_manager is not None:
+            self._compiled_queries += queries
+            self.stats["compiled queries"] = self._compiled_queries
+            return
+        self._smt_queries += queries
+        self._smt_time += elapsed
+        self.stats["smt queries"] = self._smt_queries
+        self.stats["smt query time"] = self._smt_time
+        if self._process is None and self._should_compile():
+            self._start_compilation()
+
+    def estimate_compile_time(self) -> float:
+        """estimates the compilation time of the formula from the time of the SMT queries
+
+        All-SMT enumeration makes about one solver call for each model of the Boolean abstraction it enumerates,
+        bounded here by the number of atoms times the size of the formula
+
+        Returns:
+            float: the estimated compilation time in seconds
+        """
+        mean_query_time = self._smt_time / max(1, self._smt_queries)
+        calls = min(2 ** min(self._n_atoms, 62), self._n_atoms * self._phi_size)
+        return calls * mean_query_time
+
+    def _should_compile(self) -> bool:
+        if self._smt_queries < MIN_OBSERVED_QUERIES:
+            return False
+        if self.expected_queries is not None:
+            remaining = self.expected_queries - self._smt_queries
+        else:
+            remaining = self._smt_queries
+        mean_query_time = self._smt_time / self._smt_queries
+        projected_savings = remaining * (mean_query_time - COMPILED_QUERY_TIME)
+        estimate = self.estimate_compile_time()
+        self.stats["estimated compile time"] = estimate
+        self.stats["projected savings"] = projected_savings
+        return projected_savings > estimate
+
+    def _start_compilation(self) -> None:
+        # the structure is compiled next to the final folder, so that it can be moved into place atomically
+        parent_folder = os.path.dirname(os.path.abspath(self._output_folder))
+        os.makedirs(parent_folder, exist_ok=True)
+        self._compile_folder = tempfile.mkdtemp(
+            prefix=f".{os.path.basename(os.path.abspath(self._output_folder))}.", dir=parent_folder)
+        # spawn, so that the compiler does not inherit the solver environments of this process
+        context = multiprocessing.get_context("spawn")
+        self._process = context.Process(
+            target=compile_artifact,
+            args=(self._smt_manager.source_folder, self._language, self._compile_folder))
+        self._compile_start = time.time()
+        self._process.start()
+        self.stats["compilation started after queries"] = self._smt_queries
+
+    def _poll(self) -> None:
+        """switches to the compiled structure if the compilation is over"""
+        if self._process is None or self._process.is_alive():
+            return
+        self._process.join()
+        self.stats["compile time"] = time.time() - self._compile_start
+        exitcode = self._process.exitcode
+        self._process = None
+        if exitcode != 0 or not self._is_compiled(self._compile_folder):
+            self.stats["compilation result"] = f"failed with exit code {exitcode}"
+            self._discard_compile_folder()
+            return
+        self._install_compiled()
+        self.stats["compilation result"] = "success"
+        self._switch()
+
+    def _install_compiled(self) -> None:
+        """saves the digest of the formula in the compiled folder and moves it into place, replacing a stale structure"""
+        with open(os.path.join(self._compile_folder, ADAPTIVE_SOURCE_DIGEST_FILE), "w", encoding='utf8') as out:
+            out.write(self._source_digest)
+        if os.path.isdir(self._output_folder):
+            shutil.rmtree(self._output_folder)
+        os.replace(self._compile_folder, self._output_folder)
+        self._compile_folder = None
+
+    def _discard_compile_folder(self) -> None:
+        if self._compile_folder is not None:
+            shutil.rmtree(self._compile_folder, ignore_errors=True)
+            self._compile_folder = None
+
+    def _is_compiled(self, folder: str | None = None) -> bool:
+        """checks if folder holds a complete structure in the language of the planner,
+        the output folder also needs the digest of the current formula
+
+        Args:
+            folder (str | None) [None]: the folder to check, the output folder if None
+
+        Returns:
+            bool: True if the structure can be loaded
+        """
+        if folder is None:
+            digest_file = os.path.join(self._output_folder, ADAPTIVE_SOURCE_DIGEST_FILE)
+            if not os.path.isfile(digest_file):
+                return False
+            with open(digest_file, "r", encoding='utf8') as file:
+                if file.read().strip() != self._source_digest:
+                    return False
+            folder = self._output_folder
+        if self._language == "tbdd":
+            return is_tbdd_loading_folder_correct(folder)
+        return is_tsdd_loading_folder_correct(folder)
+
+    def _switch(self) -> None:
+        start_time = time.time()
+        compiled_manager = self._loader(self._output_folder)
+        self._key_translation = {
+            key: compiled_manager.abstraction_mapping[atom]
+            for key, atom in self._smt_manager.refinement_mapping.items()
+            if atom in compiled_manager.abstraction_mapping}
+        self.stats["compiled normalized mapping"] = compiled_manager.details.get("normalized mapping")
+        if self._smt_manager.entailment_cache is not None:
+            compiled_manager.enable_entailment_cache()
+            self._smt_manager.details["compiled entailment cache"] = compiled_manager.details["entailment cache"]
+        # keep all the details of the session in the same dictionary
+        compiled_manager.details = self._smt_manager.details
+        self._compiled_manager = compiled_manager
+        self.stats["switched after queries"] = self._smt_queries
+        self.stats["compiled structure loading time"] = time.time() - start_time
+
+    def close(self) -> None:
+        """switches to the compiled structure if its compilation is over, otherwise stops the compilation"""
+        self._poll()
+        if self._process is None:
+            return
+        self._process.terminate()
+        self._process.join()
+        self._process = None
+        self._discard_compile_folder()
+        self.stats["compilation result"] = "interrupted"
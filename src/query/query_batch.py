@@ -0,0 +1,91 @@
+"""module to read batches of queries from a single file
+
+Two formats are supported:
+- an SMT-LIB file (.smt2 or .smt) with one assertion for each query, named with the :named annotation
+  (unnamed assertions are called query_N, where N is the position of the assertion in the file)
+- a JSONL file (.jsonl) with one query on each line, either a list of signed atoms
+  or an object {"name": NAME, "literals": LIST OF SIGNED ATOMS}.
+  A signed atom is a pair [ATOM, POLARITY], where ATOM is the SMT-LIB serialization of a normalized atom
+  of the compiled formula (as it appears in the details of the query tool) and POLARITY is true or false
+
+SMT-LIB batches are parsed once and their atoms are normalized once for the whole batch,
+JSONL batches do not need parsing nor normalization.
+"""
+import json
+from typing import Dict, FrozenSet, List, Tuple
+
+from pysmt.fnode import FNode
+from pysmt.shortcuts import Not, Or
+from pysmt.smtlib.parser import SmtLibParser
+
+from theorydd.formula import get_normalized, get_atoms, without_double_neg
+from theorydd.solvers.solver import SMTEnumerator
+
+
+def read_query_batch(batch_file: str, phi_atoms: FrozenSet[FNode], normalizer_solver: SMTEnumerator) -> List[Tuple[str, FNode]]:
+    """reads and normalizes a batch of queries
+
+    Args:
+        batch_file (str): the path to the .smt2, .smt or .jsonl file
+        phi_atoms (FrozenSet[FNode]): the normalized atoms of the compiled formula
+        normalizer_solver (SMTEnumerator): the solver used for the normalization of the atoms
+
+    Returns:
+        List[Tuple[str,FNode]]: the name and the normalized formula of each query, in the order of the file
+    """
+    if batch_file.endswith(".jsonl"):
+        return _read_jsonl_batch(batch_file, phi_atoms)
+    if batch_file.endswith(".smt2") or batch_file.endswith(".smt"):
+        return _read_smtlib_batch(batch_file, normalizer_solver)
+    raise ValueError("Query batch files must be in SMT-LIB (.smt2 or .smt) or JSONL (.jsonl) format")
+
+
+def _read_smtlib_batch(batch_file: str, normalizer_solver: SMTEnumerator) -> List[Tuple[str, FNode]]:
+    """reads the named assertions of an SMT-LIB file and normalizes all their atoms at once"""
+    script = SmtLibParser().get_script_fname(batch_file)
+    queries = []
+    for position, command in enumerate(script.filter_by_command_name("assert")):
+        formula = command.args[0]
+        annotations = script.annotations.annotations(formula)
+        if annotations is not None and "named" in annotations:
+            name = next(iter(annotations["named"]))
+        else:
+            name = f"query_{position}"
+        queries.append((name, formula))
+
+    # normalize each distinct atom once for the whole batch
+    atoms = set()
+    for _name, formula in queries:
+        atoms.update(get_atoms(formula))
+    converter = normalizer_solver.get_converter()
+    normalized_atoms = {atom: get_normalized(atom, converter) for atom in atoms}
+    return [(name, without_double_neg(formula.substitute(normalized_atoms))) for name, formula in queries]
+
+
+def _read_jsonl_batch(batch_file: str, phi_atoms: FrozenSet[FNode]) -> List[Tuple[str, FNode]]:
+    """reads the signed atom lists of a JSONL file"""
+    atoms_by_name: Dict[str, FNode] = {atom.serialize(): atom for atom in phi_atoms}
+    queries = []
+    with open(batch_file, "r", encoding='utf8') as file:
+        for position, line in enumerate(file):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            data = json.loads(line)
+            if isinstance(data, dict):
+                name = data.get("name", f"query_{position}")
+                literals = data["literals"]
+            else:
+                name = f"query_{position}"
+                literals = data
+            nodes = []
+            for atom_name, polarity in literals:
+                if atom_name not in atoms_by_name:
+                    raise ValueError(
+                        f"Query {name}: {atom_name} is not a normalized atom of the encoded formula")
+                atom = atoms_by_name[atom_name]
+                nodes.append(atom if polarity else Not(atom))
+            if len(nodes) == 0:
+                raise ValueError(f"Query {name} has no literals")
+            queries.append((name, nodes[0] if len(nodes) == 1 else Or(*nodes)))
+    return queries
@@ -3,15 +3,34 @@
 from abc import ABC, abstractmethod
 import time
 import os
-from typing import Dict, List, Tuple, final
+from typing import Callable, Dict, FrozenSet, List, Tuple, final
 
+import numpy as np
 from pysmt.fnode import FNode
 from pysmt.shortcuts import And, Or, Not
 
 from theorydd.solvers.mathsat_total import MathSATTotalEnumerator
+from theorydd.solvers.lemma_extractor import extract
 from theorydd.formula import get_normalized, get_atoms, without_double_neg, read_phi
 
-from src.query.util import is_clause, is_cube, is_term, normalize_refinement, select_random_items, time_limit, LocalTimeoutException
+from src.normalized_mapping import load_normalized_mapping
+from src.query.entailment_cache import ClauseEntailmentCache
+from src.query.query_batch import read_query_batch
+from src.query.literal_index import LITERAL_INDEX_FILE, LiteralIndex, artifact_fingerprint
+from src.query.util import (
+    is_clause,
+    is_cube,
+    is_term,
+    normalize_refinement,
+    select_random_items,
+    percentile,
+    read_literal_weights,
+    time_limit,
+    LocalTimeoutException,
+    UnsupportedQueryException)
+from src.query.constants import RANDOM_QUERY_KINDS
+from src.seeds import derive_seed
+from src.theory_lemmas import ARTIFACT_LEMMAS_FILE, load_artifact_lemmas, save_artifact_lemmas
 
 
 class QueryInterface(ABC):
@@ -23,11 +42,16 @@ class QueryInterface(ABC):
     # solver used for normalization of input
     normalizer_solver: MathSATTotalEnumerator
     details: Dict[str, object]
+    # backbone and implicant literals, used to answer unit queries without the structure
+    literal_index: LiteralIndex | None
+    # results of clausal entailment for the session, None when disabled
+    entailment_cache: ClauseEntailmentCache | None
 
     def __init__(self,
                  source_folder: str,
                  refinement_mapping: Dict[object, FNode] | None = None,
                  abstraction_mapping: Dict[FNode, object] | None = None,
+                 normalized: bool = False,
                  ):
         """
         initialize the query object.
@@ -38,6 +62,7 @@ class QueryInterface(ABC):
             source_folder (str): the path to the folder where the serialized compiled formula is stored
             refinement_mapping (Dict[int, FNode]) [None]: the mapping of the indices on the compiled formula's abstraction to the atoms in its refinement
             abstraction_mapping (Dict[FNode, int]) [None]: the mapping of the atoms of the formula to the indices in the compiled formula's abstraction
+            normalized (bool) [False]: True if the atoms of the mapping are already normalized
         """
         self.source_folder = source_folder
         if (self.source_folder.endswith("/")):
@@ -48,16 +73,30 @@ class QueryInterface(ABC):
         if refinement_mapping is None:
             refinement_mapping = {v: k for k, v in abstraction_mapping.items()}
 
-        # normalize atoms in the mapping
+        # normalize atoms in the mapping, unless the compiler already saved them normalized
         self.normalizer_solver = MathSATTotalEnumerator()
-        self.refinement_mapping = normalize_refinement(
-            refinement_mapping, self.normalizer_solver)
+        normalized_mapping = None
+        mapping_source = "loaded"
+        if normalized:
+            normalized_mapping = dict(refinement_mapping)
+            mapping_source = "provided"
+        elif os.path.isdir(self.source_folder):
+            normalized_mapping = load_normalized_mapping(self.source_folder, refinement_mapping)
+        if normalized_mapping is None:
+            mapping_source = "computed"
+            normalized_mapping = normalize_refinement(
+                refinement_mapping, self.normalizer_solver)
+        self.refinement_mapping = normalized_mapping
 
         # compute reverse mapping to generate the abstraction funciton
         self.abstraction_mapping = {
             v: k for k, v in self.refinement_mapping.items()}
 
-        self.details = {}
+        self.details = {"normalized mapping": mapping_source}
+        self.literal_index = None
+        self.entailment_cache = None
+        self._phi_atoms = None
+        self._literal_table = None
 
     @abstractmethod
     def _check_consistency(self) -> Tuple[bool, float]:
@@ -138,15 +177,25 @@ class QueryInterface(ABC):
         clause = get_normalized(clause, self.normalizer_solver.get_converter())
         clause = without_double_neg(clause)
 
+        return self._clause_can_entail(clause)
+
+    @final
+    def _clause_can_entail(self, clause: FNode) -> FNode:
+        """checks if the provided normalized clause can be used to check entailment
+
+        raises exceptions if something is wrong with the clause
+
+        Args:
+            clause (FNode): the normalized clause
+
+        Returns:
+            (FNode): the clause"""
         if not is_term(clause) and not is_clause(clause):
             raise ValueError(
                 "The clause must be a literal or a disjunction of literals")
 
         # check that the clause is on the same atoms as phi
-        phi_atoms = set()
-        for value in self.abstraction_mapping.keys():
-            phi_atoms.add(get_atoms(value)[0])
-        phi_atoms = frozenset(phi_atoms)
+        phi_atoms = self._get_phi_atoms()
         clause_atoms = get_atoms(clause)
         if not phi_atoms.issuperset(clause_atoms):
             raise ValueError(
@@ -155,6 +204,44 @@ class QueryInterface(ABC):
                 "The atoms in the encoded formula are: {}".format(clause_atoms, phi_atoms))
         return clause
 
+    @final
+    def _get_phi_atoms(self) -> FrozenSet[FNode]:
+        """the atoms of the encoded formula, computed once from the abstraction mapping
+
+        Returns:
+            FrozenSet[FNode]: the normalized atoms"""
+        if self._phi_atoms is None:
+            self._phi_atoms = frozenset(get_atoms(value)[0] for value in self.abstraction_mapping.keys())
+        return self._phi_atoms
+
+    @final
+    def _check_entail_clause_and_record(self, query_name: str, clause: FNode, timeout: int) -> bool | None:
+        """checks the entailment of a valid normalized clause and records it in the details under query_name
+
+        Args:
+            query_name (str): the name of the query in the details
+            clause (FNode): the clause
+            timeout (int): the timeout for the entailment check in seconds
+
+        Returns:
+            bool | None: True if the clause is entailed, False otherwise, None on timeout"""
+        self.details["entailment"][query_name] = {}
+        self.details["entailment"][query_name]["entailment clause"] = str(clause)
+        start_time = time.time()
+        try:
+            with time_limit(timeout):
+                clause_items = self._literal_items(clause)
+                result, load_time = self._entail_clause_shortcut(clause_items), 0.0
+                if result is None:
+                    result, load_time = self._check_entail_clause_body(clause)
+                    self._store_entailment(clause_items, result)
+        except LocalTimeoutException:
+            self.details["entailment"][query_name]["clause entailment result"] = "timeout"
+            return None
+        self.details["entailment"][query_name]["clause entailment result"] = result
+        self.details["entailment"][query_name]["clause entailment time"] = time.time() - start_time - load_time
+        return result
+
     def check_entail_clause(self, clause_files: List[str],timeout:int=600,incrementality:bool=False) -> List[bool|None]:
         """function to check if the encoded formula entails the clause specifoied in the clause_file
 
@@ -173,22 +260,69 @@ class QueryInterface(ABC):
                 print(f"File not found: {clause_file}")
                 results.append(None)
                 continue
-            self.details["entailment"][clause_file] = {}
             clause = self._clause_file_can_entail(clause_file)
-            self.details["entailment"][clause_file]["entailment clause"] = str(clause)
-            start_time = time.time()
-            try:
-                with time_limit(timeout):
-                    result, load_time = self._check_entail_clause_body(clause)
-            except LocalTimeoutException:
-                self.details["entailment"][clause_file]["clause entailment result"] = "timeout"
-                results.append(None)
-                continue
-            self.details["entailment"][clause_file]["clause entailment result"] = result
-            self.details["entailment"][clause_file]["clause entailment time"] = time.time() - start_time - load_time
-            results.append(result)
+            results.append(self._check_entail_clause_and_record(clause_file, clause, timeout))
+        return results
+
+    @final
+    def check_entail_clause_batch(self, batch_file: str, timeout: int = 600) -> Dict[str, bool | None]:
+        """function to check if the encoded formula entails each clause of a query batch file
+
+        The batch is parsed and normalized once, see src.query.query_batch for the supported formats
+
+        Args:
+            batch_file (str): the path to the SMT-LIB or JSONL file with the clauses
+            timeout (int) [600]: the timeout for each entailment check in seconds. Defaults to 600.
+
+        Returns:
+            Dict[str,bool|None]: for each query name, True if the clause is entailed, False otherwise, None on timeout
+        """
+        start_time = time.time()
+        queries = read_query_batch(batch_file, self._get_phi_atoms(), self.normalizer_solver)
+        self.details["entailment batch parsing time"] = time.time() - start_time
+        self.details.setdefault("entailment", {})
+        results = {}
+        for name, clause in queries:
+            results[name] = self._check_entail_clause_and_record(name, self._clause_can_entail(clause), timeout)
         return results
 
+    @final
+    def enable_entailment_cache(self) -> None:
+        """function to cache the results of clausal entailment for the rest of the session,
+        so that clauses subsumed by (or subsuming) an already checked clause are answered from the cache"""
+        self.entailment_cache = ClauseEntailmentCache()
+        self.details["entailment cache"] = self.entailment_cache.get_stats()
+
+    @final
+    def _entail_clause_shortcut(self, clause_items: List[Tuple[object, bool]]) -> bool | None:
+        """answers clausal entailment without the structure, from the entailment cache or the literal index
+
+        Args:
+            clause_items (List[Tuple[object,bool]]): the items in the clause
+
+        Returns:
+            bool | None: the result, or None if the structure must be queried
+        """
+        result = None
+        if self.entailment_cache is not None:
+            result = self.entailment_cache.lookup(clause_items)
+            self.details["entailment cache"] = self.entailment_cache.get_stats()
+        if result is None and self.literal_index is not None:
+            result = self.literal_index.entails_clause(clause_items)
+        return result
+
+    @final
+    def _store_entailment(self, clause_items: List[Tuple[object, bool]], result: bool | None) -> None:
+        """stores the result of clausal entailment in the entailment cache, if enabled
+
+        Args:
+            clause_items (List[Tuple[object,bool]]): the items in the clause
+            result (bool | None): the result of the entailment check, None if it did not complete
+        """
+        if self.entailment_cache is not None and result is not None:
+            self.entailment_cache.store(clause_items, result)
+            self.details["entailment cache"] = self.entailment_cache.get_stats()
+
     @abstractmethod
     def _check_entail_clause_random_body(self, clause_items: List[Tuple[object, bool]]) -> Tuple[bool, float]:
         """where the actual entailment checking for random clauses is done
@@ -221,7 +355,10 @@ class QueryInterface(ABC):
             self.refinement_mapping.keys(), random_seed=seed)
         self.details["random entailment clause"] = str(self._get_refinement_clause(
             clause_items).serialize())
-        result, load_time = self._check_entail_clause_random_body(clause_items)
+        result, load_time = self._entail_clause_shortcut(clause_items), 0.0
+        if result is None:
+            result, load_time = self._check_entail_clause_random_body(clause_items)
+            self._store_entailment(clause_items, result)
         self.details["random clause entailment result"] = result
         self.details["random clause entailment time"] = time.time() - start_time - load_time
         return result
@@ -267,15 +404,25 @@ class QueryInterface(ABC):
         term = get_normalized(term, self.normalizer_solver.get_converter())
         term = without_double_neg(term)
 
+        return self._term_can_be_implicant(term)
+
+    @final
+    def _term_can_be_implicant(self, term: FNode) -> FNode:
+        """checks if the provided normalized term can be used to query for implicant
+
+        raises exceptions if something is wrong with the term
+
+        Args:
+            term (FNode): the normalized term
+
+        Returns:
+            (FNode): the term"""
         if not is_term(term):
             raise ValueError(
                 "The term must be a literal which is an atom or a negated atom")
 
         # check that the term is on the same atoms as phi
-        phi_atoms = set()
-        for value in self.abstraction_mapping.keys():
-            phi_atoms.add(get_atoms(value)[0])
-        phi_atoms = frozenset(phi_atoms)
+        phi_atoms = self._get_phi_atoms()
         term_atom = get_atoms(term)[0]
         if term_atom not in phi_atoms:
             raise ValueError(
@@ -302,7 +449,7 @@ class QueryInterface(ABC):
         start_time = time.time()
         try:
             with time_limit(600):
-                result, loading_time = self._check_implicant_body(term)
+                result, loading_time = self._check_implicant_term(term)
         except LocalTimeoutException:
             self.details["implicant result"] = "timeout"
             return False
@@ -310,6 +457,50 @@ class QueryInterface(ABC):
         self.details["implicant time"] = time.time() - start_time - loading_time
         return result
 
+    @final
+    def _check_implicant_term(self, term: FNode) -> Tuple[bool, float]:
+        """checks if a valid normalized term is an implicant, using the literal index when loaded
+
+        Returns:
+            Tuple[bool,float]: the result of the implicant checking and the time taken to load the structure"""
+        if self.literal_index is not None:
+            return self.literal_index.is_implicant(self._literal_items(term)[0]), 0.0
+        return self._check_implicant_body(term)
+
+    @final
+    def check_implicant_batch(self, batch_file: str, timeout: int = 600) -> Dict[str, bool | None]:
+        """function to check if each term of a query batch file is an implicant for the encoded formula
+
+        The batch is parsed and normalized once, see src.query.query_batch for the supported formats
+
+        Args:
+            batch_file (str): the path to the SMT-LIB or JSONL file with the terms
+            timeout (int) [600]: the timeout for each implicant check in seconds. Defaults to 600.
+
+        Returns:
+            Dict[str,bool|None]: for each query name, True if the term is an implicant, False otherwise, None on timeout
+        """
+        start_time = time.time()
+        queries = read_query_batch(batch_file, self._get_phi_atoms(), self.normalizer_solver)
+        self.details["implicant batch parsing time"] = time.time() - start_time
+        self.details["implicant batch"] = {}
+        results = {}
+        for name, term in queries:
+            term = self._term_can_be_implicant(term)
+            self.details["implicant batch"][name] = {"implicant term": str(term)}
+            start_time = time.time()
+            try:
+                with time_limit(timeout):
+                    result, loading_time = self._check_implicant_term(term)
+            except LocalTimeoutException:
+                self.details["implicant batch"][name]["implicant result"] = "timeout"
+                results[name] = None
+                continue
+            self.details["implicant batch"][name]["implicant result"] = result
+            self.details["implicant batch"][name]["implicant time"] = time.time() - start_time - loading_time
+            results[name] = result
+        return results
+
     @abstractmethod
     def _check_implicant_body(self, term: FNode) -> Tuple[bool, float]:
         """where the actual implicant checking is done
@@ -351,7 +542,10 @@ class QueryInterface(ABC):
         refined_term = self.refinement_mapping[term_item[0]] if term_item[1] else Not(
             self.refinement_mapping[term_item[0]])
         self.details["random implicant term"] = str(refined_term.serialize())
-        result, load_time = self._check_implicant_random_body(term_item)
+        if self.literal_index is not None:
+            result, load_time = self.literal_index.is_implicant(term_item), 0.0
+        else:
+            result, load_time = self._check_implicant_random_body(term_item)
         self.details["random implicant checking result"] = result
         self.details["random implicant checking time"] = time.time() - start_time - load_time
         return result
@@ -413,6 +607,188 @@ class QueryInterface(ABC):
             return
         self.details["model enumeration time"] = time.time() - start_time - load_time
 
+    def _marginal_counts(self) -> Tuple[Dict[object, Tuple[int, int]], int, int, float]:
+        """where the marginal counts for all literals are computed,
+        managers that support the query override this method
+
+        Returns:
+            Dict[object,Tuple[int,int]]: for each atom in the refinement mapping, the number of models
+                where the atom is true and the number of models where the atom is false
+            int: the number of variables the models are counted on
+            int: the number of models of the compiled formula
+            float: the structure loading time
+        """
+        raise UnsupportedQueryException(
+            "Marginal counts are not supported by this compiled language")
+
+    @final
+    def marginal_counts(self, timeout: int = 600) -> Dict[object, Tuple[int, int]]:
+        """function to count, for every literal, the models of the encoded formula where the literal is true
+
+        The counts also give the backbone of the formula (literals that are true in all models),
+        which is saved in the details together with the counts
+
+        Args:
+            timeout (int) [600]: the timeout for the computation in seconds. Defaults to 600.
+
+        Returns:
+            Dict[object,Tuple[int,int]]: for each atom in the refinement mapping, the number of models
+                where the atom is true and the number of models where the atom is false
+        """
+        start_time = time.time()
+        try:
+            with time_limit(timeout):
+                marginals, _n_vars, _model_count, load_time = self._marginal_counts()
+        except LocalTimeoutException:
+            self.details["marginal counts"] = "timeout"
+            return {}
+        self.details["marginal counts time"] = time.time() - start_time - load_time
+        counts = {}
+        backbone = []
+        for key, (positive, negative) in marginals.items():
+            atom = self.refinement_mapping[key]
+            counts[atom.serialize()] = {"positive": positive, "negative": negative}
+            if positive > 0 and negative == 0:
+                backbone.append(atom.serialize())
+            elif negative > 0 and positive == 0:
+                backbone.append(Not(atom).serialize())
+        self.details["marginal counts"] = counts
+        self.details["backbone"] = backbone
+        return marginals
+
+    def _weighted_model_counts(
+            self,
+            weights: Dict[object, Tuple[np.ndarray, np.ndarray]],
+            batch: int) -> Tuple[np.ndarray, float]:
+        """where the weighted model counts for a batch of weight vectors are computed,
+        managers that support the query override this method
+
+        Args:
+            weights (Dict[object,Tuple[np.ndarray,np.ndarray]]): for each atom in the refinement mapping with a weight,
+                the weights of its positive and negative literal in every weight vector,
+                the literals of the other atoms weigh 1
+            batch (int): the number of weight vectors
+
+        Returns:
+            np.ndarray: the weighted model count for each weight vector
+            float: the structure loading time
+        """
+        raise UnsupportedQueryException(
+            "Weighted model counting is not supported by this compiled language")
+
+    @final
+    def weighted_model_count(self, weights_file: str, timeout: int = 600) -> List[float]:
+        """function to compute the weighted model count of the encoded formula for a batch of weight vectors,
+        evaluating the compiled structure once as an arithmetic circuit for all the weight vectors
+
+        Args:
+            weights_file (str): the path to the JSON file with the weights of the literals of the atoms
+            timeout (int) [600]: the timeout for the computation in seconds. Defaults to 600.
+
+        Returns:
+            List[float]: the weighted model count for each weight vector
+        """
+        atom_weights, batch = read_literal_weights(weights_file)
+        keys = {atom.serialize(): key for key, atom in self.refinement_mapping.items()}
+        weights = {}
+        for atom, literal_weights in atom_weights.items():
+            if atom not in keys:
+                raise ValueError(f"Atom {atom} is not in the compiled formula")
+            weights[keys[atom]] = literal_weights
+        self.details["weight vectors"] = batch
+
+        start_time = time.time()
+        try:
+            with time_limit(timeout):
+                counts, load_time = self._weighted_model_counts(weights, batch)
+        except LocalTimeoutException:
+            self.details["weighted model counts"] = "timeout"
+            return []
+        self.details["weighted model counting time"] = time.time() - start_time - load_time
+        counts = [float(count) for count in counts]
+        self.details["weighted model counts"] = counts
+        return counts
+
+    @final
+    def load_literal_index(self, timeout: int = 600) -> None:
+        """function to load the index of backbone and implicant literals saved with the compiled formula,
+        computing and saving it if it is missing or was computed on a different artifact
+
+        Once loaded, unit clause entailment and implicant checks are answered from the index
+
+        The index is skipped, and the reason recorded in the details, when the compiled formula is not loaded
+        from a folder or its language does not support marginal counts
+
+        Args:
+            timeout (int) [600]: the timeout for the computation of the index in seconds. Defaults to 600.
+        """
+        if not os.path.isdir(self.source_folder):
+            # the index is saved with the compiled formula
+            self.details["literal index"] = "unsupported: the compiled formula is not loaded from a folder"
+            return
+        start_time = time.time()
+        index_file = os.path.join(self.source_folder, LITERAL_INDEX_FILE)
+        fingerprint = artifact_fingerprint(self.source_folder)
+        self.literal_index = LiteralIndex.load(index_file, fingerprint)
+        if self.literal_index is not None:
+            self.details["literal index"] = "loaded"
+            self.details["literal index time"] = time.time() - start_time
+            return
+        try:
+            with time_limit(timeout):
+                marginals, n_vars, model_count, load_time = self._marginal_counts()
+        except LocalTimeoutException:
+            self.details["literal index"] = "timeout"
+            return
+        except UnsupportedQueryException as e:
+            self.details["literal index"] = f"unsupported: {e}"
+            return
+        self.literal_index = LiteralIndex.from_marginals(marginals, n_vars, model_count)
+        self.literal_index.save(index_file, fingerprint)
+        self.details["literal index"] = "computed"
+        self.details["literal index time"] = time.time() - start_time - load_time
+
+    @final
+    def _get_literal_table(self) -> Dict[int, Tuple[object, bool]]:
+        """the table from the node id of every normalized literal, in both polarities,
+        to the signed key in the abstraction, built once from the abstraction mapping
+
+        Atoms that appear negated as keys of the abstraction mapping are handled here,
+        so that translating a query only takes one lookup for each literal
+
+        Returns:
+            Dict[int,Tuple[object,bool]]: for each literal node id, the pair (atom key in the refinement mapping, polarity)
+        """
+        if self._literal_table is None:
+            self._literal_table = {}
+            for node, key in self.abstraction_mapping.items():
+                if node.is_not():
+                    # the key is the negation of the atom
+                    self._literal_table[node.arg(0).node_id()] = (key, False)
+                    self._literal_table[node.node_id()] = (key, True)
+                else:
+                    self._literal_table[node.node_id()] = (key, True)
+                    self._literal_table[Not(node).node_id()] = (key, False)
+        return self._literal_table
+
+    @final
+    def _literal_items(self, phi: FNode) -> List[Tuple[object, bool]]:
+        """the literals of a normalized clause, cube or term as pairs (atom key in the refinement mapping, polarity)
+
+        Args:
+            phi (FNode): the clause, cube or term
+
+        Returns:
+            List[Tuple[object,bool]]: the literals
+        """
+        table = self._get_literal_table()
+        literals = phi.args() if phi.is_or() or phi.is_and() else (phi,)
+        try:
+            return [table[literal.node_id()] for literal in literals]
+        except KeyError as error:
+            raise ValueError(
+                "Cannot translate a formula which is not a cube, clause or term on the atoms of the encoded formula!") from error
+
     @final
     def _alpha_file_can_condition(self, alpha_file: str) -> FNode:
         """checks if the provided input file can be used to apply conditioning
@@ -436,10 +812,7 @@ class QueryInterface(ABC):
                 "The alpha must be a literal or a conjunction of literals")
 
         # check that alpha is on the same atoms as phi
-        phi_atoms = set()
-        for value in self.abstraction_mapping.keys():
-            phi_atoms.add(get_atoms(value)[0])
-        phi_atoms = frozenset(phi_atoms)
+        phi_atoms = self._get_phi_atoms()
         alpha_atoms = frozenset(get_atoms(alpha))
         if not phi_atoms.issuperset(alpha_atoms):
             raise ValueError(
@@ -526,6 +899,156 @@ class QueryInterface(ABC):
             self.refinement_mapping[x[0]]) for x in cube_items]
         return And(*nodes)
 
+    @final
+    def _run_random_query(self, kind: str, items: List[Tuple[object, bool]]) -> Tuple[bool | None, float]:
+        """answers a random query of the given kind on the selected items
+
+        Returns:
+            Tuple[bool|None,float]: the result of the query (None for conditioning) and the time taken to load the structure"""
+        if kind == "entail_clause":
+            result = self._entail_clause_shortcut(items)
+            if result is not None:
+                return result, 0.0
+            result, load_time = self._check_entail_clause_random_body(items)
+            self._store_entailment(items, result)
+            return result, load_time
+        if kind == "implicant":
+            if self.literal_index is not None:
+                return self.literal_index.is_implicant(items[0]), 0.0
+            return self._check_implicant_random_body(items[0])
+        return None, self._condition_random_body(items)
+
+    @final
+    def run_random_query(
+            self,
+            items: List[Tuple[object, bool]],
+            kind: str,
+            timeout: int = 600) -> Tuple[bool | None, float | None]:
+        """function to answer one query of a stream of random queries on the selected items
+
+        Args:
+            items (List[Tuple[object,bool]]): the items of the query, keyed as in the refinement mapping
+            kind (str): the kind of query, one of "entail_clause", "implicant" or "condition"
+            timeout (int) [600]: the timeout for the query in seconds. Defaults to 600.
+
+        Returns:
+            bool | None: the result of the query, None on timeout or for conditioning
+            float | None: the time taken by the query without loading the structure, None on timeout
+        """
+        start_time = time.time()
+        try:
+            with time_limit(timeout):
+                result, load_time = self._run_random_query(kind, items)
+        except LocalTimeoutException:
+            return None, None
+        return result, time.time() - start_time - load_time
+
+    @final
+    def run_random_queries(
+            self,
+            kind: str,
+            queries: int,
+            random_seed: int | None = None,
+            timeout: int = 600) -> List[bool | None]:
+        """function to run many random queries of the same kind on the loaded structure
+
+        Query i uses a generator seeded with a seed derived from random_seed and i,
+        so that every query of the stream can be reproduced on its own.
+        Per-query results and times and aggregate statistics are saved in the details
+
+        Args:
+            kind (str): the kind of query, one of "entail_clause", "implicant" or "condition"
+            queries (int): the number of queries to run
+            random_seed (int | None) [None]: the seed of the stream of queries. Defaults to None (current time).
+            timeout (int) [600]: the timeout for each query in seconds. Defaults to 600.
+
+        Returns:
+            List[bool|None]: the result of each query, None on timeout or for conditioning
+        """
+        return run_random_stream(self, self.run_random_query, kind, queries, random_seed, timeout)
+
+    @final
+    def _combination_lemmas(
+            self,
+            operation: str,
+            combined: FNode | None,
+            tlemmas: List[FNode] | None = None) -> List[FNode]:
+        """the theory lemmas needed to make the combination of the compiled formula with another formula theory-consistent,
+        their number and enumeration time are recorded in the details under operation
+
+        Both formulas are already theory-consistent on their own atoms, so the Boolean models of the combination
+        can only be T-inconsistent on sets of literals that mix atoms of the two formulas.
+        The lemmas are enumerated by All-SMT on the refinement of the combination, which only finds the mixed ones
+
+        Args:
+            operation (str): the name of the operation in the details
+            combined (FNode | None): the refinement of the combined diagram, None when no lemma can be missing
+            tlemmas (List[FNode] | None) [None]: the lemmas, when they were already enumerated
+
+        Returns:
+            List[FNode]: the lemmas
+        """
+        start_time = time.time()
+        if tlemmas is None:
+            if combined is None:
+                tlemmas = []
+            else:
+                _sat_result, tlemmas, _boolean_mapping = extract(
+                    combined, MathSATTotalEnumerator(), computation_logger={})
+        self.details[f"{operation} lemmas"] = len(tlemmas)
+        self.details[f"{operation} lemmas time"] = time.time() - start_time
+        return tlemmas
+
+    @final
+    def _saved_lemmas(self, folder: str | None = None) -> List[FNode] | None:
+        """the theory lemmas saved with a T-BDD or T-SDD
+
+        Args:
+            folder (str | None) [None]: the folder of the artifact, the source folder if None
+
+        Returns:
+            List[FNode] | None: the lemmas, None if the artifact is in memory or was saved without them
+        """
+        if folder is None:
+            folder = self.source_folder
+        if folder == "":
+            return None
+        return load_artifact_lemmas(folder)
+
+    @final
+    def _result_lemmas(self, tlemmas: List[FNode], data_folder: str | None = None) -> List[FNode] | None:
+        """the lemmas conjoined in the result of an operation:
+        the lemmas saved with the compiled formula and with the data in data_folder, and the new ones
+
+        Args:
+            tlemmas (List[FNode]): the lemmas enumerated by the operation
+            data_folder (str | None) [None]: the folder of the other operand, None for unary operations
+
+        Returns:
+            List[FNode] | None: the lemmas, None if the lemmas of an operand were not saved
+        """
+        result_lemmas = self._saved_lemmas()
+        if result_lemmas is not None and data_folder is not None:
+            other_lemmas = self._saved_lemmas(data_folder)
+            result_lemmas = None if other_lemmas is None else result_lemmas + other_lemmas
+        if result_lemmas is None:
+            return None
+        return list(dict.fromkeys(result_lemmas + tlemmas))
+
+    @final
+    def _save_result_lemmas(self, output_path: str, tlemmas: List[FNode] | None) -> None:
+        """saves the lemmas of the result of an operation next to it,
+        a stale lemma file is removed when the lemmas are not known
+
+        Args:
+            output_path (str): the folder where the result is saved
+            tlemmas (List[FNode] | None): the lemmas of the result, None if they are not known
+        """
+        if tlemmas is not None:
+            save_artifact_lemmas(output_path, tlemmas)
+        elif os.path.isfile(os.path.join(output_path, ARTIFACT_LEMMAS_FILE)):
+            os.remove(os.path.join(output_path, ARTIFACT_LEMMAS_FILE))
+
     @abstractmethod
     def check_entail(self, data_folder: str) -> bool:
         """function to check entailment of the compiled formula with respect to the data in data_folder.
@@ -578,3 +1101,68 @@ class QueryInterface(ABC):
         Returns:
             Dict[str,object]: the details of the last query"""
         return self.details
+
+
+def run_random_stream(
+        manager: QueryInterface,
+        answer: Callable[[List[Tuple[object, bool]], str, int], Tuple[bool | None, float | None]],
+        kind: str,
+        queries: int,
+        random_seed: int | None,
+        timeout: int) -> List[bool | None]:
+    """runs a stream of random queries of the same kind, one query at a time,
+    selecting the items of each query on the atoms of manager and saving the results in its details
+
+    Args:
+        manager (QueryInterface): the manager whose atoms the queries are selected on
+        answer (Callable): the function answering one query, with the signature of QueryInterface.run_random_query
+        kind (str): the kind of query, one of "entail_clause", "implicant" or "condition"
+        queries (int): the number of queries to run
+        random_seed (int | None): the seed of the stream of queries, None for the current time
+        timeout (int): the timeout for each query in seconds
+
+    Returns:
+        List[bool|None]: the result of each query, None on timeout or for conditioning
+    """
+    if kind not in RANDOM_QUERY_KINDS:
+        raise ValueError(f"Invalid random query kind {kind}. Valid kinds are {RANDOM_QUERY_KINDS}")
+    seed = int(time.time()) if random_seed is None else random_seed
+    keys = list(manager.refinement_mapping.keys())
+    records = []
+    results = []
+    times = []
+    for index in range(queries):
+        query_seed = derive_seed(seed, index)
+        items = select_random_items(
+            keys, amount=1 if kind == "implicant" else None, random_seed=query_seed)
+        if kind == "entail_clause":
+            query = manager._get_refinement_clause(items)  # pylint: disable=protected-access
+        else:
+            query = manager._get_refinement_cube(items)  # pylint: disable=protected-access
+        record = {"seed": query_seed, "query": query.serialize()}
+        records.append(record)
+        result, elapsed = answer(items, kind, timeout)
+        results.append(result)
+        if elapsed is None:
+            record["result"] = "timeout"
+            continue
+        record["time"] = elapsed
+        record["result"] = result
+        times.append(elapsed)
+
+    stats = {
+        "queries": queries,
+        "timeouts": queries - len(times),
+        "true results": sum(1 for result in results if result is True)}
+    if len(times) > 0:
+        stats["total time"] = sum(times)
+        stats["mean time"] = sum(times) / len(times)
+        stats["min time"] = min(times)
+        stats["max time"] = max(times)
+        for pct in (50, 95, 99):
+            stats[f"p{pct} time"] = percentile(times, pct)
+    manager.details[f"random {kind} queries"] = {
+        "seed": seed,
+        "stats": stats,
+        "queries": records}
+    return results
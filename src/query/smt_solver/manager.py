@@ -12,6 +12,7 @@ from theorydd.formula import read_phi as _get_phi, save_phi as _save_phi, get_at
 from theorydd.solvers.mathsat_total import MathSATTotalEnumerator
 
 from src.query.query_interface import QueryInterface
+from src.query.smt_solver.model_counting import count_models_streaming, approximate_count
 
 class Timer(object): # pylint: disable=too-few-public-methods,locally-disabled
     """A simple timer object."""
@@ -54,6 +55,7 @@ class SMTQueryManager(QueryInterface):
 
     loading_time: float
     phi : FNode
+    approximate_counting: Tuple[float, float, int | None] | None
 
     def __init__(
             self,
@@ -83,9 +85,20 @@ class SMTQueryManager(QueryInterface):
         self.abstraction_mapping = self.refinement_mapping
 
         self.incremental = False
+        self.approximate_counting = None
         
         
 
+    def enable_approximate_counting(self, epsilon: float = 0.8, delta: float = 0.2, seed: int | None = None) -> None:
+        """function to approximate model counts with random XOR constraints instead of counting exactly
+
+        Args:
+            epsilon (float) [0.8]: the tolerance, the estimate is within a factor (1 + epsilon) of the count
+            delta (float) [0.2]: the confidence, the tolerance is guaranteed with probability at least 1 - delta
+            seed (int | None) [None]: the seed for the random XOR constraints
+        """
+        self.approximate_counting = (epsilon, delta, seed)
+
     def _check_consistency(self) -> Tuple[bool, float]:
         """function to check if the encoded formula is consistent
 
@@ -186,7 +199,11 @@ class SMTQueryManager(QueryInterface):
             clause = self._clause_file_can_entail(clause_file)
             self.details["entailment"][clause_file]["entailment clause"] = str(clause)
             start_time = time.time()
-            cur_result, load_time = self._check_entail_clause_body(clause)
+            clause_items = self._literal_items(clause)
+            cur_result, load_time = self._entail_clause_shortcut(clause_items), 0.0
+            if cur_result is None:
+                cur_result, load_time = self._check_entail_clause_body(clause)
+                self._store_entailment(clause_items, cur_result)
             if cur_result is None:
                 self.details["entailment"][clause_file]["clause entailment result"] = "timeout"
                 results.append(None)
@@ -259,10 +276,16 @@ class SMTQueryManager(QueryInterface):
         phi = _get_phi(self.source_folder)
         load_time = time.time() - start_time
 
-        # count models
-        solver = MathSATTotalEnumerator()
-        solver.check_all_sat(phi, boolean_mapping=None)
-        models_total = len(solver.get_models())
+        # count models in the all-SAT callback, without storing them
+        atoms = list(_get_atoms(phi))
+        if self.approximate_counting is None:
+            self.details["model count method"] = "exact"
+            models_total = count_models_streaming(phi, atoms)
+        else:
+            epsilon, delta, seed = self.approximate_counting
+            self.details["model count method"] = {
+                "approximate": {"epsilon": epsilon, "delta": delta, "seed": seed}}
+            models_total = approximate_count(phi, atoms, epsilon, delta, seed)
 
         return models_total, load_time
 
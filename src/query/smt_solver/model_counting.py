@@ -0,0 +1,140 @@
+"""module for the model counting of SMT formulas through the MathSAT all-SAT interface
+
+Models are counted on the atoms of the formula, as in the total enumeration of MathSATTotalEnumerator,
+but they are counted in the all-SAT callback and never stored.
+
+The approximate counter follows ApproxMC (Chakraborty, Meel and Vardi, 2016):
+the assignments to the atoms are split in cells by random XOR constraints over the atoms
+(the Boolean abstraction of the formula), the models in a small cell are counted and
+scaled by the number of cells. The median of the estimates of several independent runs
+is within a factor (1 + epsilon) of the exact count with probability at least 1 - delta.
+"""
+import math
+import random
+import statistics
+from typing import List
+
+import mathsat
+from pysmt.fnode import FNode
+from pysmt.shortcuts import Solver, Iff, Not, TRUE
+
+_SOLVER_OPTIONS = {
+    "preprocessor.toplevel_propagation": "false",
+    "preprocessor.simplification": "0",
+}
+
+
+class _StreamingCounter:  # pylint: disable=too-few-public-methods
+    """all-SAT callback that counts the models on the fly,
+    a model that leaves k atoms unassigned stands for 2^k assignments"""
+
+    def __init__(self, n_atoms: int, bound: int | None = None):
+        self.n_atoms = n_atoms
+        self.bound = bound
+        self.count = 0
+
+    def __call__(self, model) -> int:
+        self.count += 2 ** (self.n_atoms - len(model))
+        # returning 0 stops the enumeration
+        if self.bound is not None and self.count >= self.bound:
+            return 0
+        return 1
+
+
+def _make_solver(partial: bool):
+    options = dict(_SOLVER_OPTIONS)
+    options["dpll.allsat_minimize_model"] = "true" if partial else "false"
+    return Solver("msat", solver_options=options)
+
+
+def _all_sat_count(solver, atoms: List[FNode], bound: int | None = None) -> int:
+    """counts the models of the assertions of solver on atoms, stopping once bound models are found"""
+    counter = _StreamingCounter(len(atoms), bound)
+    important = [solver.converter.convert(atom) for atom in atoms]
+    mathsat.msat_all_sat(solver.msat_env(), important, counter)
+    return counter.count
+
+
+def count_models_streaming(phi: FNode, atoms: List[FNode]) -> int:
+    """counts the assignments to atoms that are models of phi, without storing them
+
+    When all the atoms are Boolean variables, every extension of a partial model is a model,
+    so MathSAT is asked for partial models, each weighted by the assignments to its free atoms.
+    Theory atoms are enumerated totally, since some extensions of a partial model may be T-inconsistent.
+
+    Args:
+        phi (FNode): the formula
+        atoms (List[FNode]): the atoms of phi
+
+    Returns:
+        int: the number of models of phi on atoms
+    """
+    partial = all(atom.is_symbol() for atom in atoms)
+    solver = _make_solver(partial)
+    solver.add_assertion(phi)
+    return _all_sat_count(solver, atoms)
+
+
+def _random_xor(atoms: List[FNode], rng: random.Random) -> FNode:
+    """a random XOR constraint where each atom appears with probability 1/2"""
+    xor = TRUE() if rng.random() < 0.5 else Not(TRUE())
+    for atom in atoms:
+        if rng.random() < 0.5:
+            xor = Not(Iff(xor, atom))
+    return xor
+
+
+def approximate_count(
+        phi: FNode,
+        atoms: List[FNode],
+        epsilon: float = 0.8,
+        delta: float = 0.2,
+        seed: int | None = None) -> int:
+    """approximates the number of models of phi on atoms with hashing-based cells
+
+    Args:
+        phi (FNode): the formula
+        atoms (List[FNode]): the atoms of phi
+        epsilon (float) [0.8]: the tolerance, the estimate is within a factor (1 + epsilon) of the count
+        delta (float) [0.2]: the confidence, the tolerance is guaranteed with probability at least 1 - delta
+        seed (int | None) [None]: the seed for the random XOR constraints
+
+    Returns:
+        int: the estimated number of models, or the exact number if no run splits the models in small cells
+    """
+    if epsilon <= 0:
+        raise ValueError("epsilon must be positive")
+    if not 0 < delta < 1:
+        raise ValueError("delta must be between 0 and 1")
+    threshold = 1 + math.ceil(9.84 * (1 + epsilon / (1 + epsilon)) * (1 + 1 / epsilon) ** 2)
+    iterations = math.ceil(17 * math.log2(3 / delta))
+    rng = random.Random(seed)
+
+    solver = _make_solver(partial=False)
+    solver.add_assertion(phi)
+
+    # small counts are computed exactly
+    solver.push()
+    count = _all_sat_count(solver, atoms, threshold)
+    solver.pop()
+    if count < threshold:
+        return count
+
+    estimates = []
+    for _ in range(iterations):
+        # each new constraint halves the cells on average, the constraints of a run are nested
+        xors = []
+        for cells in range(1, len(atoms) + 1):
+            xors.append(_random_xor(atoms, rng))
+            solver.push()
+            for xor in xors:
+                solver.add_assertion(xor)
+            cell_count = _all_sat_count(solver, atoms, threshold)
+            solver.pop()
+            if cell_count < threshold:
+                estimates.append(cell_count * 2 ** cells)
+                break
+    if len(estimates) == 0:
+        # no run found a small cell (the XOR constraints were linearly dependent), count exactly
+        return _all_sat_count(solver, atoms)
+    return round(statistics.median(estimates))
@@ -1,27 +1,37 @@
 """module where all the queries functions are defined"""
 
+import copy
 import sys
+import tempfile
 import time
 from typing import Dict, List, Tuple
 
+import numpy as np
 from pysmt.fnode import FNode
+from pysmt.shortcuts import And, FALSE, Not, Or, TRUE, is_sat
 
+from theorydd.formula import get_normalized
 from theorydd.tdd.theory_bdd import TheoryBDD
 
-from src.query.util import aliases_from_mapping, is_tbdd_loading_folder_correct
+from src.query.util import is_tbdd_loading_folder_correct, normalize_literal_weights, normalize_refinement
 from src.query.query_interface import QueryInterface
+from src.theory_lemmas import build_lemmas, has_new_theory_atoms
 
 
 class TBDDQueryManager(QueryInterface):
     """manager to handle all queries on T-BDDs"""
 
     loading_time: float
+    # the T-BDD the manager was built on, None when it is loaded from source_folder
+    tbdd: TheoryBDD | None
 
     def __init__(
             self,
             source_folder: str,
             refinement_mapping: Dict[str, FNode] | None = None,
-            abstraction_mapping: Dict[FNode, str] | None = None):
+            abstraction_mapping: Dict[FNode, str] | None = None,
+            tbdd: TheoryBDD | None = None,
+            normalized: bool = False):
         """
         initialize the manager
         Always provide either the refinement_mapping or the abstraction_mapping or both when initializing the object,
@@ -31,8 +41,11 @@ class TBDDQueryManager(QueryInterface):
             source_folder (str): the path to the folder where the serialized compiled formula is stored
             refinement_mapping (Dict[int, FNode]) [None]: the mapping of the indices on the compiled formula's abstraction to the atoms in its refinement
             abstraction_mapping (Dict[FNode, int]) [None]: the mapping of the atoms of the formula to the indices in the compiled formula's abstraction
+            tbdd (TheoryBDD) [None]: the T-BDD to query, when it is already in memory
+            normalized (bool) [False]: True if the atoms of the mapping are already normalized
         """
-        super().__init__(source_folder, refinement_mapping, abstraction_mapping)
+        super().__init__(source_folder, refinement_mapping, abstraction_mapping, normalized)
+        self.tbdd = tbdd
 
         start_time = time.time()
         # load tbdd from folder to subtract loading time from query time
@@ -41,8 +54,43 @@ class TBDDQueryManager(QueryInterface):
 
         self.details["loading time"] = self.loading_time
 
-    def _load_tbdd(self) -> TheoryBDD:
-        """function to load the T-BDD from the source folder"""
+    @classmethod
+    def from_tbdd(cls, tbdd: TheoryBDD, refinement_mapping: Dict[str, FNode]) -> 'TBDDQueryManager':
+        """builds a manager on a T-BDD in memory, without serializing it
+
+        Features that read or write the artifact folder, like the literal index, are not available
+
+        Args:
+            tbdd (TheoryBDD): the T-BDD
+            refinement_mapping (Dict[str, FNode]): the mapping of the aliases of the atoms of the formula to the normalized atoms,
+                without the existentially quantified variables
+
+        Returns:
+            TBDDQueryManager: the manager
+        """
+        return cls("", refinement_mapping=refinement_mapping, tbdd=tbdd, normalized=True)
+
+    def _load_tbdd(self, detached: bool = False) -> TheoryBDD:
+        """function to load the T-BDD from the source folder,
+        or to copy the T-BDD in memory so that queries that modify it leave it untouched
+
+        Args:
+            detached (bool) [False]: if True, a T-BDD in memory is copied on a fresh variable manager,
+                for the queries that declare new variables
+
+        Returns:
+            TheoryBDD: the T-BDD
+        """
+        if self.tbdd is not None:
+            if detached:
+                # a shallow copy shares the variable manager of the T-BDD in memory
+                with tempfile.TemporaryDirectory() as folder:
+                    self.tbdd.save_to_folder(folder)
+                    return TheoryBDD(None, folder_name=folder, solver=self.normalizer_solver)
+            tbdd = copy.copy(self.tbdd)
+            tbdd.abstraction = dict(self.tbdd.abstraction)
+            tbdd.refinement = dict(self.tbdd.refinement)
+            return tbdd
         return TheoryBDD(None, folder_name=self.source_folder, solver=self.normalizer_solver)
 
     def _check_consistency(self) -> Tuple[bool, float]:
@@ -87,10 +135,8 @@ class TBDDQueryManager(QueryInterface):
             bool: True if the formula entails the clause, False otherwise
             float: the structure loading time
         """
-        # RETRIEVE THE INDEXES ON WHICH TO OPERATE
-        clause_aliases = aliases_from_mapping(clause, self.abstraction_mapping)
-
-        clause_items = [(alias[1:] if alias.startswith('-') else alias, not alias.startswith('-')) for alias in clause_aliases]
+        # RETRIEVE THE ALIASES ON WHICH TO OPERATE
+        clause_items = self._literal_items(clause)
 
         return self._check_entail_clause_random_body(clause_items)
     
@@ -135,10 +181,8 @@ class TBDDQueryManager(QueryInterface):
             bool: True if the term is an implicant, False otherwise
             float: the structure loading time
         """
-        # RETRIEVE THE INDEX ON WHICH TO OPERATE
-        term_alias = aliases_from_mapping(term, self.abstraction_mapping)[0]
-
-        term_item = (term_alias[1:] if term_alias.startswith('-') else term_alias, not term_alias.startswith('-'))
+        # RETRIEVE THE ALIAS ON WHICH TO OPERATE
+        term_item = self._literal_items(term)[0]
 
         return self._check_implicant_random_body(term_item)
 
@@ -189,6 +233,148 @@ class TBDDQueryManager(QueryInterface):
 
         return models_total, load_time
 
+    def _marginal_counts(self) -> Tuple[Dict[str, Tuple[int, int]], int, int, float]:
+        """function to count the models where each literal is true,
+        with one upward (model counting) and one downward (derivative) pass over the T-BDD
+
+        Counts are over all the variables declared in the BDD manager and computed with exact integers.
+        The upward pass computes Q(u), the number of models of u, handling complemented edges as Q(~u) = 2^n - Q(u).
+        The downward pass computes the derivative D of the root with respect to the probability of each variable,
+        so that the models where x is true are Q(root)/2 + D/4 (scaled by 2^n) and those where x is false Q(root)/2 - D/4.
+
+        Returns:
+            Dict[str,Tuple[int,int]]: for each atom alias, the number of models where the atom is true and where it is false
+            int: the number of variables the models are counted on
+            int: the number of models
+            float: the structure loading time
+        """
+        start_time = time.time()
+        tbdd = self._load_tbdd()
+        load_time = time.time() - start_time
+
+        bdd = tbdd.bdd
+        n_vars = len(bdd.vars)
+        total = 2 ** n_vars
+
+        nodes, ordered = self._regular_nodes(tbdd)
+
+        # UPWARD PASS: MODEL COUNTS
+        counts = {}
+
+        def count(node) -> int:
+            if node == bdd.true:
+                return total
+            if node == bdd.false:
+                return 0
+            if node.negated:
+                return total - counts[int(~node)]
+            return counts[int(node)]
+
+        for node in reversed(ordered):
+            _level, low, high = bdd.succ(node)
+            counts[int(node)] = (count(low) + count(high)) // 2
+
+        # DOWNWARD PASS: DERIVATIVES, SCALED BY 2^level OF EACH NODE
+        adjoints = {key: 0 for key in nodes.keys()}
+        root = tbdd.root
+        if int(~root if root.negated else root) in adjoints:
+            adjoints[int(~root if root.negated else root)] = (-1 if root.negated else 1) * 2 ** root.level
+        derivatives = [0] * n_vars
+        for node in ordered:
+            adjoint = adjoints[int(node)]
+            if adjoint == 0:
+                continue
+            level, low, high = bdd.succ(node)
+            derivatives[level] += adjoint * (count(high) - count(low)) // 2 ** level
+            for child in (low, high):
+                if child == bdd.true or child == bdd.false:
+                    continue
+                sign = -1 if child.negated else 1
+                adjoints[int(~child if child.negated else child)] += sign * adjoint * 2 ** (child.level - level - 1)
+
+        root_count = count(root)
+        marginals = {}
+        for alias in self.refinement_mapping.keys():
+            derivative = derivatives[bdd.level_of_var(alias)]
+            marginals[alias] = ((2 * root_count + derivative) // 4,
+                                (2 * root_count - derivative) // 4)
+
+        return marginals, n_vars, root_count, load_time
+
+    def _regular_nodes(self, tbdd: TheoryBDD) -> Tuple[Dict[int, object], List[object]]:
+        """collects the regular (not complemented) internal nodes of the T-BDD
+
+        Returns:
+            Dict[int,object]: the nodes, keyed by their id
+            List[object]: the nodes sorted by level, parents before children
+        """
+        bdd = tbdd.bdd
+        nodes = {}
+        stack = [tbdd.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node == bdd.true or node == bdd.false:
+                continue
+            regular = ~node if node.negated else node
+            if int(regular) in nodes:
+                continue
+            nodes[int(regular)] = regular
+            _level, low, high = bdd.succ(regular)
+            stack.append(low)
+            stack.append(high)
+        # parents always have a lower level than their children
+        ordered = sorted(nodes.values(), key=lambda node: node.level)
+        return nodes, ordered
+
+    def _weighted_model_counts(
+            self,
+            weights: Dict[str, Tuple[np.ndarray, np.ndarray]],
+            batch: int) -> Tuple[np.ndarray, float]:
+        """function to compute the weighted model counts for a batch of weight vectors,
+        with one upward pass over the T-BDD where each node holds the values for all the weight vectors
+
+        The weights of each variable are scaled to sum to 1, so that a node is valued by the probability of its function
+        and a complemented edge to u is valued 1 - P(u), independently of the levels skipped by the edge.
+        The probability of the root is then scaled back by the product of the sums of the weights.
+
+        Returns:
+            np.ndarray: the weighted model count for each weight vector
+            float: the structure loading time
+        """
+        start_time = time.time()
+        tbdd = self._load_tbdd()
+        load_time = time.time() - start_time
+
+        bdd = tbdd.bdd
+        n_vars = len(bdd.vars)
+        positive = np.ones((n_vars, batch))
+        negative = np.ones((n_vars, batch))
+        for alias, (positive_weights, negative_weights) in weights.items():
+            level = bdd.level_of_var(alias)
+            positive[level] = positive_weights
+            negative[level] = negative_weights
+        positive, negative, sums = normalize_literal_weights(positive, negative)
+
+        _nodes, ordered = self._regular_nodes(tbdd)
+        probabilities = {}
+        ones = np.ones(batch)
+        zeros = np.zeros(batch)
+
+        def probability(node) -> np.ndarray:
+            if node == bdd.true:
+                return ones
+            if node == bdd.false:
+                return zeros
+            if node.negated:
+                return 1.0 - probabilities[int(~node)]
+            return probabilities[int(node)]
+
+        for node in reversed(ordered):
+            level, low, high = bdd.succ(node)
+            probabilities[int(node)] = negative[level] * probability(low) + positive[level] * probability(high)
+
+        return probability(tbdd.root) * np.prod(sums, axis=0), load_time
+
     def _enumerate_models(self) -> float:
         """function to enumerate all models for the encoded formula
 
@@ -219,7 +405,7 @@ class TBDDQueryManager(QueryInterface):
             float: the structure loading time
         """
         # RETRIEVE THE INDEXES ON WHICH TO OPERATE
-        alpha_items = aliases_from_mapping(alpha, self.abstraction_mapping)
+        alpha_items = [alias if polarity else '-'+alias for alias, polarity in self._literal_items(alpha)]
 
         # LOAD THE T-BDD
         start_time = time.time()
@@ -266,6 +452,167 @@ class TBDDQueryManager(QueryInterface):
 
         return load_time
 
+    def _load_aligned_tbdds(self, data_folder: str) -> Tuple[TheoryBDD, object, Dict[FNode, str], List[FNode], float]:
+        """loads the queried T-BDD and the T-BDD in data_folder on the variable manager of the queried one
+
+        The atoms of both T-BDDs are normalized and matched, atoms that only appear in
+        the T-BDD in data_folder get a fresh alias in the queried T-BDD
+
+        Args:
+            data_folder (str): the path to the folder where the other T-BDD is stored
+
+        Returns:
+            TheoryBDD: the queried T-BDD, extended with the atoms of the other T-BDD
+            object: the root of the other T-BDD in the variable manager of the queried T-BDD
+            Dict[FNode,str]: the alias of each normalized atom in the queried T-BDD
+            List[FNode]: the normalized atoms of the other T-BDD
+            float: the structure loading time
+        """
+        if not is_tbdd_loading_folder_correct(data_folder):
+            raise ValueError(
+                "The data folder is not in the correct format for TBDDs")
+        start_time = time.time()
+        tbdd = self._load_tbdd(detached=True)
+        other = TheoryBDD(None, folder_name=data_folder, solver=self.normalizer_solver)
+        load_time = time.time() - start_time
+
+        own_abstraction = {v: k for k, v in normalize_refinement(
+            {v: k for k, v in tbdd.abstraction.items()}, self.normalizer_solver).items()}
+        other_refinement = normalize_refinement(
+            {v: k for k, v in other.abstraction.items()}, self.normalizer_solver)
+
+        # rename the variables of the other T-BDD into aliases of the queried one
+        renaming = {}
+        other_atoms = []
+        for alias in other.bdd.support(other.root):
+            atom = other_refinement[alias]
+            other_atoms.append(atom)
+            if atom not in own_abstraction:
+                new_alias = self._fresh_alias(tbdd)
+                tbdd.bdd.declare(new_alias)
+                tbdd.abstraction[atom] = new_alias
+                tbdd.refinement[new_alias] = atom
+                own_abstraction[atom] = new_alias
+            renaming[alias] = own_abstraction[atom]
+
+        other_root = self._transfer(other, tbdd, renaming, other.root)
+        return tbdd, other_root, own_abstraction, other_atoms, load_time
+
+    def _fresh_alias(self, tbdd: TheoryBDD) -> str:
+        """an alias that is not yet declared in the variable manager of the T-BDD"""
+        index = len(tbdd.bdd.vars)
+        while f"v{index}" in tbdd.bdd.vars:
+            index += 1
+        return f"v{index}"
+
+    def _transfer(self, source: TheoryBDD, target: TheoryBDD, renaming: Dict[str, str], root):
+        """rebuilds root from the variable manager of source in the variable manager of target,
+        renaming variables along the way
+
+        Nodes are rebuilt bottom-up with an explicit stack, so that deep BDDs do not hit the recursion limit
+
+        Args:
+            source (TheoryBDD): the T-BDD that owns root
+            target (TheoryBDD): the T-BDD where root is rebuilt
+            renaming (Dict[str,str]): the alias in target of each variable in the support of root
+            root: the node to rebuild
+
+        Returns:
+            the rebuilt node
+        """
+        # the nodes already rebuilt, keyed by their regular node in source
+        computed: Dict[int, object] = {}
+
+        def rebuilt(node):
+            if node == source.bdd.true:
+                return target.bdd.true
+            if node == source.bdd.false:
+                return target.bdd.false
+            # complemented edges are handled by rebuilding the regular node and negating the result
+            result = computed[int(~node if node.negated else node)]
+            return ~result if node.negated else result
+
+        stack = [(root, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node == source.bdd.true or node == source.bdd.false:
+                continue
+            regular = ~node if node.negated else node
+            key = int(regular)
+            if key in computed:
+                continue
+            level, low, high = source.bdd.succ(regular)
+            if not expanded:
+                stack.append((regular, True))
+                stack.append((high, False))
+                stack.append((low, False))
+                continue
+            var = target.bdd.var(renaming[source.bdd.var_at_level(level)])
+            computed[key] = target.bdd.ite(var, rebuilt(high), rebuilt(low))
+        return rebuilt(root)
+
+    def _refined_formula(self, tbdd: TheoryBDD, root) -> FNode:
+        """the refinement of a node of the T-BDD, as a formula on the atoms of the T-BDD
+
+        Each decision node becomes (atom & high) | (~atom & low), shared nodes are translated once
+
+        Args:
+            tbdd (TheoryBDD): the T-BDD that owns root
+            root: the node to translate
+
+        Returns:
+            FNode: the refinement of root
+        """
+        computed: Dict[int, FNode] = {}
+
+        def refined(node) -> FNode:
+            if node == tbdd.bdd.true:
+                return TRUE()
+            if node == tbdd.bdd.false:
+                return FALSE()
+            result = computed[int(~node if node.negated else node)]
+            return Not(result) if node.negated else result
+
+        stack = [(root, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node == tbdd.bdd.true or node == tbdd.bdd.false:
+                continue
+            regular = ~node if node.negated else node
+            key = int(regular)
+            if key in computed:
+                continue
+            level, low, high = tbdd.bdd.succ(regular)
+            if not expanded:
+                stack.append((regular, True))
+                stack.append((high, False))
+                stack.append((low, False))
+                continue
+            atom = tbdd.refinement[tbdd.bdd.var_at_level(level)]
+            computed[key] = Or(And(atom, refined(high)), And(Not(atom), refined(low)))
+        return refined(root)
+
+    def _lemmas_root(self, tbdd: TheoryBDD, abstraction: Dict[FNode, str], tlemmas: List[FNode]):
+        """builds the conjunction of the lemmas in the variable manager of the T-BDD
+
+        Args:
+            tbdd (TheoryBDD): the T-BDD
+            abstraction (Dict[FNode,str]): the alias of each normalized atom in the T-BDD
+            tlemmas (List[FNode]): the lemmas
+
+        Returns:
+            the root of the conjunction of the lemmas
+        """
+        converter = self.normalizer_solver.get_converter()
+
+        def atom_node(atom: FNode):
+            normalized = get_normalized(atom, converter)
+            if normalized not in abstraction:
+                raise RuntimeError(f"The theory lemmas contain an atom that is not in the T-BDDs: {atom.serialize()}")
+            return tbdd.bdd.var(abstraction[normalized])
+
+        return build_lemmas(tlemmas, atom_node, tbdd.bdd.true)
+
     def check_entail(self, data_folder: str) -> bool:
         """function to check entailment of the compiled formula with respect to the data in data_folder.
         The data in data folder must be of the correct format, which is the same of for the queried structure
@@ -276,23 +623,47 @@ class TBDDQueryManager(QueryInterface):
         Returns:
             bool: True if the compiled formula entails the data, False otherwise
         """
-        if not is_tbdd_loading_folder_correct(data_folder):
-            raise ValueError(
-                "The data folder is not in the correct format for TBDDs")
-        raise NotImplementedError()
-
-    def conjunction(self, data_folder: str, output_path: str | None = None) -> None:
+        tbdd, other_root, _abstraction, other_atoms, load_time = self._load_aligned_tbdds(data_folder)
+        start_time = time.time()
+        # phi entails data iff phi and not data is T-unsatisfiable
+        difference = tbdd.root & ~other_root
+        if difference == tbdd.bdd.false:
+            entailment = True
+        elif has_new_theory_atoms(other_atoms, list(self.refinement_mapping.values())):
+            # not data can be T-inconsistent on the atoms that phi does not have
+            entailment = not is_sat(self._refined_formula(tbdd, difference), solver_name="msat")
+        else:
+            # the models of phi are T-consistent on all the atoms
+            entailment = False
+        self.details["entail"] = entailment
+        self.details["entail loading time"] = load_time
+        self.details["entail time"] = time.time() - start_time
+        return entailment
+
+    def conjunction(self, data_folder: str, output_path: str | None = None, tlemmas: List[FNode] | None = None) -> None:
         """function to compute the conjunction of the compiled formula the data in data_folder.
         The data in data folder must be of the correct format, which is the same of for the queried structure
 
         Args:
             data_folder (str): the path to the folder where the data is stored
             output_path (str | None) [None]: the path to the file where the conjunction will be saved
+            tlemmas (List[FNode] | None) [None]: the lemmas that mix the atoms of the two formulas, when they were already enumerated
         """
-        if not is_tbdd_loading_folder_correct(data_folder):
-            raise ValueError(
-                "The data folder is not in the correct format for TBDDs")
-        raise NotImplementedError()
+        tbdd, other_root, abstraction, other_atoms, load_time = self._load_aligned_tbdds(data_folder)
+        own_atoms = list(self.refinement_mapping.values())
+        start_time = time.time()
+        root = tbdd.root & other_root
+        combined = None
+        if has_new_theory_atoms(other_atoms, own_atoms) and has_new_theory_atoms(own_atoms, other_atoms):
+            combined = self._refined_formula(tbdd, root)
+        tlemmas = self._combination_lemmas("conjunction", combined, tlemmas=tlemmas)
+        tbdd.root = root & self._lemmas_root(tbdd, abstraction, tlemmas)
+        self.details["conjunction loading time"] = load_time
+        self.details["conjunction time"] = time.time() - start_time - self.details["conjunction lemmas time"]
+        if output_path is not None:
+            result_lemmas = self._result_lemmas(tlemmas, data_folder)
+            tbdd.save_to_folder(output_path)
+            self._save_result_lemmas(output_path, result_lemmas)
 
     def disjunction(self, data_folder: str, output_path: str | None = None) -> None:
         """function to compute the disjunction of the compiled formula the data in data_folder.
@@ -302,10 +673,22 @@ class TBDDQueryManager(QueryInterface):
             data_folder (str): the path to the folder where the data is stored
             output_path (str | None) [None]: the path to the file where the disjunction will be saved
         """
-        if not is_tbdd_loading_folder_correct(data_folder):
-            raise ValueError(
-                "The data folder is not in the correct format for TBDDs")
-        raise NotImplementedError()
+        tbdd, other_root, abstraction, other_atoms, load_time = self._load_aligned_tbdds(data_folder)
+        own_atoms = list(self.refinement_mapping.values())
+        start_time = time.time()
+        root = tbdd.root | other_root
+        combined = None
+        # each formula must also be consistent on the atoms that only the other one has
+        if has_new_theory_atoms(other_atoms, own_atoms) or has_new_theory_atoms(own_atoms, other_atoms):
+            combined = self._refined_formula(tbdd, root)
+        tlemmas = self._combination_lemmas("disjunction", combined)
+        tbdd.root = root & self._lemmas_root(tbdd, abstraction, tlemmas)
+        self.details["disjunction loading time"] = load_time
+        self.details["disjunction time"] = time.time() - start_time - self.details["disjunction lemmas time"]
+        if output_path is not None:
+            result_lemmas = self._result_lemmas(tlemmas, data_folder)
+            tbdd.save_to_folder(output_path)
+            self._save_result_lemmas(output_path, result_lemmas)
 
     def negation(self, output_path: str | None = None) -> None:
         """function to compute the negation of the compiled formula
@@ -313,4 +696,20 @@ class TBDDQueryManager(QueryInterface):
         Args:
             output_path (str | None) [None]: the path to the file where the negation will be saved
         """
-        raise NotImplementedError()
+        start_time = time.time()
+        tbdd = self._load_tbdd()
+        load_time = time.time() - start_time
+        start_time = time.time()
+        # the negation keeps the lemmas of the compiled formula,
+        # they are enumerated again only if they were not saved with it
+        saved_lemmas = self._saved_lemmas()
+        combined = self._refined_formula(tbdd, tbdd.root) if saved_lemmas is None else None
+        tlemmas = self._combination_lemmas("negation", combined, tlemmas=saved_lemmas)
+        abstraction = {v: k for k, v in normalize_refinement(
+            {v: k for k, v in tbdd.abstraction.items()}, self.normalizer_solver).items()}
+        tbdd.root = ~tbdd.root & self._lemmas_root(tbdd, abstraction, tlemmas)
+        self.details["negation loading time"] = load_time
+        self.details["negation time"] = time.time() - start_time - self.details["negation lemmas time"]
+        if output_path is not None:
+            tbdd.save_to_folder(output_path)
+            self._save_result_lemmas(output_path, tlemmas)
@@ -7,9 +7,12 @@ from typing import Dict
 from pysmt.fnode import FNode
 
 from src.query.tddnnf.manager import DDNNFQueryManager
+from src.query.tddnnf.translation_cache import cached_translation
 from src.query.constants import (
     DDNNF_CONDITION_PATH as _DDNNF_CONDITION_PATH,
     TRANSLATED_FILE as _TRANSLATED_FILE,
+    TRANSLATION_CACHE_FOLDER as _TRANSLATION_CACHE_FOLDER,
+    TRANSLATION_CACHE_MAX_ENTRIES as _TRANSLATION_CACHE_MAX_ENTRIES,
     C2D_DDNNF_FILE as _C2D_DDNNF_FILE,
     CONDITION_C2D_OUTPUT_OPTION as _CONDITION_C2D_OUTPUT_OPTION)
 
@@ -36,31 +39,48 @@ class C2D_DDNNFQueryManager(DDNNFQueryManager):
         """
         super().__init__(source_folder, ddnnf_vars, refinement_mapping, abstraction_mapping)
 
-        self.d4_file = os.path.join(self.source_folder, _TRANSLATED_FILE)
         self.output_option = _CONDITION_C2D_OUTPUT_OPTION
 
-        # translate formula in d4 format
-        self._translate_formula()
+        # translate formula in d4 format, or reuse the translation of a previous session,
+        # when the binary encoding is available the translation is needed only for conditioning
+        if self.binary is None:
+            self._translate_formula()
 
-    def __del__(self):
-        """destructor"""
-        # delete the translated file
-        if os.path.exists(self.d4_file):
-            os.remove(self.d4_file)
+    @property
+    def d4_file(self) -> str:
+        """the path to the formula in d4 format, translated on first use"""
+        if self._d4_file == "":
+            self._translate_formula()
+        return self._d4_file
+
+    @d4_file.setter
+    def d4_file(self, value: str) -> None:
+        self._d4_file = value
 
     def _translate_formula(self) -> None:
-        """function to translate the formula from c2d to d4 format"""
+        """function to get the formula in d4 format from the translation cache,
+        translating it from c2d format if it was never translated"""
 
         # formula should be in source_folder/dimacs.cnf.nnf
         c2d_nnf_path = os.path.join(self.source_folder, _C2D_DDNNF_FILE)
 
-        # call the translation script
         start_time = time.time()
-        translation_command = " ".join(
-            [_DDNNF_CONDITION_PATH, "-i_c2d", c2d_nnf_path, "-o_d4", self.d4_file])
-        result = os.system(translation_command + " > /dev/null")
-        if result != 0:
-            raise RuntimeError("Error translating formula to d4 format")
+        self._d4_file, cached = cached_translation(
+            c2d_nnf_path,
+            os.path.join(self.source_folder, _TRANSLATION_CACHE_FOLDER),
+            _TRANSLATED_FILE,
+            _translate_c2d_to_d4,
+            _TRANSLATION_CACHE_MAX_ENTRIES)
         translation_time = time.time() - start_time
 
         self.details["translation_time"] = translation_time
+        self.details["translation cached"] = cached
+
+
+def _translate_c2d_to_d4(c2d_nnf_path: str, d4_nnf_path: str) -> None:
+    """translates a d-DNNF from c2d to d4 format through the ddnnf_condition binary"""
+    translation_command = " ".join(
+        [_DDNNF_CONDITION_PATH, "-i_c2d", c2d_nnf_path, "-o_d4", d4_nnf_path])
+    result = os.system(translation_command + " > /dev/null")
+    if result != 0:
+        raise RuntimeError("Error translating formula to d4 format")
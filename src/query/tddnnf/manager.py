@@ -1,20 +1,30 @@
 """module where all the queries functions are defined"""
 
 import os
+import shutil
 import subprocess
-from typing import Dict, List, Tuple
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
 
+import numpy as np
 from pysmt.fnode import FNode
 from pysmt.shortcuts import Not
 
-from src.query.util import indexes_from_mapping, UnsupportedQueryException, check_executable
+from src.ddnnf_binary import BINARY_DDNNF_FILE, BinaryDDNNF, load_binary_ddnnf, write_binary_ddnnf
+from src.kc.ddnnf_shrink import read_d4_circuit
+from src.query.util import UnsupportedQueryException, check_executable
 from src.query.query_interface import QueryInterface
 from src.query.constants import (
     DDNNF_CONDITION_PATH as _DDNNF_CONDITION_PATH,
     DECDNNF_PATH as _DECDNNF_PATH,
     CONDITION_DDNNF_OUTPUT_OPTION as _CONDITION_DDNNF_OUTPUT_OPTION,
     CONDITION_D4_OUTPUT_OPTION as _CONDITION_D4_OUTPUT_OPTION,
-    TEPORARY_CONDITION_FILE as _TEMPORARY_CONDITIONED_FILE)
+    PRODUCER_POLL_INTERVAL as _PRODUCER_POLL_INTERVAL,
+    TEPORARY_CONDITION_FILE as _TEMPORARY_CONDITIONED_FILE,
+    TMPFS_FOLDER as _TMPFS_FOLDER)
 
 
 class DDNNFQueryManager(QueryInterface):
@@ -23,6 +33,7 @@ class DDNNFQueryManager(QueryInterface):
     quantified_vars: set[int]
     total_vars: int
     output_option: str
+    binary: BinaryDDNNF | None
 
     # IMPORTANT!
     # classes that inherit from this class must define this attribute
@@ -63,14 +74,18 @@ class DDNNFQueryManager(QueryInterface):
 
         self.d4_file = ""
 
+        # queries that only need a yes/no or a count are answered on the binary encoding when it was saved
+        self.binary = load_binary_ddnnf(self.source_folder)
+        self.details["binary dDNNF"] = self.binary is not None
+
     def _check_consistency(self) -> Tuple[bool, float]:
         """function to check if the encoded formula is consistent
 
         Returns:
             bool: True if the formula is consistent, False otherwise
             float: the strucutre loading time"""
-        models = self._count_models_body(self.d4_file)
-        result = (models > 0)
+        if self.binary is not None:
+            return self.binary.is_consistent(), 0
 
         return self._check_consistency_body(self.d4_file)
     
@@ -115,7 +130,10 @@ class DDNNFQueryManager(QueryInterface):
         Returns:
             bool: True if the formula is valid, False otherwise
             float: the strucutre loading time"""
-        models = self._count_models_body(self.d4_file)
+        if self.binary is not None:
+            models = self.binary.count_models()
+        else:
+            models = self._count_models_body(self.d4_file)
         max_models = 2 ** len(self.abstraction_mapping)
         result = (models == max_models)
 
@@ -133,11 +151,9 @@ class DDNNFQueryManager(QueryInterface):
         """
 
         # RETRIEVE THE INDEXES ON WHICH TO OPERATE
-        clause_items = indexes_from_mapping(clause, self.abstraction_mapping)
-
-        clause_items_tuples = [(abs(item), item > 0) for item in clause_items]
+        clause_items = self._literal_items(clause)
 
-        return self._check_entail_clause_random_body(clause_items_tuples)
+        return self._check_entail_clause_random_body(clause_items)
 
     def _check_entail_clause_random_body(self, clause_items: List[Tuple[int, bool]]) -> Tuple[bool, float]:
         """function to check if the encoded formula entails the clause
@@ -152,27 +168,109 @@ class DDNNFQueryManager(QueryInterface):
         clause_items_indexes = [item[0] if item[1]
                                 else -item[0] for item in clause_items]
 
+        # A CLAUSE WITH BOTH x AND NOT x IS VALID, SO IT IS ENTAILED
+        # (ITS NEGATION WOULD CONDITION x BOTH WAYS)
+        literals = set(clause_items_indexes)
+        if any(-item in literals for item in literals):
+            return True, 0
+
         # NEGATE ALL ITEMS IN THE CLAUSE
         # TO OBTAIN A CUBE EQUIVALENT TO
         # NOT CLAUSE
         clause_items_negated = [-item for item in clause_items_indexes]
 
+        if self.binary is not None:
+            assumptions = {abs(item): item > 0 for item in clause_items_negated}
+            return not self.binary.is_consistent(assumptions), 0
+
         # CONDITION OVER CLAUSE ITEMS NEGATED
-        self._condition_all_variables(
-            clause_items_negated, _CONDITION_D4_OUTPUT_OPTION, _TEMPORARY_CONDITIONED_FILE)
-        # CHECK IF THE CONDITIONED T-dDNNF IS SAT
-        is_sat, _time = self._check_consistency_body(_TEMPORARY_CONDITIONED_FILE)
+        # AND CHECK IF THE CONDITIONED T-dDNNF IS SAT
+        with self._conditioned_stream(clause_items_negated) as conditioned_file:
+            is_sat, _time = self._check_consistency_body(conditioned_file)
         # IF THE CONDITIONED T-dDNNF IS SAT, THEN THE FORMULA DOES NOT ENTAIL THE CLAUSE
         entailment = not is_sat
 
-        self._clear_tmp_file()
-
         return entailment, 0
 
-    def _clear_tmp_file(self) -> None:
-        """function to clear the temporary file created during the execution"""
-        if os.path.exists(_TEMPORARY_CONDITIONED_FILE):
-            os.remove(_TEMPORARY_CONDITIONED_FILE)
+    @contextmanager
+    def _conditioned_stream(self, vars_to_condition: List[int]) -> Iterator[str]:
+        """context manager that streams the T-dDNNF conditioned on the specified variables
+        to the consumer reading the yielded path, without writing it to persistent storage
+
+        The conditioning process writes to a named pipe on tmpfs while the consumer reads it.
+        Where named pipes are not available, the conditioned T-dDNNF is written to a file on tmpfs.
+
+        Args:
+            vars_to_condition (List[int]): the list of variables to condition on
+
+        Yields:
+            str: the path from which the consumer reads the conditioned T-dDNNF in d4 format
+        """
+        folder = tempfile.mkdtemp(dir=_TMPFS_FOLDER)
+        stream_path = os.path.join(folder, _TEMPORARY_CONDITIONED_FILE)
+        try:
+            try:
+                os.mkfifo(stream_path)
+            except (AttributeError, OSError):
+                self._condition_all_variables(
+                    vars_to_condition, _CONDITION_D4_OUTPUT_OPTION, stream_path)
+                yield stream_path
+                return
+            producer = subprocess.Popen(  # pylint: disable=consider-using-with
+                self._condition_command(vars_to_condition, _CONDITION_D4_OUTPUT_OPTION, stream_path),
+                stdout=subprocess.DEVNULL)
+            stop_watching = threading.Event()
+            watchdog = threading.Thread(
+                target=self._watch_producer, args=(producer, stream_path, stop_watching), daemon=True)
+            watchdog.start()
+            try:
+                yield stream_path
+            finally:
+                stop_watching.set()
+                watchdog.join()
+                self._finish_producer(producer, stream_path)
+                # a failed conditioning is the cause of any error of the consumer
+                if producer.returncode != 0:
+                    raise RuntimeError(
+                        "An error occurred while conditioning the T-dDNNF")
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _watch_producer(self, producer: subprocess.Popen, stream_path: str, stop: threading.Event) -> None:
+        """polls the conditioning process while the consumer reads the pipe
+
+        If the process fails, it may never have opened the pipe, leaving the consumer blocked in open(),
+        so the pipe is opened for writing and closed, and the consumer reads an empty stream
+        """
+        while producer.poll() is None:
+            if stop.wait(_PRODUCER_POLL_INTERVAL):
+                return
+        if producer.returncode == 0:
+            return
+        while not stop.is_set():
+            try:
+                descriptor = os.open(stream_path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                # the consumer did not open the pipe yet
+                stop.wait(_PRODUCER_POLL_INTERVAL)
+                continue
+            os.close(descriptor)
+            return
+
+    def _finish_producer(self, producer: subprocess.Popen, stream_path: str) -> None:
+        """waits for the conditioning process, draining the pipe if the consumer stopped reading it early"""
+        if producer.poll() is None:
+            # opening without blocking releases a producer waiting for a reader
+            descriptor = os.open(stream_path, os.O_RDONLY | os.O_NONBLOCK)
+            os.set_blocking(descriptor, True)
+            with os.fdopen(descriptor, "rb") as rest:
+                while rest.read(1 << 20):
+                    pass
+        try:
+            producer.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            producer.kill()
+            producer.wait()
 
     def _check_implicant_body(
             self,
@@ -187,11 +285,8 @@ class DDNNFQueryManager(QueryInterface):
             float: the implicant checking time
         """
         # RETRIEVE THE INDEX ON WHICH TO OPERATE
-        term_index = indexes_from_mapping(term, self.abstraction_mapping)[0]
-        is_positive = True
-        if term_index < 0:
-            is_positive = False
-        return self._check_implicant_random_body((abs(term_index), is_positive))
+        term_item = self._literal_items(term)[0]
+        return self._check_implicant_random_body(term_item)
 
     def _check_implicant_random_body(self, term_item: Tuple[int, bool]) -> Tuple[bool, float]:
         """function to check if the term is an implicant for the encoded formula
@@ -203,18 +298,19 @@ class DDNNFQueryManager(QueryInterface):
             bool: True if the term is an implicant, False otherwise"""
         term_index = term_item[0] if term_item[1] else -term_item[0]
 
+        if self.binary is not None:
+            conditioned_mc = self.binary.count_models({term_item[0]: term_item[1]})
+            return conditioned_mc == 2 ** len(self.abstraction_mapping), 0
+
         # CONSTRUCT T-dDNNF | term
-        self._condition_all_variables(
-            [term_index], _CONDITION_D4_OUTPUT_OPTION, _TEMPORARY_CONDITIONED_FILE)
-        # COUNT MODELS OF CONDITIONED T-dDNNF
-        conditioned_mc = self._count_models_body(_TEMPORARY_CONDITIONED_FILE)
+        # AND COUNT MODELS OF CONDITIONED T-dDNNF
+        with self._conditioned_stream([term_index]) as conditioned_file:
+            conditioned_mc = self._count_models_body(conditioned_file)
         # CHECK IF THE CONDITIONED T-dDNNF IS VALID (HAS 2**N MODELS)
         validity = (conditioned_mc == 2 ** len(self.abstraction_mapping))
         # IF THE CONDITIONED T-BDD IS VALID, THEN THE TERM IS AN IMPLICANT
         implicant = validity
 
-        self._clear_tmp_file()
-
         return implicant, 0
 
     def _count_models_body(self, input_file: str) -> int:
@@ -249,9 +345,45 @@ class DDNNFQueryManager(QueryInterface):
             int: the number of models for the encoded formula
             float: the model counting time
         """
+        if self.binary is not None:
+            return self.binary.count_models(), 0
         result = self._count_models_body(self.d4_file)
         return result, 0
 
+    def _weighted_model_counts(
+            self,
+            weights: Dict[int, Tuple[np.ndarray, np.ndarray]],
+            batch: int) -> Tuple[np.ndarray, float]:
+        """function to compute the weighted model counts for a batch of weight vectors,
+        evaluating the binary encoding of the dDNNF level by level for all the weight vectors at once
+
+        When the binary encoding was not saved with the dDNNF, it is built from the formula in d4 format
+
+        Returns:
+            np.ndarray: the weighted model count for each weight vector
+            float: the structure loading time
+        """
+        positive = np.ones((self.total_vars + 1, batch))
+        negative = np.ones((self.total_vars + 1, batch))
+        for index, (positive_weights, negative_weights) in weights.items():
+            positive[index] = positive_weights
+            negative[index] = negative_weights
+
+        if self.binary is not None:
+            return self.binary.weighted_model_counts(positive, negative), 0
+
+        start_time = time.time()
+        with open(self.d4_file, "r", encoding='utf8') as file:
+            circuit, root = read_d4_circuit(file.read().splitlines())
+        with tempfile.TemporaryDirectory() as folder:
+            binary_file = os.path.join(folder, BINARY_DDNNF_FILE)
+            write_binary_ddnnf(circuit, root, self.total_vars, self.quantified_vars, binary_file)
+            binary = BinaryDDNNF(binary_file)
+            load_time = time.time() - start_time
+            counts = binary.weighted_model_counts(positive, negative)
+            del binary
+        return counts, load_time
+
     def _enumerate_models(self) -> float:
         """function to enumerate all models for the encoded formula
 
@@ -308,15 +440,28 @@ class DDNNFQueryManager(QueryInterface):
             output_option (str): the option to pass to the T-dDNNF compiler for the output file
             output_file (str, optional): the path to the .smt2 file where the conditioned T-dDNNF will be saved. Defaults to None
         """
+        command_str = " ".join(self._condition_command(vars_to_condition, output_option, output_file))
+        result = os.system(command_str)
+        if result != 0:
+            raise RuntimeError(
+                "An error occurred while conditioning the T-dDNNF")
+
+    def _condition_command(self, vars_to_condition: List[int], output_option: str | None = None, output_file: str | None = None) -> List[str]:
+        """function to build the command that conditions the T-dDNNF on the specified variables
+
+        Args:
+            vars_to_condition (List[int]): the list of variables to condition on
+            output_option (str): the option to pass to the T-dDNNF compiler for the output file
+            output_file (str, optional): the path to the file where the conditioned T-dDNNF will be saved. Defaults to None
+
+        Returns:
+            List[str]: the command and its arguments
+        """
         if (len(vars_to_condition) == 0):
             raise ValueError("No variables to condition on")
-        condition_option = "-c "
-        for var in vars_to_condition:
-            condition_option += str(var) + " "
-        # trim the trailing space
-        condition_option = condition_option[:-1]
-        command = [_DDNNF_CONDITION_PATH, condition_option, "-i_d4",
-                   self.d4_file]
+        command = [_DDNNF_CONDITION_PATH, "-c"]
+        command.extend(str(var) for var in vars_to_condition)
+        command.extend(["-i_d4", self.d4_file])
         if output_file is not None:
             if (output_option is None):
                 # default output option
@@ -326,11 +471,7 @@ class DDNNFQueryManager(QueryInterface):
                     output_option = _CONDITION_DDNNF_OUTPUT_OPTION
             command.append(output_option)
             command.append(output_file)
-        command_str = " ".join(command)
-        result = os.system(command_str)
-        if result != 0:
-            raise RuntimeError(
-                "An error occurred while conditioning the T-dDNNF")
+        return command
 
     def _condition_body(
             self,
@@ -346,7 +487,7 @@ class DDNNFQueryManager(QueryInterface):
             float: the structure loading time
         """
         # RETRIEVE THE INDEXES ON WHICH TO OPERATE
-        alpha_items = indexes_from_mapping(alpha, self.abstraction_mapping)
+        alpha_items = [index if polarity else -index for index, polarity in self._literal_items(alpha)]
 
         self._condition_all_variables(
             alpha_items, self.output_option, output_file)
@@ -0,0 +1,142 @@
+"""module for the cache of the d4 translations of c2d d-DNNFs
+
+The translation is saved in the translation cache folder of the artifact,
+in a file named after the SHA-256 digest of the c2d d-DNNF,
+so that only the first query session on an artifact pays for the translation.
+
+- translations are written to a temporary file and renamed, so a cached translation is always complete
+- an exclusive lock on the digest makes concurrent sessions translate only once,
+  sessions that find the translation already cached do not take the lock
+- a metadata file records the size of the translation, which is checked on reuse
+- the digest of the c2d d-DNNF is memoized on its size, modification time and inode,
+  so that unchanged artifacts are not read again just to be hashed
+- at most max_entries translations are kept, the least recently used ones are evicted
+  when a new translation is added, so translations of outdated d-DNNFs do not pile up
+"""
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Callable
+
+from src.file_digests import memoized_digests, write_json_atomically
+
+_DIGEST_MEMO_FILE = "digests.json"
+
+
+def file_digest(file_path: str, cache_folder: str) -> str:
+    """computes the SHA-256 digest of a file, reusing the digest memoized for the same file state
+
+    Args:
+        file_path (str): the path to the file
+        cache_folder (str): the folder where the digests are memoized
+
+    Returns:
+        str: the hex digest of the contents of the file
+    """
+    key = os.path.abspath(file_path)
+    return memoized_digests({key: file_path}, os.path.join(cache_folder, _DIGEST_MEMO_FILE))[key]
+
+
+@contextmanager
+def _exclusive_lock(lock_path: str):
+    with open(lock_path, "a", encoding='utf8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _is_valid(translated_path: str, metadata_path: str, digest: str) -> bool:
+    """checks that a cached translation is complete and belongs to the digest"""
+    if not os.path.isfile(translated_path) or not os.path.isfile(metadata_path):
+        return False
+    try:
+        with open(metadata_path, "r", encoding='utf8') as file:
+            metadata = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return metadata.get("source digest") == digest and metadata.get("size") == os.path.getsize(translated_path)
+
+
+def _mark_used(metadata_path: str) -> None:
+    """updates the modification time of the metadata, which orders the translations for eviction"""
+    try:
+        os.utime(metadata_path)
+    except OSError:
+        pass
+
+
+def _evict(cache_folder: str, file_name: str, max_entries: int, keep: str) -> None:
+    """removes the least recently used translations so that at most max_entries are left,
+    the translation of the digest keep is never removed"""
+    entries = []
+    for name in os.listdir(cache_folder):
+        if not name.endswith(f"_{file_name}.json"):
+            continue
+        digest = name[:-len(f"_{file_name}.json")]
+        if digest == keep:
+            continue
+        try:
+            entries.append((os.path.getmtime(os.path.join(cache_folder, name)), digest))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    for _, digest in entries[max(max_entries - 1, 0):]:
+        translated_path = os.path.join(cache_folder, f"{digest}_{file_name}")
+        for path in (f"{translated_path}.json", translated_path, os.path.join(cache_folder, f"{digest}.lock")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def cached_translation(
+        source_file: str,
+        cache_folder: str,
+        file_name: str,
+        translate: Callable[[str, str], None],
+        max_entries: int) -> tuple[str, bool]:
+    """returns the path to the cached translation of source_file, translating it if it is not cached
+
+    Args:
+        source_file (str): the path to the file to translate
+        cache_folder (str): the folder of the cache
+        file_name (str): the name of the translated file, prefixed with the digest of source_file in the cache
+        translate (Callable[[str,str],None]): the function that translates its first argument into its second argument
+        max_entries (int): the maximum number of translations kept in the cache
+
+    Returns:
+        tuple[str,bool]: the path to the translated file and True if it was found in the cache
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+    digest = file_digest(source_file, cache_folder)
+    translated_path = os.path.join(cache_folder, f"{digest}_{file_name}")
+    metadata_path = f"{translated_path}.json"
+    if _is_valid(translated_path, metadata_path, digest):
+        _mark_used(metadata_path)
+        return translated_path, True
+
+    with _exclusive_lock(os.path.join(cache_folder, f"{digest}.lock")):
+        # another session may have translated while waiting for the lock
+        if _is_valid(translated_path, metadata_path, digest):
+            _mark_used(metadata_path)
+            return translated_path, True
+        descriptor, temporary_path = tempfile.mkstemp(dir=cache_folder, suffix=".tmp")
+        os.close(descriptor)
+        try:
+            translate(source_file, temporary_path)
+            with open(temporary_path, "rb") as file:
+                os.fsync(file.fileno())
+            os.replace(temporary_path, translated_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        write_json_atomically(
+            {"source digest": digest, "size": os.path.getsize(translated_path)},
+            metadata_path)
+        _evict(cache_folder, file_name, max_entries, digest)
+    return translated_path, False
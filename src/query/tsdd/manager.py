@@ -1,24 +1,36 @@
 """module where all the queries functions are defined"""
 
+import copy
+import os
+import tempfile
 import time
 from typing import Dict, List, Tuple
 
+import numpy as np
 from pysmt.fnode import FNode
+from pysmt.shortcuts import And, FALSE, Not, Or, TRUE, is_sat
 
 from theorydd.tdd.theory_sdd import TheorySDD
+from theorydd.formula import get_normalized, load_abstraction_function
 
-from src.query.util import indexes_from_mapping, is_tsdd_loading_folder_correct
+from src.query.util import is_tsdd_loading_folder_correct, normalize_literal_weights, normalize_refinement
 from src.query.query_interface import QueryInterface
+from src.theory_lemmas import build_lemmas, has_new_theory_atoms
 
 
 class TSDDQueryManager(QueryInterface):
     """manager to handle all queries on T-SDDs"""
 
+    # the T-SDD the manager was built on, None when it is loaded from source_folder
+    in_memory_tsdd: TheorySDD | None
+
     def __init__(
             self,
             source_folder: str,
             refinement_mapping: Dict[str, FNode] | None = None,
-            abstraction_mapping: Dict[FNode, str] | None = None):
+            abstraction_mapping: Dict[FNode, str] | None = None,
+            tsdd: TheorySDD | None = None,
+            normalized: bool = False):
         """
         initialize the manager
         Always provide either the refinement_mapping or the abstraction_mapping or both when initializing the object,
@@ -28,16 +40,54 @@ class TSDDQueryManager(QueryInterface):
             source_folder (str): the path to the folder where the serialized compiled formula is stored
             refinement_mapping (Dict[int, FNode]) [None]: the mapping of the indices on the compiled formula's abstraction to the atoms in its refinement
             abstraction_mapping (Dict[FNode, int]) [None]: the mapping of the atoms of the formula to the indices in the compiled formula's abstraction
+            tsdd (TheorySDD) [None]: the T-SDD to query, when it is already in memory
+            normalized (bool) [False]: True if the atoms of the mapping are already normalized
         """
-        super().__init__(source_folder, refinement_mapping, abstraction_mapping)
+        super().__init__(source_folder, refinement_mapping, abstraction_mapping, normalized)
+        self.in_memory_tsdd = tsdd
 
         start_time = time.time()
         self.tsdd = self._load_tsdd()
         self.loading_time = time.time() - start_time
         self.details["loading time"] = self.loading_time
 
-    def _load_tsdd(self) -> TheorySDD:
-        """function to load the T-SDD from the serialized files"""
+    @classmethod
+    def from_tsdd(cls, tsdd: TheorySDD, refinement_mapping: Dict[int, FNode]) -> 'TSDDQueryManager':
+        """builds a manager on a T-SDD in memory, without serializing it
+
+        Features that read or write the artifact folder, like the literal index, are not available
+
+        Args:
+            tsdd (TheorySDD): the T-SDD
+            refinement_mapping (Dict[int, FNode]): the mapping of the indices of the atoms of the formula to the normalized atoms,
+                without the existentially quantified variables
+
+        Returns:
+            TSDDQueryManager: the manager
+        """
+        return cls("", refinement_mapping=refinement_mapping, tsdd=tsdd, normalized=True)
+
+    def _load_tsdd(self, detached: bool = False) -> TheorySDD:
+        """function to load the T-SDD from the serialized files,
+        or to copy the T-SDD in memory so that queries that modify it leave it untouched
+
+        Args:
+            detached (bool) [False]: if True, a T-SDD in memory is copied on a fresh SDD manager,
+                for the queries that add new variables
+
+        Returns:
+            TheorySDD: the T-SDD
+        """
+        if self.in_memory_tsdd is not None:
+            if detached:
+                # a shallow copy shares the SDD manager of the T-SDD in memory
+                with tempfile.TemporaryDirectory() as folder:
+                    self.in_memory_tsdd.save_to_folder(folder)
+                    return TheorySDD(None, folder_name=folder, solver=self.normalizer_solver)
+            tsdd = copy.copy(self.in_memory_tsdd)
+            tsdd.abstraction = dict(self.in_memory_tsdd.abstraction)
+            tsdd.refinement = dict(self.in_memory_tsdd.refinement)
+            return tsdd
         return TheorySDD(None, folder_name=self.source_folder, solver=self.normalizer_solver)
 
     def _check_consistency(self) -> Tuple[bool, float]:
@@ -83,10 +133,7 @@ class TSDDQueryManager(QueryInterface):
             float: the structure loading time
         """
         # RETRIEVE THE INDEXES ON WHICH TO OPERATE
-        clause_indexes = indexes_from_mapping(clause, self.abstraction_mapping)
-
-        # clause_items = [(item[0] if item[1] else -item[0], item[1]) for item in clause_indexes]
-        clause_items = [(item if item > 0 else -item, item > 0) for item in clause_indexes]
+        clause_items = self._literal_items(clause)
 
         return self._check_entail_clause_random_body(clause_items)
 
@@ -131,9 +178,7 @@ class TSDDQueryManager(QueryInterface):
             float: the structure loading time
         """
         # RETRIEVE THE INDEX ON WHICH TO OPERATE
-        term_index = indexes_from_mapping(term, self.abstraction_mapping)[0]
-
-        term_item = (term_index[0] if term_index[1] else -term_index[0], term_index[1])
+        term_item = self._literal_items(term)[0]
 
         return self._check_implicant_random_body(term_item)
         
@@ -181,6 +226,146 @@ class TSDDQueryManager(QueryInterface):
 
         return model_count, load_time
 
+    def _marginal_counts(self) -> Tuple[Dict[int, Tuple[int, int]], int, int, float]:
+        """function to count the models where each literal is true,
+        with one upward (model counting) and one downward (derivative) pass over the T-SDD
+
+        Counts are over all the variables of the SDD manager and computed with exact integers.
+        The upward pass computes Q(u) = 2^n P(u), where P(u) is the probability of u when each variable is true with probability 1/2:
+        a literal has Q = 2^(n-1) and a decision node Q = sum of Q(prime) Q(sub) / 2^n, exact since primes and subs share no variables.
+        The downward pass computes the derivative D of the root with respect to the probability of each variable (scaled by 2^n),
+        so that the models where x is true are Q(root)/2 + D/4 and those where x is false Q(root)/2 - D/4.
+
+        Returns:
+            Dict[int,Tuple[int,int]]: for each atom index, the number of models where the atom is true and where it is false
+            int: the number of variables the models are counted on
+            int: the number of models
+            float: the structure loading time
+        """
+        start_time = time.time()
+        tsdd = self._load_tsdd()
+        load_time = time.time() - start_time
+
+        n_vars = tsdd.manager.var_count()
+        total = 2 ** n_vars
+
+        # UPWARD PASS: MODEL COUNTS, nodes are collected children first
+        counts = {}
+        ordered = []
+
+        def count(node) -> int:
+            if node.is_true():
+                return total
+            if node.is_false():
+                return 0
+            return counts[node.id]
+
+        stack = [(tsdd.root, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node.is_true() or node.is_false() or node.id in counts:
+                continue
+            if node.is_literal():
+                counts[node.id] = total // 2
+                ordered.append(node)
+            elif expanded:
+                counts[node.id] = sum(count(prime) * count(sub) for prime, sub in node.elements()) // total
+                ordered.append(node)
+            else:
+                stack.append((node, True))
+                for prime, sub in node.elements():
+                    stack.append((prime, False))
+                    stack.append((sub, False))
+
+        # DOWNWARD PASS: DERIVATIVES, parents are visited before their children
+        adjoints = {node.id: 0 for node in ordered}
+        if tsdd.root.id in adjoints:
+            adjoints[tsdd.root.id] = total
+        derivatives = [0] * (n_vars + 1)
+        for node in reversed(ordered):
+            adjoint = adjoints[node.id]
+            if adjoint == 0:
+                continue
+            if node.is_literal():
+                literal = node.literal
+                derivatives[abs(literal)] += adjoint if literal > 0 else -adjoint
+                continue
+            for prime, sub in node.elements():
+                if prime.id in adjoints:
+                    adjoints[prime.id] += adjoint * count(sub) // total
+                if sub.id in adjoints:
+                    adjoints[sub.id] += adjoint * count(prime) // total
+
+        root_count = count(tsdd.root)
+        marginals = {}
+        for index in self.refinement_mapping.keys():
+            derivative = derivatives[index]
+            marginals[index] = ((2 * root_count + derivative) // 4,
+                                (2 * root_count - derivative) // 4)
+
+        return marginals, n_vars, root_count, load_time
+
+    def _weighted_model_counts(
+            self,
+            weights: Dict[int, Tuple[np.ndarray, np.ndarray]],
+            batch: int) -> Tuple[np.ndarray, float]:
+        """function to compute the weighted model counts for a batch of weight vectors,
+        with one upward pass over the T-SDD where each node holds the values for all the weight vectors
+
+        The weights of each variable are scaled to sum to 1, so that a node is valued by the probability of its function:
+        a decision node is the sum over its elements of the products of the probabilities of prime and sub,
+        and variables that a node does not mention need no smoothing.
+        The probability of the root is then scaled back by the product of the sums of the weights.
+
+        Returns:
+            np.ndarray: the weighted model count for each weight vector
+            float: the structure loading time
+        """
+        start_time = time.time()
+        tsdd = self._load_tsdd()
+        load_time = time.time() - start_time
+
+        # row 0 is unused, SDD variables start from 1
+        n_vars = tsdd.manager.var_count()
+        positive = np.ones((n_vars + 1, batch))
+        negative = np.ones((n_vars + 1, batch))
+        for index, (positive_weights, negative_weights) in weights.items():
+            positive[index] = positive_weights
+            negative[index] = negative_weights
+        positive, negative, sums = normalize_literal_weights(positive, negative)
+
+        probabilities = {}
+        ones = np.ones(batch)
+        zeros = np.zeros(batch)
+
+        def probability(node) -> np.ndarray:
+            if node.is_true():
+                return ones
+            if node.is_false():
+                return zeros
+            return probabilities[node.id]
+
+        stack = [(tsdd.root, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node.is_true() or node.is_false() or node.id in probabilities:
+                continue
+            if node.is_literal():
+                literal = node.literal
+                probabilities[node.id] = positive[literal] if literal > 0 else negative[-literal]
+            elif expanded:
+                result = np.zeros(batch)
+                for prime, sub in node.elements():
+                    result = result + probability(prime) * probability(sub)
+                probabilities[node.id] = result
+            else:
+                stack.append((node, True))
+                for prime, sub in node.elements():
+                    stack.append((prime, False))
+                    stack.append((sub, False))
+
+        return probability(tsdd.root) * np.prod(sums[1:], axis=0), load_time
+
     def _enumerate_models(self) -> float:
         """function to enumerate all models for the encoded formula
 
@@ -211,7 +396,7 @@ class TSDDQueryManager(QueryInterface):
             float: the structure loading time
         """
         # RETRIEVE THE INDEXES ON WHICH TO OPERATE
-        alpha_items = indexes_from_mapping(alpha, self.abstraction_mapping)
+        alpha_items = [index if polarity else -index for index, polarity in self._literal_items(alpha)]
 
         # LOAD THE T-SDD
         start_time = time.time()
@@ -259,6 +444,181 @@ class TSDDQueryManager(QueryInterface):
         for item in items:
             tsdd.condition(item)
 
+    def _load_aligned_tsdds(self, data_folder: str) -> Tuple[TheorySDD, object, Dict[FNode, int], List[FNode], float]:
+        """loads the queried T-SDD and the T-SDD in data_folder in the SDD manager of the queried one
+
+        The atoms of both T-SDDs are normalized and matched through their abstraction functions,
+        atoms that only appear in the T-SDD in data_folder are added as new variables after the last one.
+        If both T-SDDs share the same vtree and atom indexes, the other SDD is read directly into the manager,
+        otherwise it is transplanted on the vtree of the queried T-SDD
+
+        Args:
+            data_folder (str): the path to the folder where the other T-SDD is stored
+
+        Returns:
+            TheorySDD: the queried T-SDD, extended with the atoms of the other T-SDD
+            object: the root of the other T-SDD in the SDD manager of the queried T-SDD
+            Dict[FNode,int]: the index of each normalized atom in the queried T-SDD
+            List[FNode]: the normalized atoms of the other T-SDD
+            float: the structure loading time
+        """
+        if not is_tsdd_loading_folder_correct(data_folder):
+            raise ValueError(
+                "The data folder is not in the correct format for T-SDDs")
+        start_time = time.time()
+        tsdd = self._load_tsdd(detached=True)
+        other_abstraction = load_abstraction_function(os.path.join(data_folder, "abstraction.json"))
+        load_time = time.time() - start_time
+
+        own_abstraction = {v: k for k, v in normalize_refinement(
+            {v: k for k, v in tsdd.abstraction.items()}, self.normalizer_solver).items()}
+        other_refinement = normalize_refinement(
+            {v: k for k, v in other_abstraction.items()}, self.normalizer_solver)
+        other_atoms = list(other_refinement.values())
+
+        # SHARED VTREE: THE OTHER SDD CAN BE READ AS IT IS
+        if self._same_vtree(data_folder) and all(
+                own_abstraction.get(atom) == index for index, atom in other_refinement.items()):
+            start_time = time.time()
+            other_root = tsdd.manager.read_sdd_file(
+                os.path.join(data_folder, "sdd.sdd").encode())
+            load_time += time.time() - start_time
+            return tsdd, other_root, own_abstraction, other_atoms, load_time
+
+        # DIFFERENT VTREES: TRANSPLANT THE OTHER SDD
+        start_time = time.time()
+        other = TheorySDD(None, folder_name=data_folder, solver=self.normalizer_solver)
+        load_time += time.time() - start_time
+        renaming = {}
+        for index, atom in other_refinement.items():
+            if atom not in own_abstraction:
+                tsdd.manager.add_var_after_last()
+                new_index = tsdd.manager.var_count()
+                tsdd.abstraction[atom] = new_index
+                tsdd.refinement[new_index] = atom
+                own_abstraction[atom] = new_index
+            renaming[index] = own_abstraction[atom]
+        other_root = self._transplant(tsdd, renaming, other.root)
+        return tsdd, other_root, own_abstraction, other_atoms, load_time
+
+    def _same_vtree(self, data_folder: str) -> bool:
+        """True if the T-SDD in data_folder was saved with the same vtree of the queried T-SDD"""
+        if self.in_memory_tsdd is not None:
+            # the vtree of a T-SDD in memory is not saved, the other T-SDD is transplanted
+            return False
+        with open(os.path.join(self.source_folder, "vtree.vtree"), "r", encoding='utf8') as own_file:
+            with open(os.path.join(data_folder, "vtree.vtree"), "r", encoding='utf8') as other_file:
+                return own_file.read() == other_file.read()
+
+    def _transplant(self, target: TheorySDD, renaming: Dict[int, int], root):
+        """rebuilds root in the SDD manager of target, renaming variables along the way
+
+        Nodes are rebuilt bottom-up with an explicit stack, so that deep SDDs do not hit the recursion limit
+
+        Args:
+            target (TheorySDD): the T-SDD where root is rebuilt
+            renaming (Dict[int,int]): the index in target of each variable of the SDD that owns root
+            root: the node to rebuild
+
+        Returns:
+            the rebuilt node
+        """
+        # the nodes already rebuilt, keyed by their id
+        computed: Dict[int, object] = {}
+
+        def rebuilt(node):
+            if node.is_true():
+                return target.manager.true()
+            if node.is_false():
+                return target.manager.false()
+            return computed[node.id]
+
+        stack = [(root, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node.is_true() or node.is_false() or node.id in computed:
+                continue
+            if node.is_literal():
+                literal = node.literal
+                computed[node.id] = target.manager.literal(
+                    renaming[abs(literal)] if literal > 0 else -renaming[abs(literal)])
+                continue
+            elements = node.elements()
+            if not expanded:
+                stack.append((node, True))
+                for prime, sub in elements:
+                    stack.append((prime, False))
+                    stack.append((sub, False))
+                continue
+            # a decision node is the disjunction of its elements (prime and sub)
+            result = target.manager.false()
+            for prime, sub in elements:
+                result = result | (rebuilt(prime) & rebuilt(sub))
+            computed[node.id] = result
+        return rebuilt(root)
+
+    def _refined_formula(self, tsdd: TheorySDD, root) -> FNode:
+        """the refinement of a node of the T-SDD, as a formula on the atoms of the T-SDD
+
+        Each decision node becomes the disjunction of its elements (prime & sub), shared nodes are translated once
+
+        Args:
+            tsdd (TheorySDD): the T-SDD that owns root
+            root: the node to translate
+
+        Returns:
+            FNode: the refinement of root
+        """
+        computed: Dict[int, FNode] = {}
+
+        def refined(node) -> FNode:
+            if node.is_true():
+                return TRUE()
+            if node.is_false():
+                return FALSE()
+            return computed[node.id]
+
+        stack = [(root, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node.is_true() or node.is_false() or node.id in computed:
+                continue
+            if node.is_literal():
+                literal = node.literal
+                atom = tsdd.refinement[abs(literal)]
+                computed[node.id] = atom if literal > 0 else Not(atom)
+                continue
+            elements = node.elements()
+            if not expanded:
+                stack.append((node, True))
+                for prime, sub in elements:
+                    stack.append((prime, False))
+                    stack.append((sub, False))
+                continue
+            computed[node.id] = Or(*[And(refined(prime), refined(sub)) for prime, sub in elements])
+        return refined(root)
+
+    def _lemmas_root(self, tsdd: TheorySDD, abstraction: Dict[FNode, int], tlemmas: List[FNode]):
+        """builds the conjunction of the lemmas in the SDD manager of the T-SDD
+
+        Args:
+            tsdd (TheorySDD): the T-SDD
+            abstraction (Dict[FNode,int]): the index of each normalized atom in the T-SDD
+            tlemmas (List[FNode]): the lemmas
+
+        Returns:
+            the root of the conjunction of the lemmas
+        """
+        converter = self.normalizer_solver.get_converter()
+
+        def atom_node(atom: FNode):
+            normalized = get_normalized(atom, converter)
+            if normalized not in abstraction:
+                raise RuntimeError(f"The theory lemmas contain an atom that is not in the T-SDDs: {atom.serialize()}")
+            return tsdd.manager.literal(abstraction[normalized])
+
+        return build_lemmas(tlemmas, atom_node, tsdd.manager.true())
+
     def check_entail(self, data_folder: str) -> bool:
         """function to check entailment of the compiled formula with respect to the data in data_folder.
         The data in data folder must be of the correct format, which is the same of for the queried structure
@@ -269,23 +629,47 @@ class TSDDQueryManager(QueryInterface):
         Returns:
             bool: True if the compiled formula entails the data, False otherwise
         """
-        if not is_tsdd_loading_folder_correct(data_folder):
-            raise ValueError(
-                "The data folder is not in the correct format fro T-SDDs")
-        raise NotImplementedError()
-
-    def conjunction(self, data_folder: str, output_path: str | None = None) -> None:
+        tsdd, other_root, _abstraction, other_atoms, load_time = self._load_aligned_tsdds(data_folder)
+        start_time = time.time()
+        # phi entails data iff phi and not data is T-unsatisfiable
+        difference = tsdd.root & ~other_root
+        if difference.is_false():
+            entailment = True
+        elif has_new_theory_atoms(other_atoms, list(self.refinement_mapping.values())):
+            # not data can be T-inconsistent on the atoms that phi does not have
+            entailment = not is_sat(self._refined_formula(tsdd, difference), solver_name="msat")
+        else:
+            # the models of phi are T-consistent on all the atoms
+            entailment = False
+        self.details["entail"] = entailment
+        self.details["entail loading time"] = load_time
+        self.details["entail time"] = time.time() - start_time
+        return entailment
+
+    def conjunction(self, data_folder: str, output_path: str | None = None, tlemmas: List[FNode] | None = None) -> None:
         """function to compute the conjunction of the compiled formula the data in data_folder.
         The data in data folder must be of the correct format, which is the same of for the queried structure
 
         Args:
             data_folder (str): the path to the folder where the data is stored
             output_path (str | None) [None]: the path to the file where the conjunction will be saved
+            tlemmas (List[FNode] | None) [None]: the lemmas that mix the atoms of the two formulas, when they were already enumerated
         """
-        if not is_tsdd_loading_folder_correct(data_folder):
-            raise ValueError(
-                "The data folder is not in the correct format fro T-SDDs")
-        raise NotImplementedError()
+        tsdd, other_root, abstraction, other_atoms, load_time = self._load_aligned_tsdds(data_folder)
+        own_atoms = list(self.refinement_mapping.values())
+        start_time = time.time()
+        root = tsdd.root & other_root
+        combined = None
+        if has_new_theory_atoms(other_atoms, own_atoms) and has_new_theory_atoms(own_atoms, other_atoms):
+            combined = self._refined_formula(tsdd, root)
+        tlemmas = self._combination_lemmas("conjunction", combined, tlemmas=tlemmas)
+        tsdd.root = root & self._lemmas_root(tsdd, abstraction, tlemmas)
+        self.details["conjunction loading time"] = load_time
+        self.details["conjunction time"] = time.time() - start_time - self.details["conjunction lemmas time"]
+        if output_path is not None:
+            result_lemmas = self._result_lemmas(tlemmas, data_folder)
+            tsdd.save_to_folder(output_path)
+            self._save_result_lemmas(output_path, result_lemmas)
 
     def disjunction(self, data_folder: str, output_path: str | None = None) -> None:
         """function to compute the disjunction of the compiled formula the data in data_folder.
@@ -295,10 +679,22 @@ class TSDDQueryManager(QueryInterface):
             data_folder (str): the path to the folder where the data is stored
             output_path (str | None) [None]: the path to the file where the disjunction will be saved
         """
-        if not is_tsdd_loading_folder_correct(data_folder):
-            raise ValueError(
-                "The data folder is not in the correct format fro T-SDDs")
-        raise NotImplementedError()
+        tsdd, other_root, abstraction, other_atoms, load_time = self._load_aligned_tsdds(data_folder)
+        own_atoms = list(self.refinement_mapping.values())
+        start_time = time.time()
+        root = tsdd.root | other_root
+        combined = None
+        # each formula must also be consistent on the atoms that only the other one has
+        if has_new_theory_atoms(other_atoms, own_atoms) or has_new_theory_atoms(own_atoms, other_atoms):
+            combined = self._refined_formula(tsdd, root)
+        tlemmas = self._combination_lemmas("disjunction", combined)
+        tsdd.root = root & self._lemmas_root(tsdd, abstraction, tlemmas)
+        self.details["disjunction loading time"] = load_time
+        self.details["disjunction time"] = time.time() - start_time - self.details["disjunction lemmas time"]
+        if output_path is not None:
+            result_lemmas = self._result_lemmas(tlemmas, data_folder)
+            tsdd.save_to_folder(output_path)
+            self._save_result_lemmas(output_path, result_lemmas)
 
     def negation(self, output_path: str | None = None) -> None:
         """function to compute the negation of the compiled formula
@@ -306,4 +702,20 @@ class TSDDQueryManager(QueryInterface):
         Args:
             output_path (str | None) [None]: the path to the file where the negation will be saved
         """
-        raise NotImplementedError()
+        start_time = time.time()
+        tsdd = self._load_tsdd()
+        load_time = time.time() - start_time
+        start_time = time.time()
+        # the negation keeps the lemmas of the compiled formula,
+        # they are enumerated again only if they were not saved with it
+        saved_lemmas = self._saved_lemmas()
+        combined = self._refined_formula(tsdd, tsdd.root) if saved_lemmas is None else None
+        tlemmas = self._combination_lemmas("negation", combined, tlemmas=saved_lemmas)
+        abstraction = {v: k for k, v in normalize_refinement(
+            {v: k for k, v in tsdd.abstraction.items()}, self.normalizer_solver).items()}
+        tsdd.root = ~tsdd.root & self._lemmas_root(tsdd, abstraction, tlemmas)
+        self.details["negation loading time"] = load_time
+        self.details["negation time"] = time.time() - start_time - self.details["negation lemmas time"]
+        if output_path is not None:
+            tsdd.save_to_folder(output_path)
+            self._save_result_lemmas(output_path, tlemmas)
@@ -1,11 +1,14 @@
 """utility functions for query_ddnnf"""
+import json
 import os
 import random
 from typing import Dict, List, Tuple
+
+import numpy as np
 from pysmt.fnode import FNode
 from pysmt.shortcuts import Not, Or
 from theorydd.solvers.solver import SMTEnumerator
-from theorydd.formula import get_normalized, get_atoms, save_phi, top, bottom, big_and, without_double_neg
+from theorydd.formula import get_normalized, save_phi, top, bottom, big_and, without_double_neg
 
 import signal
 from contextlib import contextmanager
@@ -271,99 +274,6 @@ def normalize_refinement(refinement: Dict[int | str, FNode], normalizer_solver:
 #         super().__init__(message)
 
 
-def indexes_from_mapping(phi: FNode, abstraction: Dict[FNode, int]) -> List[int]:
-    """applyies the mapping to retrive the list of integer indexes,
-    where a negative value implies a negated index
-
-    Args:
-        phi (FNode): a clause, cube or term formula
-        abstraction (Dict[FNode,int]): a mapping from atoms to integers
-
-    Returns:
-        (List[int]) : the list of corresponding indexes, a negative value implies a negated atom"""
-    index_items = []
-    if is_term(phi):
-        index_items.append(_indexes_from_arg(phi, abstraction))
-    elif is_clause(phi) or is_cube(phi):
-        for arg in phi.args():
-            index_items.append(_indexes_from_arg(arg, abstraction))
-    else:
-        raise ValueError(
-            "Cannot extract indexes from a formula which is not a cube, clause or term!")
-    return index_items
-
-
-def _indexes_from_arg(phi: FNode, abstraction: Dict[FNode, int]) -> int:
-    """applyies the mapping to retrive the integer index of a single term
-
-    Args:
-        phi (FNode): a FNode which only contains an atom
-        abstraction (Dict[FNode,int]): a mapping from atoms to integers
-
-    Returns:
-        (int) : the corresponding index, a negative value implies a negated atom
-    """
-    index = 1
-    atom = get_atoms(phi)[0]
-    # check if the atom is negated as a key in the abstraction
-    # in case that happens treat the atom as negated
-    if atom not in abstraction.keys():
-        index = -1
-        atom = Not(atom)
-    index = index * abstraction[atom]
-    if is_negated(phi):
-        index *= -1
-    return index
-
-
-def aliases_from_mapping(phi: FNode, abstraction: Dict[FNode, str]) -> List[str]:
-    """applyies the mapping to retrieve the list of string aliases,
-    where a string starting with "-" indicates a negated alias
-
-    Args:
-        phi (FNode): a clause, cube or term formula
-        abstraction (Dict[FNode,str]): a mapping from atoms to strings
-
-    Returns:
-        (List[str]) : the list of corresponding aliases, a string starting with "-" implies a negated atom
-    """
-    alias_items = []
-    if is_term(phi):
-        alias_items.append(_aliases_from_arg(phi, abstraction))
-    elif is_clause(phi) or is_cube(phi):
-        for arg in phi.args():
-            alias_items.append(_aliases_from_arg(arg, abstraction))
-    else:
-        raise ValueError(
-            "Cannot extract indexes from a formula which is not a cube, clause or term!")
-    return alias_items
-
-
-def _aliases_from_arg(phi: FNode, mapping: Dict[FNode, str]) -> str:
-    """applyies the mapping to retrieve the string alias of a single term
-
-    Args:
-        phi (FNode): a FNode which only contains an atom
-        mapping (Dict[FNode,str]): a mapping from atoms to strings
-
-    Returns:
-        (str) : the corresponding alias, starting with a - if the atom is negated
-    """
-    alias_start = ""
-    atom = get_atoms(phi)[0]
-    # check if the atom in the mapping is negated
-    if atom not in mapping.keys():
-        alias_start = "-"
-        atom = Not(atom)
-    alias = alias_start + mapping[atom]
-    if is_negated(phi):
-        if alias.startswith("-"):
-            alias = alias[1:]
-        else:
-            alias = "-" + alias
-    return alias
-
-
 def create_random_clause(atoms: List[FNode], filename: str, seed: int | None = None) -> None:
     """
     creates a random clause from the given atoms and saves it to the specified SMT2 file
@@ -440,13 +350,93 @@ def select_random_items(items: List[object], amount: int | None = None, random_s
     Returns:
         List[Tuple(object,bool)]: the list of selected items, each pèaired with a boolean indicating if the item is positive or negative
     """
-    if random_seed is not None:
-        random.seed(random_seed)
+    # a local generator gives the same items as seeding the global one, without touching the global state
+    rng = random.Random(random_seed)
+    items = list(items)
 
     if amount is None:
-        amount = random.randint(1, max(1, len(items)//2))
+        amount = rng.randint(1, max(1, len(items)//2))
 
-    samples = random.sample(items, amount)
+    samples = rng.sample(items, amount)
 
-    result = [(sample, random.choice([True, False])) for sample in samples]
+    result = [(sample, rng.choice([True, False])) for sample in samples]
     return result
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """computes a percentile with the nearest-rank method
+
+    Args:
+        values (List[float]): the values, not necessarily sorted
+        pct (float): the percentile, between 0 and 100
+
+    Returns:
+        float: the smallest value such that at least pct% of the values are lower or equal to it
+    """
+    if len(values) == 0:
+        raise ValueError("Cannot compute a percentile of no values")
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def read_literal_weights(weights_file: str) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], int]:
+    """reads a batch of weight vectors for the literals of the atoms
+
+    The file is a JSON object from each atom (in SMT-LIB format) to the weights of its literals, either:
+    - a number or a list of numbers, the weights of the positive literal, the negative literal weighs 1 - w
+    - an object with keys "positive" and "negative", each a number or a list of numbers
+    Lists hold one weight for each weight vector of the batch and all have the same length,
+    numbers are the same for all the weight vectors
+
+    Args:
+        weights_file (str): the path to the JSON file
+
+    Returns:
+        Dict[str,Tuple[np.ndarray,np.ndarray]]: for each atom, the weights of its positive and negative literal in every weight vector
+        int: the number of weight vectors
+    """
+    with open(weights_file, "r", encoding='utf8') as file:
+        data = json.load(file)
+    if not isinstance(data, dict):
+        raise ValueError("The weights file must contain a JSON object from atoms to weights")
+    raw_weights = {}
+    for atom, weight in data.items():
+        if isinstance(weight, dict):
+            positive = np.asarray(weight["positive"], dtype=float)
+            negative = np.asarray(weight["negative"], dtype=float)
+        else:
+            positive = np.asarray(weight, dtype=float)
+            negative = 1.0 - positive
+        if positive.ndim > 1 or negative.ndim > 1:
+            raise ValueError(f"Invalid weights for atom {atom}")
+        raw_weights[atom] = (positive, negative)
+    lengths = {array.size for pair in raw_weights.values() for array in pair if array.ndim == 1}
+    if len(lengths) > 1:
+        raise ValueError("All the lists of weights must have the same length")
+    batch = lengths.pop() if len(lengths) > 0 else 1
+    weights = {
+        atom: (np.broadcast_to(positive, (batch,)).copy(), np.broadcast_to(negative, (batch,)).copy())
+        for atom, (positive, negative) in raw_weights.items()}
+    return weights, batch
+
+
+def normalize_literal_weights(positive: np.ndarray, negative: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """scales the weights of the two literals of each variable so that they sum to 1
+
+    The weighted model count is then the probability of the formula when every variable is independently true
+    with its scaled positive weight, times the product of the sums of the weights of the variables
+
+    Args:
+        positive (np.ndarray): the weights of the positive literals, one row for each variable and one column for each weight vector
+        negative (np.ndarray): the weights of the negative literals, with the same shape
+
+    Returns:
+        np.ndarray: the scaled weights of the positive literals
+        np.ndarray: the scaled weights of the negative literals
+        np.ndarray: the sums of the weights of the two literals of each variable
+    """
+    sums = positive + negative
+    if np.any(sums == 0):
+        raise ValueError("The weights of the two literals of a variable must not sum to zero")
+    return positive / sums, negative / sums, sums
@@ -0,0 +1,234 @@
+"""module to generate reproducible query workloads and replay them on any query manager
+
+A workload is a list of queries over the atoms of a compiled formula, drawn according to a WorkloadSpec:
+- the mix gives the relative weight of each kind of query (consistency, clausal entailment, implicant, conditioning)
+- the size distribution gives the relative weight of each number of literals in clauses and cubes
+- the Zipf exponent skews the popularity of atoms, so that few atoms appear in most of the queries
+
+The same spec and the same atoms always produce the same workload.
+
+The replay driver runs a workload on a QueryInterface and reports throughput and latency percentiles.
+In closed-loop mode the next query is issued as soon as the previous one is answered,
+so the latency of a query is its service time.
+In open-loop mode queries arrive as a Poisson process with the given rate regardless of how fast they are answered,
+and are served one at a time in order of arrival, so the latency of a query also includes the time spent waiting.
+Service times never include the time spent (re)loading the structure, as for all other queries.
+"""
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from src.query.query_interface import QueryInterface
+from src.query.util import time_limit, percentile, LocalTimeoutException
+from src.query.constants import VALID_REPLAY_MODES
+
+WORKLOAD_QUERY_KINDS = ["consistency", "entail_clause", "implicant", "condition"]
+
+REPORTED_PERCENTILES = [50, 95, 99]
+
+
+@dataclass
+class WorkloadSpec:
+    """dataclass that describes a workload"""
+    queries: int = 100
+    seed: int = 0
+    mix: Dict[str, float] = field(default_factory=lambda: {
+        "consistency": 1.0,
+        "entail_clause": 1.0,
+        "implicant": 1.0,
+        "condition": 1.0})
+    size_distribution: Dict[int, float] = field(default_factory=lambda: {1: 1.0, 3: 1.0, 5: 1.0})
+    zipf_exponent: float = 0.0
+
+    def __post_init__(self):
+        for kind in self.mix.keys():
+            if kind not in WORKLOAD_QUERY_KINDS:
+                raise ValueError(
+                    f"Invalid query kind {kind} in the workload mix. Valid kinds are {WORKLOAD_QUERY_KINDS}")
+        if sum(self.mix.values()) <= 0:
+            raise ValueError("The workload mix must have at least one positive weight")
+        # sizes are strings when the spec is loaded from JSON
+        self.size_distribution = {int(size): weight for size, weight in self.size_distribution.items()}
+        if any(size < 1 for size in self.size_distribution.keys()) or sum(self.size_distribution.values()) <= 0:
+            raise ValueError("The size distribution must have positive sizes and at least one positive weight")
+        if self.queries < 1:
+            raise ValueError("A workload must contain at least one query")
+        if self.zipf_exponent < 0:
+            raise ValueError("The Zipf exponent must not be negative")
+
+    @staticmethod
+    def from_file(spec_file: str) -> 'WorkloadSpec':
+        """load a workload spec from a JSON file, missing fields take their default value
+
+        Args:
+            spec_file (str): the path to the JSON file
+
+        Returns:
+            WorkloadSpec: the loaded spec
+        """
+        with open(spec_file, "r", encoding='utf8') as file:
+            return WorkloadSpec(**json.load(file))
+
+
+@dataclass
+class WorkloadQuery:
+    """a query of a workload, items are pairs (atom key in the refinement mapping, polarity)"""
+    kind: str
+    items: List[Tuple[object, bool]]
+
+
+def _sample_atoms(rng: random.Random, atoms: List[object], weights: List[float], amount: int) -> List[object]:
+    """samples amount distinct atoms, each with probability proportional to its weight"""
+    amount = min(amount, len(atoms))
+    chosen = []
+    chosen_set = set()
+    while len(chosen) < amount:
+        atom = rng.choices(atoms, weights=weights)[0]
+        if atom not in chosen_set:
+            chosen_set.add(atom)
+            chosen.append(atom)
+    return chosen
+
+
+def generate_workload(spec: WorkloadSpec, query_manager: QueryInterface) -> List[WorkloadQuery]:
+    """generates the queries of a workload over the atoms of the compiled formula
+
+    Args:
+        spec (WorkloadSpec): the description of the workload
+        query_manager (QueryInterface): the manager of the compiled formula
+
+    Returns:
+        List[WorkloadQuery]: the queries of the workload
+    """
+    # sort atoms by their refinement, so that the workload does not depend on how the structure labels atoms
+    atoms = sorted(query_manager.refinement_mapping.keys(),
+                   key=lambda key: query_manager.refinement_mapping[key].serialize())
+    if len(atoms) == 0:
+        raise ValueError("Cannot generate a workload on a formula without atoms")
+    rng = random.Random(spec.seed)
+
+    # assign popularity ranks to atoms at random
+    ranked_atoms = list(atoms)
+    rng.shuffle(ranked_atoms)
+    popularity = [1.0 / ((rank + 1) ** spec.zipf_exponent) for rank in range(len(ranked_atoms))]
+
+    kinds = list(spec.mix.keys())
+    kind_weights = list(spec.mix.values())
+    sizes = list(spec.size_distribution.keys())
+    size_weights = list(spec.size_distribution.values())
+
+    workload = []
+    for _ in range(spec.queries):
+        kind = rng.choices(kinds, weights=kind_weights)[0]
+        if kind == "consistency":
+            amount = 0
+        elif kind == "implicant":
+            amount = 1
+        else:
+            amount = rng.choices(sizes, weights=size_weights)[0]
+        chosen = _sample_atoms(rng, ranked_atoms, popularity, amount)
+        workload.append(WorkloadQuery(kind, [(atom, rng.random() < 0.5) for atom in chosen]))
+    return workload
+
+
+def _run_query(query_manager: QueryInterface, query: WorkloadQuery) -> float:
+    """answers a query of the workload
+
+    Returns:
+        float: the time spent loading the structure while answering"""
+    # pylint: disable=protected-access
+    if query.kind == "consistency":
+        return query_manager._check_consistency()[1]
+    if query.kind == "entail_clause":
+        # the entailment cache and the literal index answer without the structure when enabled
+        if query_manager._entail_clause_shortcut(query.items) is not None:
+            return 0.0
+        result, load_time = query_manager._check_entail_clause_random_body(query.items)
+        query_manager._store_entailment(query.items, result)
+        return load_time
+    if query.kind == "implicant":
+        return query_manager._check_implicant_random_body(query.items[0])[1]
+    return query_manager._condition_random_body(query.items)
+
+
+def _latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """mean and percentiles of a list of latencies"""
+    stats = {"mean latency": sum(latencies) / len(latencies)}
+    for pct in REPORTED_PERCENTILES:
+        stats[f"p{pct} latency"] = percentile(latencies, pct)
+    return stats
+
+
+def replay(
+        query_manager: QueryInterface,
+        workload: List[WorkloadQuery],
+        mode: str = "closed",
+        arrival_rate: float | None = None,
+        seed: int = 0,
+        timeout: int = 600) -> Dict[str, object]:
+    """replays a workload on a query manager
+
+    Args:
+        query_manager (QueryInterface): the manager that answers the queries
+        workload (List[WorkloadQuery]): the queries to answer
+        mode (str) ["closed"]: "closed" for closed-loop replay, "open" for open-loop replay
+        arrival_rate (float | None) [None]: the mean number of queries arriving per second, required in open-loop mode
+        seed (int) [0]: the seed for the arrival times in open-loop mode
+        timeout (int) [600]: the timeout for each query in seconds, timed out queries count with the timeout as service time
+
+    Returns:
+        Dict[str,object]: the report with throughput, latency percentiles overall and for each kind of query
+    """
+    if mode not in VALID_REPLAY_MODES:
+        raise ValueError(f"Invalid replay mode {mode}. Valid modes are {VALID_REPLAY_MODES}")
+    if mode == "open" and (arrival_rate is None or arrival_rate <= 0):
+        raise ValueError("Open-loop replay requires a positive arrival rate")
+    if len(workload) == 0:
+        raise ValueError("Cannot replay an empty workload")
+
+    rng = random.Random(seed)
+    arrival = 0.0
+    server_free = 0.0
+    first_arrival = None
+    latencies: List[float] = []
+    latencies_by_kind: Dict[str, List[float]] = {}
+    timeouts = 0
+    for query in workload:
+        start_time = time.time()
+        try:
+            with time_limit(timeout):
+                load_time = _run_query(query_manager, query)
+            service_time = time.time() - start_time - load_time
+        except LocalTimeoutException:
+            timeouts += 1
+            service_time = float(timeout)
+
+        if mode == "open":
+            # single server queue on the measured service times
+            arrival += rng.expovariate(arrival_rate)
+            if first_arrival is None:
+                first_arrival = arrival
+            server_free = max(server_free, arrival) + service_time
+            latency = server_free - arrival
+        else:
+            server_free += service_time
+            latency = service_time
+        latencies.append(latency)
+        latencies_by_kind.setdefault(query.kind, []).append(latency)
+
+    elapsed = server_free - (first_arrival if first_arrival is not None else 0.0)
+    report = {
+        "mode": mode,
+        "queries": len(workload),
+        "timeouts": timeouts,
+        "throughput": len(workload) / elapsed if elapsed > 0 else float("inf")}
+    if mode == "open":
+        report["arrival rate"] = arrival_rate
+    report.update(_latency_stats(latencies))
+    report["by kind"] = {}
+    for kind, kind_latencies in latencies_by_kind.items():
+        report["by kind"][kind] = {"queries": len(kind_latencies)}
+        report["by kind"][kind].update(_latency_stats(kind_latencies))
+    return report
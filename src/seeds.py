@@ -0,0 +1,20 @@
+"""module to derive the seeds of single items from the seed of a whole run
+
+Problem generators and streams of random queries derive the seed of each item from the seed of the run and its index,
+so that every item is reproducible on its own, regardless of how many workers produce the items and in which order.
+"""
+import hashlib
+
+
+def derive_seed(seed: int, index: int) -> int:
+    """derives the seed of the index-th item of a run from the seed of the run
+
+    Args:
+        seed (int): the seed of the run
+        index (int): the position of the item in the run
+
+    Returns:
+        int: the seed of the item
+    """
+    digest = hashlib.sha256(f"{seed}:{index}".encode("utf8")).digest()
+    return int.from_bytes(digest[:8], "big")
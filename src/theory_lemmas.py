@@ -0,0 +1,164 @@
+"""module to find and enumerate the theory lemmas needed when formulas on different atoms are combined
+
+A minimal T-inconsistent set of literals only involves atoms connected through their theory variables.
+When a diagram that is already theory-consistent on its atoms meets new atoms,
+the lemmas it misses mix new atoms with old ones: they are enumerated around the new atoms only,
+on the new formula and the old atoms that share variables with it.
+"""
+import os
+from typing import Callable, Dict, List, Set, Tuple
+
+from pysmt.fnode import FNode
+from pysmt.shortcuts import Not, Or
+import theorydd.formula as formula
+from theorydd.formula import get_normalized, read_phi, save_phi
+from theorydd.solvers.mathsat_total import MathSATTotalEnumerator
+from theorydd.solvers.lemma_extractor import extract
+from theorydd.solvers.solver import SMTEnumerator
+
+ARTIFACT_LEMMAS_FILE = "lemmas.smt2"
+
+
+def affected_atoms(old_atoms: List[FNode], delta_atoms: List[FNode]) -> Tuple[List[FNode], List[FNode]]:
+    """finds the new atoms of the delta formula and the old atoms that share theory variables with them
+
+    Atoms are compared after normalization. Only the old atoms that share a variable with a new atom are returned,
+    not the ones connected to them through other old atoms, so that the enumeration stays local to the delta
+
+    Args:
+        old_atoms (List[FNode]): the atoms of the saved artifact
+        delta_atoms (List[FNode]): the atoms of the delta formula
+
+    Returns:
+        List[FNode]: the new atoms
+        List[FNode]: the old atoms that share a variable with a new atom
+    """
+    converter = MathSATTotalEnumerator().get_converter()
+    old_normalized = {get_normalized(atom, converter) for atom in old_atoms}
+    new_atoms = [atom for atom in delta_atoms if get_normalized(atom, converter) not in old_normalized]
+
+    new_variables: Set[FNode] = set()
+    for atom in new_atoms:
+        new_variables.update(atom.get_free_variables())
+    neighbours = [atom for atom in old_atoms
+                  if not atom.is_symbol() and not new_variables.isdisjoint(atom.get_free_variables())]
+    return new_atoms, neighbours
+
+
+def lemmas_in_context(phi: FNode, context_atoms: List[FNode], solver: SMTEnumerator, data_logger: Dict) -> List[FNode]:
+    """enumerates the theory lemmas of phi together with some atoms that phi does not constrain,
+    as All-SMT on phi conjoined with a valid formula on the context atoms
+
+    Args:
+        phi (FNode): the formula
+        context_atoms (List[FNode]): the atoms that the lemmas may mix with the atoms of phi
+        solver (SMTEnumerator): the solver for the enumeration
+        data_logger (Dict): where the details of the enumeration are saved
+
+    Returns:
+        List[FNode]: the lemmas
+    """
+    context = [Or(atom, Not(atom)) for atom in context_atoms]
+    _sat_result, tlemmas, _boolean_mapping = extract(
+        formula.big_and([phi] + context),
+        solver,
+        computation_logger=data_logger)
+    return tlemmas
+
+
+def has_new_theory_atoms(atoms: List[FNode], known_atoms: List[FNode]) -> bool:
+    """checks if some atom that is not a Boolean variable is missing from the known atoms,
+    Boolean variables never appear in theory lemmas
+
+    Args:
+        atoms (List[FNode]): the normalized atoms to check
+        known_atoms (List[FNode]): the normalized known atoms
+
+    Returns:
+        bool: True if some theory atom is not known
+    """
+    known = set(known_atoms)
+    return any(not atom.is_symbol() and atom not in known for atom in atoms)
+
+
+def save_artifact_lemmas(folder: str, tlemmas: List[FNode]) -> None:
+    """saves the theory lemmas of a T-BDD or T-SDD next to it,
+    so that operations on the artifact do not enumerate them again
+
+    Args:
+        folder (str): the folder where the artifact is saved
+        tlemmas (List[FNode]): the lemmas conjoined in the artifact
+    """
+    save_phi(formula.big_and(tlemmas) if len(tlemmas) > 0 else formula.top(),
+             os.path.join(folder, ARTIFACT_LEMMAS_FILE))
+
+
+def load_artifact_lemmas(folder: str) -> List[FNode] | None:
+    """loads the theory lemmas saved next to a T-BDD or T-SDD
+
+    Args:
+        folder (str): the folder where the artifact is saved
+
+    Returns:
+        List[FNode] | None: the lemmas, None if they were not saved with the artifact
+    """
+    lemmas_file = os.path.join(folder, ARTIFACT_LEMMAS_FILE)
+    if not os.path.isfile(lemmas_file):
+        return None
+    tlemmas = read_phi(lemmas_file)
+    if tlemmas.is_true():
+        return []
+    if tlemmas.is_and():
+        return list(tlemmas.args())
+    return [tlemmas]
+
+
+def build_lemmas(lemmas: List[FNode], atom_node: Callable[[FNode], object], true_node: object) -> object:
+    """builds the conjunction of the lemmas in a decision diagram,
+    with the &, | and ~ operators of its nodes
+
+    Args:
+        lemmas (List[FNode]): the lemmas
+        atom_node (Callable[[FNode],object]): the function from an atom to its node in the decision diagram
+        true_node (object): the TRUE node of the decision diagram
+
+    Returns:
+        object: the node of the conjunction of the lemmas
+    """
+    built: Dict[FNode, object] = {}
+    # lemmas are shallow Boolean combinations of atoms, built children first
+    for lemma in lemmas:
+        stack = [(lemma, False)]
+        while len(stack) > 0:
+            node, expanded = stack.pop()
+            if node in built:
+                continue
+            if node.is_bool_constant():
+                built[node] = true_node if node.is_true() else ~true_node
+            elif not (node.is_not() or node.is_and() or node.is_or() or node.is_implies() or node.is_iff()):
+                built[node] = atom_node(node)
+            elif not expanded:
+                stack.append((node, True))
+                stack.extend((arg, False) for arg in node.args() if arg not in built)
+            else:
+                args = [built[arg] for arg in node.args()]
+                if node.is_not():
+                    built[node] = ~args[0]
+                elif node.is_and():
+                    result = true_node
+                    for arg in args:
+                        result = result & arg
+                    built[node] = result
+                elif node.is_or():
+                    result = ~true_node
+                    for arg in args:
+                        result = result | arg
+                    built[node] = result
+                elif node.is_implies():
+                    built[node] = ~args[0] | args[1]
+                else:
+                    built[node] = (args[0] & args[1]) | (~args[0] & ~args[1])
+    result = true_node
+    for lemma in lemmas:
+        result = result & built[lemma]
+    return result
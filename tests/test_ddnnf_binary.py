@@ -0,0 +1,130 @@
+"""tests for the binary encoding of d-DNNFs"""
+import itertools
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+from src.ddnnf_binary import BinaryDDNNF, load_binary_ddnnf, save_artifact_binary_ddnnf, write_binary_ddnnf
+from src.kc.ddnnf_shrink import AND_NODE, FALSE_NODE, LITERAL_NODE, TRUE_NODE, Circuit
+
+
+def _random_ddnnf(circuit: Circuit, variables, rng: random.Random, depth: int = 0) -> int:
+    """a random decision d-DNNF: decomposable AND nodes and deterministic OR nodes"""
+    if len(variables) == 0 or depth > 4 or rng.random() < 0.15:
+        if len(variables) > 0 and rng.random() < 0.7:
+            variable = rng.choice(variables)
+            return circuit.literal(variable if rng.random() < 0.5 else -variable)
+        return circuit.true if rng.random() < 0.8 else circuit.false
+    if rng.random() < 0.5 and len(variables) > 1:
+        parts = rng.randint(2, min(4, len(variables)))
+        shuffled = list(variables)
+        rng.shuffle(shuffled)
+        return circuit.conjunction([_random_ddnnf(circuit, shuffled[i::parts], rng, depth + 1) for i in range(parts)])
+    variable = rng.choice(variables)
+    rest = [other for other in variables if other != variable]
+    return circuit.disjunction([
+        circuit.conjunction([circuit.literal(variable), _random_ddnnf(circuit, rest, rng, depth + 1)]),
+        circuit.conjunction([circuit.literal(-variable), _random_ddnnf(circuit, rest, rng, depth + 1)])], variable)
+
+
+def _evaluate(circuit: Circuit, node: int, assignment) -> bool:
+    kind, payload, _decision = circuit.nodes[node]
+    if kind == TRUE_NODE:
+        return True
+    if kind == FALSE_NODE:
+        return False
+    if kind == LITERAL_NODE:
+        return assignment[abs(payload)] == (payload > 0)
+    values = [_evaluate(circuit, child, assignment) for child in payload]
+    return all(values) if kind == AND_NODE else any(values)
+
+
+def _models(circuit: Circuit, root: int, n_vars: int):
+    for bits in itertools.product([False, True], repeat=n_vars):
+        assignment = dict(zip(range(1, n_vars + 1), bits))
+        if _evaluate(circuit, root, assignment):
+            yield assignment
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_counts_match_brute_force(tmp_path, seed):
+    rng = random.Random(seed)
+    n_vars = rng.randint(1, 7)
+    circuit = Circuit()
+    root = _random_ddnnf(circuit, list(range(1, n_vars + 1)), rng)
+    models = list(_models(circuit, root, n_vars))
+    binary_file = str(tmp_path / "ddnnf.bin")
+    write_binary_ddnnf(circuit, root, n_vars, set(), binary_file)
+    ddnnf = BinaryDDNNF(binary_file)
+    assert ddnnf.count_models() == len(models)
+    assert ddnnf.is_consistent() == (len(models) > 0)
+    # conditioning fixes variable 1 and still counts the assignments of all the variables
+    conditioned = sum(1 for model in models if model[1])
+    assert ddnnf.count_models({1: True}) == 2 * conditioned
+    assert ddnnf.is_consistent({1: True}) == (conditioned > 0)
+
+
+@pytest.mark.parametrize("extra_vars", [25, 70])
+def test_counts_do_not_overflow(tmp_path, extra_vars):
+    rng = random.Random(extra_vars)
+    circuit = Circuit()
+    root = _random_ddnnf(circuit, list(range(1, 7)), rng)
+    models = len(list(_models(circuit, root, 6)))
+    binary_file = str(tmp_path / "ddnnf.bin")
+    write_binary_ddnnf(circuit, root, 6 + extra_vars, set(), binary_file)
+    assert BinaryDDNNF(binary_file).count_models() == models << extra_vars
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_weighted_counts_match_brute_force(tmp_path, seed):
+    rng = random.Random(seed)
+    n_vars = rng.randint(1, 6)
+    circuit = Circuit()
+    root = _random_ddnnf(circuit, list(range(1, n_vars + 1)), rng)
+    binary_file = str(tmp_path / "ddnnf.bin")
+    write_binary_ddnnf(circuit, root, n_vars, set(), binary_file)
+    positive = np.array([[1.0, 1.0]] + [[rng.random(), rng.random()] for _ in range(n_vars)])
+    negative = np.array([[1.0, 1.0]] + [[rng.random(), rng.random()] for _ in range(n_vars)])
+    expected = np.zeros(2)
+    for model in _models(circuit, root, n_vars):
+        expected += np.prod(
+            [positive[var] if model[var] else negative[var] for var in range(1, n_vars + 1)], axis=0)
+    assert np.allclose(BinaryDDNNF(binary_file).weighted_model_counts(positive, negative), expected)
+
+
+def test_artifact_round_trip_from_c2d(tmp_path):
+    # (1 and 2) or not 1, with 3 quantified away
+    (tmp_path / "dimacs.cnf.nnf").write_text("nnf 5 4 3\nL 1\nL 2\nA 2 0 1\nL -1\nO 1 2 2 3\n")
+    (tmp_path / "mapping").mkdir()
+    (tmp_path / "mapping" / "mapping.json").write_text(json.dumps({"1": "a", "2": "b", "3": "t"}))
+    (tmp_path / "quantification.exist").write_text("1 3")
+    assert load_binary_ddnnf(str(tmp_path)) is None
+    save_artifact_binary_ddnnf(str(tmp_path), "c2d")
+    ddnnf = load_binary_ddnnf(str(tmp_path))
+    assert ddnnf is not None
+    assert ddnnf.n_vars == 3
+    assert list(ddnnf.quantified_vars) == [3]
+    # 6 models on the 3 variables, halved for the quantified variable
+    assert ddnnf.count_models() == 3
+    assert ddnnf.is_consistent({1: True, 2: False}) is False
+
+
+def test_artifact_round_trip_from_d4(tmp_path):
+    # 1, with 2 quantified away
+    (tmp_path / "compilation_output.nnf").write_text("o 1 0\nt 2 0\n1 2 1 0\n")
+    (tmp_path / "mapping").mkdir()
+    (tmp_path / "mapping" / "mapping.json").write_text(json.dumps({"1": "a", "2": "b"}))
+    (tmp_path / "mapping" / "important_labels.json").write_text(json.dumps([1]))
+    ddnnf = BinaryDDNNF(save_artifact_binary_ddnnf(str(tmp_path), "d4"))
+    assert ddnnf.n_vars == 2
+    assert list(ddnnf.quantified_vars) == [2]
+    assert ddnnf.count_models() == 1
+
+
+def test_rejects_files_that_are_not_binary_ddnnfs(tmp_path):
+    (tmp_path / "ddnnf.bin").write_bytes(b"not a d-DNNF")
+    with pytest.raises(ValueError):
+        BinaryDDNNF(os.path.join(tmp_path, "ddnnf.bin"))
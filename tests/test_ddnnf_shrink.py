@@ -0,0 +1,99 @@
+"""tests for the shrinking pass on saved d-DNNFs"""
+import itertools
+import json
+import os
+
+import pytest
+
+from src.ddnnf_binary import BinaryDDNNF, save_artifact_binary_ddnnf
+from src.kc.ddnnf_shrink import (
+    AND_NODE, FALSE_NODE, LITERAL_NODE, TRUE_NODE, read_c2d_circuit, shrink_ddnnf_file, shrink_saved_ddnnf)
+
+# variables 1 and 2 are atoms, 3, 4 and 5 are quantified, 4 only appears under an AND with a FALSE child
+_C2D = "nnf 9 9 5\nL 1\nL -1\nL 4\nO 0 0\nA 2 2 3\nA 2 4 3\nL 3\nA 2 0 6\nO 1 2 7 4\n"
+# variables 1 and 2 are important, 5 only appears under an AND with a FALSE child
+_D4 = "o 1 0\na 2 0\nt 3 0\nf 4 0\n1 2 1 0\n1 3 -1 0\n2 3 5 0\n2 4 0\n"
+
+
+def _c2d_models(lines, n_vars):
+    circuit, root, _file_vars = read_c2d_circuit(lines)
+
+    def evaluate(node, assignment):
+        kind, payload, _decision = circuit.nodes[node]
+        if kind == TRUE_NODE:
+            return True
+        if kind == FALSE_NODE:
+            return False
+        if kind == LITERAL_NODE:
+            return assignment[abs(payload)] == (payload > 0)
+        values = [evaluate(child, assignment) for child in payload]
+        return all(values) if kind == AND_NODE else any(values)
+
+    return {bits for bits in itertools.product([False, True], repeat=n_vars)
+            if evaluate(root, dict(zip(range(1, n_vars + 1), bits)))}
+
+
+def test_shrinking_keeps_the_models_and_removes_lines(tmp_path):
+    nnf_file = tmp_path / "dimacs.cnf.nnf"
+    nnf_file.write_text(_C2D)
+    before = _c2d_models(_C2D.splitlines(), 5)
+    stats, renumbering = shrink_ddnnf_file(str(nnf_file), "c2d")
+    assert renumbering is None
+    assert _c2d_models(nnf_file.read_text().splitlines(), 5) == before
+    assert stats["lines after"] < stats["lines before"]
+    assert stats["bytes after"] < stats["bytes before"]
+
+
+def test_second_pass_finds_nothing_to_shrink(tmp_path):
+    nnf_file = tmp_path / "dimacs.cnf.nnf"
+    nnf_file.write_text(_C2D)
+    shrink_ddnnf_file(str(nnf_file), "c2d")
+    stats, _renumbering = shrink_ddnnf_file(str(nnf_file), "c2d")
+    assert stats["lines after"] == stats["lines before"]
+
+
+def test_unknown_compiler_is_rejected(tmp_path):
+    nnf_file = tmp_path / "dimacs.cnf.nnf"
+    nnf_file.write_text(_C2D)
+    with pytest.raises(ValueError):
+        shrink_ddnnf_file(str(nnf_file), "sdd")
+
+
+def _save_artifact(folder, compiler: str) -> None:
+    os.makedirs(folder / "mapping")
+    (folder / "mapping" / "mapping.json").write_text(json.dumps({str(i): f"atom{i}" for i in range(1, 6)}))
+    if compiler == "c2d":
+        (folder / "dimacs.cnf.nnf").write_text(_C2D)
+        (folder / "quantification.exist").write_text("3 3 4 5")
+    else:
+        (folder / "compilation_output.nnf").write_text(_D4)
+        (folder / "mapping" / "important_labels.json").write_text(json.dumps([1, 2]))
+
+
+def _count(folder, compiler: str) -> int:
+    return BinaryDDNNF(save_artifact_binary_ddnnf(str(folder), compiler)).count_models()
+
+
+def test_saved_c2d_artifact_drops_unused_quantified_variables(tmp_path):
+    _save_artifact(tmp_path, "c2d")
+    count = _count(tmp_path, "c2d")
+    data_logger = {}
+    shrink_saved_ddnnf(str(tmp_path), "c2d", data_logger)
+    assert _count(tmp_path, "c2d") == count
+    stats = data_logger["dDNNF shrinking"]
+    assert (stats["variables before"], stats["variables after"]) == (5, 3)
+    # the atoms keep their index, the quantified variable 3 that is still used becomes 3
+    mapping = json.loads((tmp_path / "mapping" / "mapping.json").read_text())
+    assert mapping == {"1": "atom1", "2": "atom2", "3": "atom3"}
+    assert (tmp_path / "quantification.exist").read_text().split() == ["1", "3"]
+
+
+def test_saved_d4_artifact_drops_unused_quantified_variables(tmp_path):
+    _save_artifact(tmp_path, "d4")
+    count = _count(tmp_path, "d4")
+    data_logger = {}
+    shrink_saved_ddnnf(str(tmp_path), "d4", data_logger)
+    assert _count(tmp_path, "d4") == count
+    assert data_logger["dDNNF shrinking"]["variables after"] == 2
+    assert json.loads((tmp_path / "mapping" / "mapping.json").read_text()) == {"1": "atom1", "2": "atom2"}
+    assert json.loads((tmp_path / "mapping" / "important_labels.json").read_text()) == [1, 2]
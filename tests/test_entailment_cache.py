@@ -0,0 +1,94 @@
+"""tests for the cache of clausal entailment results"""
+import itertools
+import random
+
+from src.query.entailment_cache import ClauseEntailmentCache
+
+
+def test_entailed_clause_answers_its_supersets():
+    cache = ClauseEntailmentCache()
+    cache.store([("a", True)], True)
+    assert cache.lookup([("a", True), ("b", False)]) is True
+    assert cache.lookup([("a", False)]) is None
+    assert cache.lookup([]) is None
+
+
+def test_not_entailed_clause_answers_its_subsets():
+    cache = ClauseEntailmentCache()
+    cache.store([("a", True), ("b", False)], False)
+    assert cache.lookup([("b", False)]) is False
+    assert cache.lookup([]) is False
+    assert cache.lookup([("a", True), ("b", True)]) is None
+
+
+def test_store_evicts_dominated_entailed_clauses():
+    cache = ClauseEntailmentCache()
+    cache.store([("a", True), ("b", True)], True)
+    cache.store([("a", True), ("c", True)], True)
+    cache.store([("d", True), ("b", True)], True)
+    assert cache.get_stats()["entailed clauses"] == 3
+    # a subset of two stored clauses replaces them
+    cache.store([("a", True)], True)
+    assert cache.get_stats()["entailed clauses"] == 2
+    # a superset of a stored clause is not stored
+    cache.store([("a", True), ("e", True)], True)
+    assert cache.get_stats()["entailed clauses"] == 2
+    # the empty clause dominates every clause
+    cache.store([], True)
+    assert cache.get_stats()["entailed clauses"] == 1
+    assert cache.lookup([("z", False)]) is True
+
+
+def test_store_evicts_dominated_not_entailed_clauses():
+    cache = ClauseEntailmentCache()
+    cache.store([("a", True)], False)
+    cache.store([("b", True)], False)
+    cache.store([], False)
+    assert cache.get_stats()["not entailed clauses"] == 2
+    # a superset of two stored clauses replaces them
+    cache.store([("a", True), ("b", True), ("c", True)], False)
+    assert cache.get_stats()["not entailed clauses"] == 1
+    # a subset of a stored clause is not stored
+    cache.store([("a", True), ("c", True)], False)
+    assert cache.get_stats()["not entailed clauses"] == 1
+
+
+def test_hit_statistics():
+    cache = ClauseEntailmentCache()
+    assert cache.get_stats()["hit rate"] == 0.0
+    cache.store([("a", True)], True)
+    cache.store([("b", True)], False)
+    cache.lookup([("a", True), ("c", True)])
+    cache.lookup([("b", True)])
+    cache.lookup([("c", True)])
+    cache.lookup([("d", True)])
+    stats = cache.get_stats()
+    assert stats["lookups"] == 4
+    assert stats["entailed hits"] == 1
+    assert stats["not entailed hits"] == 1
+    assert stats["hits"] == 2
+    assert stats["hit rate"] == 0.5
+
+
+def test_answers_agree_with_a_monotone_oracle():
+    rng = random.Random(0)
+    literals = [(atom, polarity) for atom in range(6) for polarity in (True, False)]
+    for _ in range(20):
+        # entailment by a set of minimal entailed clauses, which is monotone like clausal entailment
+        minimal = [frozenset(rng.sample(literals, rng.randint(1, 3))) for _ in range(rng.randint(1, 4))]
+
+        def oracle(clause, minimal=minimal):
+            return any(entailed <= clause for entailed in minimal)
+
+        cache = ClauseEntailmentCache()
+        for _ in range(200):
+            clause = frozenset(rng.sample(literals, rng.randint(0, 5)))
+            cached = cache.lookup(clause)
+            assert cached is None or cached == oracle(clause)
+            cache.store(clause, oracle(clause))
+            assert cache.lookup(clause) == oracle(clause)
+        # every clause of size at most 2 is still answered correctly when cached
+        for size in range(3):
+            for clause in itertools.combinations(literals, size):
+                cached = cache.lookup(clause)
+                assert cached is None or cached == oracle(frozenset(clause))
@@ -0,0 +1,85 @@
+"""tests for the index of the backbone and implicant literals"""
+import itertools
+import os
+
+import pytest
+
+from src.query.literal_index import LITERAL_INDEX_FILE, LiteralIndex, artifact_fingerprint
+
+_FORMULAS = {
+    "a and (b or c)": lambda a, b, c: a and (b or c),
+    "a or b": lambda a, b, c: a or b,
+    "not c": lambda a, b, c: not c,
+    "a xor b": lambda a, b, c: a != b,
+    "false": lambda a, b, c: False,
+    "true": lambda a, b, c: True}
+
+
+def _marginals(formula):
+    models = [bits for bits in itertools.product([False, True], repeat=3) if formula(*bits)]
+    marginals = {
+        key: (sum(1 for bits in models if bits[index]), sum(1 for bits in models if not bits[index]))
+        for index, key in enumerate("abc")}
+    return marginals, models
+
+
+@pytest.mark.parametrize("name", sorted(_FORMULAS))
+def test_from_marginals_matches_brute_force(name):
+    marginals, models = _marginals(_FORMULAS[name])
+    index = LiteralIndex.from_marginals(marginals, 3, len(models))
+    assert index.consistent == (len(models) > 0)
+    literals = [(key, polarity) for key in "abc" for polarity in (True, False)]
+    expected_backbone = {
+        (key, polarity) for key, polarity in literals
+        if len(models) > 0 and all(bits["abc".index(key)] == polarity for bits in models)}
+    expected_implicants = {
+        (key, polarity) for key, polarity in literals
+        if all(bits in models for bits in itertools.product([False, True], repeat=3)
+               if bits["abc".index(key)] == polarity)}
+    assert index.backbone == expected_backbone
+    assert index.implicants == expected_implicants
+
+
+def test_from_marginals_without_atoms_uses_the_model_count():
+    assert LiteralIndex.from_marginals({}, 0, 1).consistent
+    assert not LiteralIndex.from_marginals({}, 0, 0).consistent
+    # an inconsistent formula entails every clause
+    assert LiteralIndex.from_marginals({}, 0, 0).entails_clause([("a", True), ("b", True)]) is True
+
+
+def test_from_marginals_rejects_inexact_counts():
+    with pytest.raises(ValueError):
+        LiteralIndex.from_marginals({"a": (2.0, 0)}, 2, 2)
+    with pytest.raises(ValueError):
+        LiteralIndex.from_marginals({"a": (2, 0)}, 2, 2.0)
+
+
+def test_entails_clause_answers_from_the_backbone():
+    marginals, models = _marginals(_FORMULAS["a and (b or c)"])
+    index = LiteralIndex.from_marginals(marginals, 3, len(models))
+    assert index.entails_clause([("a", True), ("b", False)]) is True
+    assert index.entails_clause([("b", True)]) is False
+    assert index.entails_clause([("b", True), ("c", True)]) is None
+
+
+def test_save_and_load_check_the_fingerprint(tmp_path):
+    marginals, models = _marginals(_FORMULAS["a and (b or c)"])
+    index = LiteralIndex.from_marginals(marginals, 3, len(models))
+    (tmp_path / "structure.dat").write_text("first")
+    index_file = os.path.join(tmp_path, LITERAL_INDEX_FILE)
+    index.save(index_file, artifact_fingerprint(str(tmp_path)))
+    loaded = LiteralIndex.load(index_file, artifact_fingerprint(str(tmp_path)))
+    assert loaded is not None
+    assert (loaded.consistent, loaded.backbone, loaded.implicants) == (index.consistent, index.backbone, index.implicants)
+    # changing the artifact invalidates the index
+    (tmp_path / "structure.dat").write_text("second")
+    assert LiteralIndex.load(index_file, artifact_fingerprint(str(tmp_path))) is None
+
+
+def test_fingerprint_ignores_the_index_and_reuses_unchanged_digests(tmp_path):
+    (tmp_path / "structure.dat").write_text("content")
+    fingerprint = artifact_fingerprint(str(tmp_path))
+    (tmp_path / LITERAL_INDEX_FILE).write_text("{}")
+    assert artifact_fingerprint(str(tmp_path)) == fingerprint
+    (tmp_path / "other.dat").write_text("content")
+    assert artifact_fingerprint(str(tmp_path)) != fingerprint
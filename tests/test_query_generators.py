@@ -0,0 +1,26 @@
+"""tests for the generation of the query problems"""
+import os
+
+import pytest
+
+pytest.importorskip("theorydd")
+
+# pylint: disable=wrong-import-position
+from generate_all_query_problems import BASE_PATH, QUERY_TREES, check_formula_queries
+
+
+def _formula_with_saved_clauses() -> str | None:
+    """the first formula of the data tree whose clauses are saved in the ce_data tree"""
+    for pathx, _subdirs, files in sorted(os.walk(BASE_PATH)):
+        for name in sorted(files):
+            filename = os.path.join(pathx, name)
+            if os.path.isdir(filename.replace(".smt2", "").replace("data", QUERY_TREES["clause"])):
+                return filename
+    return None
+
+
+def test_regenerated_clauses_match_the_saved_ones():
+    filename = _formula_with_saved_clauses()
+    if filename is None:
+        pytest.skip("no ce_data tree to compare with")
+    assert check_formula_queries(filename, ["clause"]) == []
@@ -0,0 +1,21 @@
+"""tests for the derivation of the seeds of single items"""
+from src.seeds import derive_seed
+
+
+def test_derived_seeds_are_stable_across_runs():
+    # the seeds of saved problems and query streams depend on these values
+    assert derive_seed(0, 0) == 12426054289685354689
+    assert derive_seed(42, 7) == 8457105028182875694
+
+
+def test_derived_seeds_depend_on_seed_and_index():
+    seeds = {derive_seed(seed, index) for seed in range(10) for index in range(100)}
+    assert len(seeds) == 1000
+    assert all(0 <= seed < 2 ** 64 for seed in seeds)
+
+
+def test_derived_seed_does_not_depend_on_other_items():
+    before = derive_seed(3, 5)
+    for index in range(5):
+        derive_seed(3, index)
+    assert derive_seed(3, 5) == before
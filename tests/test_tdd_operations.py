@@ -0,0 +1,83 @@
+"""tests for the operations between two saved T-BDDs or two saved T-SDDs"""
+import pytest
+
+pytest.importorskip("theorydd")
+
+# pylint: disable=wrong-import-position
+from pysmt.shortcuts import And, GT, LT, Real, Symbol
+from pysmt.typing import REAL
+
+from src.kc.api import compile_tbdd, compile_tsdd, compute_lemmas
+from src.query.main import load_query_manager
+from src.theory_lemmas import load_artifact_lemmas, save_artifact_lemmas
+
+_X = Symbol("x", REAL)
+
+
+@pytest.fixture(params=["T-BDD", "T-SDD"])
+def save(request, tmp_path):
+    """saves the compiled formula in a folder, with its lemmas, as the knowledge compiler does"""
+    if request.param == "T-BDD":
+        pytest.importorskip("dd")
+        compile_function = compile_tbdd
+    else:
+        pytest.importorskip("pysdd")
+        compile_function = compile_tsdd
+
+    def save_formula(phi, name: str) -> str:
+        tlemmas = compute_lemmas(phi)
+        folder = str(tmp_path / name)
+        compile_function(phi, tlemmas=tlemmas).structure.save_to_folder(folder)
+        save_artifact_lemmas(folder, tlemmas)
+        return folder
+
+    return save_formula
+
+
+def test_conjunction_adds_the_lemmas_across_artifacts(save, tmp_path):
+    below = save(LT(_X, Real(1)), "below")
+    above = save(GT(_X, Real(2)), "above")
+    output = str(tmp_path / "conjunction")
+    load_query_manager(below).conjunction(above, output)
+    assert load_query_manager(output).check_consistency() is False
+
+
+def test_conjunction_of_compatible_formulas_is_consistent(save, tmp_path):
+    below_one = save(LT(_X, Real(1)), "below_one")
+    below_two = save(LT(_X, Real(2)), "below_two")
+    output = str(tmp_path / "conjunction")
+    load_query_manager(below_one).conjunction(below_two, output)
+    assert load_query_manager(output).check_consistency() is True
+
+
+def test_disjunction(save, tmp_path):
+    below = save(LT(_X, Real(1)), "below")
+    above = save(GT(_X, Real(2)), "above")
+    output = str(tmp_path / "disjunction")
+    load_query_manager(below).disjunction(above, output)
+    assert load_query_manager(output).check_consistency() is True
+    assert load_query_manager(output).check_entail(below) is False
+    assert load_query_manager(below).check_entail(output) is True
+
+
+def test_entailment_uses_the_theory(save):
+    below_one = save(LT(_X, Real(1)), "below_one")
+    below_two = save(LT(_X, Real(2)), "below_two")
+    assert load_query_manager(below_one).check_entail(below_two) is True
+    assert load_query_manager(below_two).check_entail(below_one) is False
+
+
+def test_negation_keeps_the_saved_lemmas(save, tmp_path):
+    phi = And(LT(_X, Real(1)), LT(_X, Real(2)))
+    folder = save(phi, "phi")
+    output = str(tmp_path / "negation")
+    manager = load_query_manager(folder)
+    manager.negation(output)
+    # the negation reuses the lemma x < 1 -> x < 2 saved with the artifact and saves it with the result
+    assert manager.get_details()["negation lemmas"] > 0
+    assert load_artifact_lemmas(output) is not None
+    negation = load_query_manager(output)
+    assert negation.check_consistency() is True
+    conjunction = str(tmp_path / "conjunction")
+    negation.conjunction(folder, conjunction)
+    assert load_query_manager(conjunction).check_consistency() is False
@@ -0,0 +1,75 @@
+"""tests for the cache of the d4 translations of c2d d-DNNFs"""
+import os
+import shutil
+import time
+
+from src.query.tddnnf.translation_cache import cached_translation, file_digest
+
+
+def _translations(cache_folder) -> int:
+    return sum(1 for name in os.listdir(cache_folder) if name.endswith("_out.nnf"))
+
+
+def test_translation_is_reused(tmp_path):
+    source = tmp_path / "source.nnf"
+    source.write_text("nnf 0 0 0\n")
+    cache = str(tmp_path / "cache")
+    calls = []
+
+    def translate(source_file, output_file):
+        calls.append(source_file)
+        shutil.copy(source_file, output_file)
+
+    path, hit = cached_translation(str(source), cache, "out.nnf", translate, 4)
+    assert not hit
+    assert open(path, encoding='utf8').read() == "nnf 0 0 0\n"
+    same_path, hit = cached_translation(str(source), cache, "out.nnf", translate, 4)
+    assert hit and same_path == path
+    assert len(calls) == 1
+
+
+def test_changed_source_is_translated_again(tmp_path):
+    source = tmp_path / "source.nnf"
+    source.write_text("first")
+    cache = str(tmp_path / "cache")
+    first, _ = cached_translation(str(source), cache, "out.nnf", shutil.copy, 4)
+    source.write_text("second")
+    second, hit = cached_translation(str(source), cache, "out.nnf", shutil.copy, 4)
+    assert not hit and first != second
+    assert open(second, encoding='utf8').read() == "second"
+
+
+def test_incomplete_translation_is_not_reused(tmp_path):
+    source = tmp_path / "source.nnf"
+    source.write_text("content")
+    cache = str(tmp_path / "cache")
+    path, _ = cached_translation(str(source), cache, "out.nnf", shutil.copy, 4)
+    with open(path, "a", encoding='utf8') as out:
+        out.write("garbage")
+    _, hit = cached_translation(str(source), cache, "out.nnf", shutil.copy, 4)
+    assert not hit
+
+
+def test_least_recently_used_translations_are_evicted(tmp_path):
+    source = tmp_path / "source.nnf"
+    cache = str(tmp_path / "cache")
+    paths = []
+    for version in range(4):
+        source.write_text(f"version {version}")
+        paths.append(cached_translation(str(source), cache, "out.nnf", shutil.copy, 2)[0])
+        # modification times must differ for the eviction order
+        time.sleep(0.01)
+    assert _translations(cache) == 2
+    assert not os.path.exists(paths[0]) and not os.path.exists(f"{paths[0]}.json")
+    assert os.path.exists(paths[2]) and os.path.exists(paths[3])
+
+
+def test_file_digest_is_memoized_on_the_file_state(tmp_path):
+    source = tmp_path / "source.nnf"
+    source.write_text("content")
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    digest = file_digest(str(source), str(cache))
+    assert file_digest(str(source), str(cache)) == digest
+    source.write_text("changed")
+    assert file_digest(str(source), str(cache)) != digest
@@ -0,0 +1,71 @@
+"""tests for the generation of query workloads"""
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pysmt")
+
+# pylint: disable=wrong-import-position
+from pysmt.shortcuts import LT, Real, Symbol
+from pysmt.typing import REAL
+
+from src.query.workload import WORKLOAD_QUERY_KINDS, WorkloadSpec, generate_workload
+
+
+def _manager(n_atoms: int, reverse: bool = False) -> SimpleNamespace:
+    """a stand-in for a query manager, the generator only reads the refinement mapping"""
+    x = Symbol("x", REAL)
+    atoms = [LT(x, Real(i)) for i in range(n_atoms)]
+    keys = range(n_atoms) if not reverse else reversed(range(n_atoms))
+    return SimpleNamespace(refinement_mapping={f"v{key}": atoms[key] for key in keys})
+
+
+def test_same_spec_gives_the_same_workload():
+    spec = WorkloadSpec(queries=50, seed=3)
+    assert generate_workload(spec, _manager(10)) == generate_workload(spec, _manager(10))
+    assert generate_workload(spec, _manager(10)) != generate_workload(WorkloadSpec(queries=50, seed=4), _manager(10))
+
+
+def test_workload_does_not_depend_on_the_order_of_the_mapping():
+    spec = WorkloadSpec(queries=50, seed=3)
+    assert generate_workload(spec, _manager(10)) == generate_workload(spec, _manager(10, reverse=True))
+
+
+def test_workload_follows_the_mix_and_sizes():
+    spec = WorkloadSpec(
+        queries=200, seed=1, mix={"entail_clause": 1.0, "implicant": 1.0}, size_distribution={2: 1.0})
+    workload = generate_workload(spec, _manager(10))
+    assert len(workload) == 200
+    assert {query.kind for query in workload} == {"entail_clause", "implicant"}
+    for query in workload:
+        assert len(query.items) == (2 if query.kind == "entail_clause" else 1)
+        assert len({atom for atom, _polarity in query.items}) == len(query.items)
+
+
+def test_clauses_are_capped_at_the_number_of_atoms():
+    spec = WorkloadSpec(queries=20, mix={"condition": 1.0}, size_distribution={5: 1.0})
+    assert all(len(query.items) == 2 for query in generate_workload(spec, _manager(2)))
+
+
+def test_zipf_exponent_skews_atom_popularity():
+    spec = WorkloadSpec(queries=500, seed=2, mix={"implicant": 1.0}, zipf_exponent=2.0)
+    counts = Counter(query.items[0][0] for query in generate_workload(spec, _manager(20)))
+    assert counts.most_common(1)[0][1] > 500 / 4
+
+
+@pytest.mark.parametrize("fields", [
+    {"mix": {"unknown": 1.0}},
+    {"mix": {"consistency": 0.0}},
+    {"size_distribution": {0: 1.0}},
+    {"queries": 0},
+    {"zipf_exponent": -1.0}])
+def test_invalid_specs_are_rejected(fields):
+    with pytest.raises(ValueError):
+        WorkloadSpec(**fields)
+
+
+def test_workload_needs_atoms():
+    with pytest.raises(ValueError):
+        generate_workload(WorkloadSpec(), _manager(0))
+    assert set(WorkloadSpec().mix.keys()) == set(WORKLOAD_QUERY_KINDS)